@@ -0,0 +1,84 @@
+"""
+Save/load benchmark of the binary graph snapshot against GraphML on a synthetic knowledge graph.
+
+Nodes and edges carry attributes shaped like the ones GraphGen stores: entity type, a long description,
+source chunk ids joined with <SEP>, token length and loss.
+
+Usage:
+    python -m benchmarks.bench_graph_snapshot --num-nodes 50000 --num-edges 200000
+"""
+
+import os
+import time
+import random
+import argparse
+import tempfile
+
+import networkx as nx
+
+from graphgen.models import NetworkXStorage
+from benchmarks.bench_pipeline import WORDS
+
+
+def synthetic_graph(num_nodes: int, num_edges: int, description_words: int, seed: int) -> nx.Graph:
+    rng = random.Random(seed)
+    chunk_ids = [f"chunk-{rng.getrandbits(128):032x}" for _ in range(max(1, num_nodes // 10))]
+    entity_types = ["concept", "organization", "person", "location", "event", "technology"]
+
+    def description() -> str:
+        return " ".join(rng.choice(WORDS) for _ in range(description_words))
+
+    def source_id() -> str:
+        return "<SEP>".join(rng.sample(chunk_ids, min(len(chunk_ids), rng.randint(1, 3))))
+
+    graph = nx.Graph()
+    for i in range(num_nodes):
+        graph.add_node(f"ENTITY {i}", entity_type=rng.choice(entity_types), description=description(),
+                       source_id=source_id(), length=description_words, loss=rng.random())
+    edges = set()
+    while len(edges) < num_edges:
+        src, tgt = sorted((rng.randrange(num_nodes), rng.randrange(num_nodes)))
+        if src != tgt and (src, tgt) not in edges:
+            edges.add((src, tgt))
+            graph.add_edge(f"ENTITY {src}", f"ENTITY {tgt}", description=description(),
+                           source_id=source_id(), length=description_words, loss=rng.random())
+    return graph
+
+
+def timed(func, *func_args) -> tuple:
+    start = time.perf_counter()
+    result = func(*func_args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-nodes", default=50000, type=int)
+    parser.add_argument("--num-edges", default=100000, type=int)
+    parser.add_argument("--description-words", default=40, type=int)
+    parser.add_argument("--seed", default=0, type=int)
+    parser.add_argument("--skip-graphml", action="store_true", help="only measure the snapshot format")
+    args = parser.parse_args()
+
+    graph = synthetic_graph(args.num_nodes, args.num_edges, args.description_words, args.seed)
+    print(f"graph with {graph.number_of_nodes()} nodes, {graph.number_of_edges()} edges")
+
+    formats = [("snapshot", NetworkXStorage.write_snapshot, NetworkXStorage.load_snapshot)]
+    if not args.skip_graphml:
+        formats.append(("graphml", NetworkXStorage.write_nx_graph, NetworkXStorage.load_nx_graph))
+
+    header = f"{'format':<10}{'save(s)':>10}{'load(s)':>10}{'size(MB)':>10}"
+    print(header)
+    print("-" * len(header))
+    with tempfile.TemporaryDirectory() as working_dir:
+        for name, write, load in formats:
+            file_name = os.path.join(working_dir, f"graph.{name}")
+            _, save_time = timed(write, graph, file_name)
+            loaded, load_time = timed(load, file_name)
+            assert loaded.number_of_edges() == graph.number_of_edges()
+            size = os.path.getsize(file_name) / (1024 * 1024)
+            print(f"{name:<10}{save_time:>10.2f}{load_time:>10.2f}{size:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
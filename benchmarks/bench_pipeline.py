@@ -0,0 +1,218 @@
+"""
+End-to-end throughput benchmark of the GraphGen pipeline against the mock LLM server.
+
+Runs insert, quiz, judge and traverse over resources/examples or a synthetic corpus and reports wall time,
+requests/sec and CPU time per stage, and the peak RSS of the process so far. The mock server runs in a child
+process, so CPU time and RSS are the pipeline's alone. With --baseline, exits with a non-zero status when a stage
+is slower than the baseline by more than --tolerance, so orchestration regressions are caught.
+
+Usage:
+    python -m benchmarks.bench_pipeline --corpus synthetic --num-docs 200 --latency-mean 0.05
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import resource
+import argparse
+import tempfile
+
+from graphgen.graphgen import GraphGen
+from graphgen.models import (OpenAIModel, CompletionsJudgeModel, Tokenizer, TraverseStrategy, GleanStrategy,
+                             ResolutionStrategy, DedupStrategy)
+from benchmarks.mock_llm_server import MockLLMServerProcess
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORDS = ["protein", "gene", "rice", "yield", "variety", "disease", "resistance", "grain", "field", "trial",
+         "expression", "pathway", "signal", "cell", "growth", "stress", "drought", "soil", "nitrogen", "root"]
+
+
+def load_examples() -> list:
+    with open(os.path.join(root_dir, "resources", "examples", "raw_demo.jsonl"), encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def synthetic_corpus(num_docs: int, doc_words: int, vocab_size: int, seed: int,
+                     near_duplicates: float = 0.0) -> list:
+    """
+    Generate documents mixing lowercase filler words with capitalized names drawn from a shared vocabulary,
+    so entities recur across documents and merging is exercised.
+    A near_duplicates fraction of the documents are copies of earlier ones with 2% of the words changed.
+    """
+    rng = random.Random(seed)
+    names = [f"Entity{i}" for i in range(vocab_size)]
+    docs = []
+    for _ in range(num_docs):
+        if docs and rng.random() < near_duplicates:
+            words = rng.choice(docs)["content"][:-1].split()
+            for i in rng.sample(range(len(words)), max(1, len(words) // 50)):
+                words[i] = rng.choice(WORDS)
+        else:
+            words = [rng.choice(names) if rng.random() < 0.15 else rng.choice(WORDS) for _ in range(doc_words)]
+        docs.append({"content": " ".join(words) + "."})
+    return docs
+
+
+def peak_rss_mb() -> float:
+    # peak over the lifetime of the process, not of a stage. ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def measure(stage: str, server: MockLLMServerProcess, func, *func_args, **func_kwargs) -> dict:
+    requests_before = server.request_count
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    func(*func_args, **func_kwargs)
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    requests = server.request_count - requests_before
+    return {
+        "stage": stage,
+        "wall_time": wall,
+        "cpu_time": cpu,
+        "requests": requests,
+        "requests_per_sec": requests / wall if wall > 0 else 0.0,
+        "process_peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def build_trainee(args, base_url: str, tokenizer_instance: Tokenizer):
+    if args.judge_backend == "completions":
+        return CompletionsJudgeModel(model_name="mock-trainee", api_key="mock", base_url=base_url,
+                                     max_batch_size=args.judge_batch_size)
+    return OpenAIModel(model_name="mock-trainee", api_key="mock", base_url=base_url, tokenizer=tokenizer_instance)
+
+
+def run_benchmark(args) -> list:
+    if args.corpus == "examples":
+        data = load_examples()
+    else:
+        data = synthetic_corpus(args.num_docs, args.doc_words, args.vocab_size, args.seed, args.near_duplicates)
+
+    server = MockLLMServerProcess(
+        latency=(args.latency, args.latency_mean, args.latency_per_token, args.seed),
+        glean_rounds=args.glean_rounds,
+    ).start()
+    try:
+        with tempfile.TemporaryDirectory() as working_dir:
+            tokenizer_instance = Tokenizer(model_name=args.tokenizer)
+            graph_gen = GraphGen(
+                working_dir=working_dir,
+                synthesizer_llm_client=OpenAIModel(model_name="mock-synthesizer", api_key="mock",
+                                                   base_url=server.url, tokenizer=tokenizer_instance),
+                trainee_llm_client=build_trainee(args, server.url, tokenizer_instance),
+                tokenizer_instance=tokenizer_instance,
+                traverse_strategy=TraverseStrategy(qa_form=args.qa_form),
+                graph_backend=args.graph_backend,
+                incremental_merge=args.incremental_merge,
+                extraction_batch_tokens=args.extraction_batch_tokens,
+                glean_strategy=GleanStrategy(max_rounds=args.max_glean_rounds, ask_if_loop=not args.skip_if_loop,
+                                             min_new_records=args.min_new_records),
+                dedup_strategy=DedupStrategy(enabled=args.dedup_threshold > 0, threshold=args.dedup_threshold),
+                resolution_strategy=ResolutionStrategy(enabled=args.resolution_threshold > 0,
+                                                       similarity_threshold=args.resolution_threshold),
+            )
+            if args.incremental_docs > 0:
+                # the measured stages only handle the last docs, on top of a graph that is already judged
+                graph_gen.insert(data[:-args.incremental_docs], "raw")
+                graph_gen.quiz(max_samples=args.quiz_samples)
+                graph_gen.judge()
+                data = data[-args.incremental_docs:]
+            if args.mode == "pipeline":
+                return [
+                    measure("pipeline", server, graph_gen.run_pipeline, data, "raw", max_samples=args.quiz_samples),
+                ]
+            return [
+                measure("insert", server, graph_gen.insert, data, "raw"),
+                measure("quiz", server, graph_gen.quiz, max_samples=args.quiz_samples),
+                measure("judge", server, graph_gen.judge),
+                measure("traverse", server, graph_gen.traverse),
+            ]
+    finally:
+        server.stop()
+
+
+def report(results: list):
+    header = f"{'stage':<10}{'wall(s)':>10}{'cpu(s)':>10}{'requests':>10}{'req/s':>10}{'peak rss(MB)':>14}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['stage']:<10}{r['wall_time']:>10.2f}{r['cpu_time']:>10.2f}{r['requests']:>10d}"
+              f"{r['requests_per_sec']:>10.1f}{r['process_peak_rss_mb']:>14.1f}")
+
+
+def compare(results: list, baseline: list, tolerance: float) -> list:
+    baseline = {r["stage"]: r for r in baseline}
+    regressions = []
+    for r in results:
+        base = baseline.get(r["stage"])
+        if base is None:
+            continue
+        for metric in ("wall_time", "cpu_time"):
+            if base[metric] > 0 and r[metric] > base[metric] * (1 + tolerance):
+                regressions.append(f"{r['stage']} {metric}: {base[metric]:.2f}s -> {r[metric]:.2f}s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", default="barrier", choices=["barrier", "pipeline"],
+                        help="run the stages one after another or overlapped")
+    parser.add_argument("--corpus", default="examples", choices=["examples", "synthetic"])
+    parser.add_argument("--num-docs", default=100, type=int)
+    parser.add_argument("--doc-words", default=300, type=int)
+    parser.add_argument("--vocab-size", default=500, type=int, help="number of distinct entity names")
+    parser.add_argument("--tokenizer", default="cl100k_base", type=str)
+    parser.add_argument("--qa-form", default="atomic", choices=["atomic", "multi_hop", "open"])
+    parser.add_argument("--graph-backend", default="networkx", choices=["networkx", "sqlite"])
+    parser.add_argument("--incremental-merge", action="store_true", help="merge each chunk as it is extracted")
+    parser.add_argument("--extraction-batch-tokens", default=0, type=int,
+                        help="pack short chunks into one extraction request up to this many prompt tokens")
+    parser.add_argument("--incremental-docs", default=0, type=int,
+                        help="build and judge the graph of all but the last N docs first, then measure the last N")
+    parser.add_argument("--quiz-samples", default=2, type=int)
+    parser.add_argument("--latency", default="constant", choices=["constant", "uniform", "lognormal"])
+    parser.add_argument("--latency-mean", default=0.0, type=float)
+    parser.add_argument("--latency-per-token", default=0.0, type=float)
+    parser.add_argument("--glean-rounds", default=0, type=int, help="gleaning rounds the mock server answers 'yes'")
+    parser.add_argument("--max-glean-rounds", default=3, type=int)
+    parser.add_argument("--skip-if-loop", action="store_true",
+                        help="decide whether to glean from the yield of the previous round")
+    parser.add_argument("--min-new-records", default=0, type=int)
+    parser.add_argument("--near-duplicates", default=0.0, type=float,
+                        help="fraction of synthetic documents that are near-duplicates of earlier ones")
+    parser.add_argument("--dedup-threshold", default=0.0, type=float,
+                        help="drop near-duplicate docs and chunks at this Jaccard similarity, 0 disables")
+    parser.add_argument("--resolution-threshold", default=0.0, type=float,
+                        help="resolve entities with the local hashing embedding at this similarity, 0 disables")
+    parser.add_argument("--judge-backend", default="chat", choices=["chat", "completions"],
+                        help="judge with one chat request per statement or batched completions requests")
+    parser.add_argument("--judge-batch-size", default=256, type=int, help="statements per completions request")
+    parser.add_argument("--seed", default=0, type=int)
+    parser.add_argument("--output", default=None, type=str, help="write results as json")
+    parser.add_argument("--baseline", default=None, type=str, help="json results of a previous run")
+    parser.add_argument("--tolerance", default=0.2, type=float, help="allowed relative slowdown")
+    args = parser.parse_args()
+
+    bench_results = run_benchmark(args)
+    report(bench_results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(bench_results, f, indent=4)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            found = compare(bench_results, json.load(f), args.tolerance)
+        for regression in found:
+            print(f"REGRESSION {regression}")
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Micro-benchmark of parsing KG extraction answers: RecordParser against the previous per-record path
+(a marker regex built on every split, re.search per record and both async handlers tried in turn).
+
+By default the answers are the example outputs of the extraction prompts, repeated and shuffled into
+answers of --records-per-answer records. Captured answers can be given with --answers, one JSON string per line.
+
+Usage:
+    python -m benchmarks.bench_record_parser --num-answers 2000 --records-per-answer 60
+"""
+
+import re
+import html
+import json
+import time
+import random
+import asyncio
+import argparse
+
+from graphgen.operators.extract_kg import RECORD_PARSER
+from graphgen.templates import KG_EXTRACTION_PROMPT
+
+FORMAT = KG_EXTRACTION_PROMPT["FORMAT"]
+
+
+def example_records() -> list:
+    records = []
+    for language in ("English", "Chinese"):
+        template = KG_EXTRACTION_PROMPT[language]["TEMPLATE"].format(**FORMAT, input_text="")
+        for line in template.splitlines():
+            if line.startswith('("entity"') or line.startswith('("relationship"'):
+                records.append(line.split(")")[0] + ")")
+    return records
+
+
+def synthetic_answers(num_answers: int, records_per_answer: int, seed: int) -> list:
+    rng = random.Random(seed)
+    records = example_records()
+    return [
+        FORMAT["record_delimiter"].join(rng.choice(records) for _ in range(records_per_answer))
+        + FORMAT["completion_delimiter"]
+        for _ in range(num_answers)
+    ]
+
+
+def _split(content: str, markers: list) -> list:
+    results = re.split("|".join(re.escape(marker) for marker in markers), content)
+    return [r.strip() for r in results if r.strip()]
+
+
+def clean_str(value: str) -> str:
+    return re.sub(r"[\x00-\x1f\x7f-\x9f]", "", html.unescape(value.strip()))
+
+
+async def _entity(record_attributes: list, chunk_key: str):
+    if len(record_attributes) < 4 or record_attributes[0] != '"entity"':
+        return None
+    entity_name = clean_str(record_attributes[1].upper())
+    if not entity_name.strip():
+        return None
+    return {"entity_name": entity_name, "entity_type": clean_str(record_attributes[2].upper()),
+            "description": clean_str(record_attributes[3]), "source_id": chunk_key}
+
+
+async def _relationship(record_attributes: list, chunk_key: str):
+    if len(record_attributes) < 4 or record_attributes[0] != '"relationship"':
+        return None
+    return {"src_id": clean_str(record_attributes[1].upper()), "tgt_id": clean_str(record_attributes[2].upper()),
+            "description": clean_str(record_attributes[3]), "source_id": chunk_key}
+
+
+async def previous_parse(text: str, chunk_key: str) -> tuple:
+    entities, relationships = [], []
+    for record in _split(text, [FORMAT["record_delimiter"], FORMAT["completion_delimiter"]]):
+        record = re.search(r"\((.*)\)", record)
+        if record is None:
+            continue
+        record_attributes = _split(record.group(1), [FORMAT["tuple_delimiter"]])
+        entity = await _entity(record_attributes, chunk_key)
+        if entity is not None:
+            entities.append(entity)
+            continue
+        relation = await _relationship(record_attributes, chunk_key)
+        if relation is not None:
+            relationships.append(relation)
+    return entities, relationships
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--answers", default=None, help="captured answers, one JSON string per line")
+    parser.add_argument("--num-answers", default=2000, type=int)
+    parser.add_argument("--records-per-answer", default=60, type=int)
+    parser.add_argument("--seed", default=0, type=int)
+    args = parser.parse_args()
+
+    if args.answers:
+        with open(args.answers, encoding="utf-8") as f:
+            answers = [json.loads(line) for line in f if line.strip()]
+    else:
+        answers = synthetic_answers(args.num_answers, args.records_per_answer, args.seed)
+    print(f"{len(answers)} answers, {sum(len(a) for a in answers) / 1024 / 1024:.1f} MB")
+
+    async def _previous():
+        return [await previous_parse(answer, "chunk") for answer in answers]
+
+    start = time.perf_counter()
+    expected = asyncio.run(_previous())
+    previous_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parsed = [RECORD_PARSER.parse(answer, "chunk") for answer in answers]
+    parser_time = time.perf_counter() - start
+
+    assert parsed == expected, "RecordParser disagrees with the previous parsing"
+    records = sum(len(e) + len(r) for e, r in parsed)
+    header = f"{'parser':<12}{'time(s)':>10}{'records/s':>14}"
+    print(header)
+    print("-" * len(header))
+    for name, elapsed in (("previous", previous_time), ("RecordParser", parser_time)):
+        print(f"{name:<12}{elapsed:>10.3f}{records / elapsed:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,430 @@
+"""
+A deterministic local stand-in for the OpenAI chat completions API.
+
+Responses are derived from a hash of the prompt, so the same corpus always produces the same graph,
+and are shaped like what GraphGen's operators expect: tuple-delimited KG records for extraction
+prompts, yes/no with logprobs for judgement prompts and "Question: ... Answer: ..." otherwise.
+
+Usage:
+    python -m benchmarks.mock_llm_server --port 8000 --latency lognormal --latency-mean 0.5
+"""
+
+import re
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+import multiprocessing
+import urllib.request
+from dataclasses import dataclass, field
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from graphgen.templates import KG_EXTRACTION_PROMPT
+
+TUPLE_DELIMITER = KG_EXTRACTION_PROMPT["FORMAT"]["tuple_delimiter"]
+RECORD_DELIMITER = KG_EXTRACTION_PROMPT["FORMAT"]["record_delimiter"]
+COMPLETION_DELIMITER = KG_EXTRACTION_PROMPT["FORMAT"]["completion_delimiter"]
+
+EN_ENTITY_PATTERN = re.compile(r"\b[A-Z][A-Za-z0-9\-]{2,}\b")
+ZH_ENTITY_PATTERN = re.compile("[\u4e00-\u9fff]{2,4}")
+# passages of a batched extraction prompt start with [C1], [C2]...
+PASSAGE_TAG_PATTERN = re.compile(r"\[(C\d+)\] ")
+
+
+def _stable_hash(text: str) -> int:
+    return int(hashlib.md5(text.encode()).hexdigest()[:8], 16)
+
+
+def _count_tokens(text: str) -> int:
+    # rough estimation, the mock server must not depend on a tokenizer download
+    return max(1, len(text) // 4)
+
+
+@dataclass
+class LatencyModel:
+    """
+    Latency of a response: a base latency drawn from the distribution plus a per-token cost.
+    """
+    distribution: str = "constant" # "constant", "uniform" or "lognormal"
+    mean: float = 0.0
+    per_token: float = 0.0
+    seed: int = 0
+
+    def __post_init__(self):
+        self._random = random.Random(self.seed)
+        self._lock = threading.Lock()
+
+    def sample(self, completion_tokens: int) -> float:
+        with self._lock:
+            if self.distribution == "uniform":
+                base = self._random.uniform(0, 2 * self.mean)
+            elif self.distribution == "lognormal":
+                sigma = 0.5
+                base = self._random.lognormvariate(math.log(self.mean or 1e-6) - sigma ** 2 / 2, sigma) \
+                    if self.mean > 0 else 0.0
+            else:
+                base = self.mean
+        return base + self.per_token * completion_tokens
+
+
+@dataclass
+class MockResponder:
+    """
+    Build canned responses for the prompts GraphGen sends.
+    """
+    entities_per_chunk: int = 8
+    glean_rounds: int = 0
+    top_logprobs: int = 5
+
+    def respond(self, messages: list) -> str:
+        prompt = messages[-1]["content"]
+
+        if prompt.strip() in (KG_EXTRACTION_PROMPT["English"]["IF_LOOP"].strip(),
+                              KG_EXTRACTION_PROMPT["Chinese"]["IF_LOOP"].strip()):
+            done_rounds = sum(1 for m in messages if m["content"] in (KG_EXTRACTION_PROMPT["English"]["CONTINUE"],
+                                                                      KG_EXTRACTION_PROMPT["Chinese"]["CONTINUE"]))
+            return "yes" if done_rounds < self.glean_rounds else "no"
+        if prompt in (KG_EXTRACTION_PROMPT["English"]["CONTINUE"], KG_EXTRACTION_PROMPT["Chinese"]["CONTINUE"]):
+            return self._glean(messages)
+        if TUPLE_DELIMITER in prompt and ("-Real Data-" in prompt or "-真实数据-" in prompt):
+            return self._extract(prompt)
+        if "Description List:" in prompt or "描述列表：" in prompt:
+            return self._summarize(prompt)
+        if "Transform the input sentence" in prompt or "将输入句子转换" in prompt:
+            return self._rephrase(prompt)
+        return self._qa(prompt)
+
+    @staticmethod
+    def _input_text(prompt: str) -> str:
+        for marker in ("Text: ", "文本："):
+            if marker in prompt:
+                text = prompt.rsplit(marker, 1)[1]
+                return text.split("################")[0].strip()
+        return prompt
+
+    def _entities(self, text: str) -> list:
+        candidates = EN_ENTITY_PATTERN.findall(text) + ZH_ENTITY_PATTERN.findall(text)
+        entities = []
+        for candidate in candidates:
+            if candidate not in entities:
+                entities.append(candidate)
+        entities.sort(key=_stable_hash)
+        return entities[:self.entities_per_chunk]
+
+    @staticmethod
+    def _records(entities: list, text: str, tag: str = None) -> list:
+        tag_field = f"{TUPLE_DELIMITER}{tag}" if tag else ""
+        records = []
+        for entity in entities:
+            records.append(
+                f'("entity"{TUPLE_DELIMITER}"{entity}"{TUPLE_DELIMITER}"concept"{TUPLE_DELIMITER}'
+                f'"{entity} is mentioned in: {text[:80]}"{tag_field})'
+            )
+        for src, tgt in zip(entities, entities[1:]):
+            records.append(
+                f'("relationship"{TUPLE_DELIMITER}"{src}"{TUPLE_DELIMITER}"{tgt}"{TUPLE_DELIMITER}'
+                f'"{src} and {tgt} appear in the same passage."{tag_field})'
+            )
+        return records
+
+    @staticmethod
+    def _passages(text: str) -> list:
+        """
+        (tag, text) of each passage of a batched extraction prompt, or [(None, text)]
+        """
+        parts = PASSAGE_TAG_PATTERN.split(text)
+        if len(parts) == 1:
+            return [(None, text)]
+        return [(tag, passage.strip()) for tag, passage in zip(parts[1::2], parts[2::2])]
+
+    def _extract(self, prompt: str) -> str:
+        records = []
+        for tag, text in self._passages(self._input_text(prompt)):
+            records += self._records(self._entities(text), text, tag)
+        return RECORD_DELIMITER.join(records) + COMPLETION_DELIMITER
+
+    def _glean(self, messages: list) -> str:
+        records = []
+        for tag, text in self._passages(self._input_text(messages[0]["content"])):
+            entities = self._entities(text)
+            extra = entities[self.entities_per_chunk // 2:] if entities else []
+            records += self._records(extra[:2], text, tag)
+        return RECORD_DELIMITER.join(records) + COMPLETION_DELIMITER
+
+    @staticmethod
+    def _summarize(prompt: str) -> str:
+        for marker in ("Description List:", "描述列表："):
+            if marker in prompt:
+                descriptions = prompt.rsplit(marker, 1)[1].split("#######")[0]
+                return descriptions.strip()[:400]
+        return prompt[:400]
+
+    @staticmethod
+    def _rephrase(prompt: str) -> str:
+        sentence = prompt.rsplit("################", 2)[-2].split("\n", 2)[-1].strip()
+        if "opposite meaning" in prompt or "相反含义" in prompt:
+            return f"It is not true that {sentence}"
+        return sentence
+
+    @staticmethod
+    def _qa(prompt: str) -> str:
+        key = _stable_hash(prompt)
+        snippet = " ".join(prompt.split()[-30:])
+        return f"Question: What does passage {key} describe?\nAnswer: {snippet}"
+
+    def judge_logprobs(self, prompt: str) -> dict:
+        p_yes = 0.05 + 0.9 * (_stable_hash(prompt) % 1000) / 1000
+        answer, p_answer = ("yes", p_yes) if p_yes >= 0.5 else ("no", 1 - p_yes)
+        candidates = sorted([("yes", p_yes), ("no", 1 - p_yes)], key=lambda x: x[1], reverse=True)
+        candidates = candidates[:max(self.top_logprobs, 1)]
+        return {
+            "content": [{
+                "token": answer,
+                "logprob": math.log(p_answer),
+                "bytes": None,
+                "top_logprobs": [
+                    {"token": token, "logprob": math.log(prob), "bytes": None} for token, prob in candidates
+                ],
+            }]
+        }
+
+
+class _MockHTTPServer(ThreadingHTTPServer):
+    # the default backlog of 5 refuses connections under benchmark concurrency, which the clients then retry
+    request_queue_size = 4096
+    daemon_threads = True
+
+
+@dataclass
+class MockLLMServer:
+    """
+    Serve MockResponder over HTTP at /v1/chat/completions and /v1/completions in a background thread.
+    """
+    host: str = "127.0.0.1"
+    port: int = 0
+    latency: LatencyModel = field(default_factory=LatencyModel)
+    responder: MockResponder = field(default_factory=MockResponder)
+    # answer every completion request with this HTTP status, e.g. 500 for a failing replica, 0 answers normally
+    error_status: int = 0
+
+    def __post_init__(self):
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self._server.server_address[1]}/v1"
+
+    def _count_request(self):
+        with self._lock:
+            self.request_count += 1
+
+    def chat_completion(self, body: dict) -> dict:
+        self._count_request()
+        messages = body["messages"]
+        if body.get("logprobs"):
+            logprobs = self.responder.judge_logprobs(messages[-1]["content"])
+            content = logprobs["content"][0]["token"]
+        else:
+            logprobs = None
+            content = self.responder.respond(messages)
+
+        prompt_tokens = sum(_count_tokens(m["content"]) for m in messages)
+        completion_tokens = _count_tokens(content)
+        time.sleep(self.latency.sample(completion_tokens))
+        return {
+            "id": f"chatcmpl-{_stable_hash(content)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "logprobs": logprobs,
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def completion(self, body: dict) -> dict:
+        """
+        Legacy completions answering each prompt of the prompt list with the first judge token and its logprobs,
+        counted as one request.
+        """
+        self._count_request()
+        prompts = body["prompt"] if isinstance(body["prompt"], list) else [body["prompt"]]
+        choices = []
+        for index, prompt in enumerate(prompts):
+            content = self.responder.judge_logprobs(prompt)["content"][0]
+            logprobs = None
+            if body.get("logprobs") is not None:
+                logprobs = {
+                    "tokens": [content["token"]],
+                    "token_logprobs": [content["logprob"]],
+                    "top_logprobs": [{top["token"]: top["logprob"] for top in content["top_logprobs"]}],
+                    "text_offset": [0],
+                }
+            choices.append({"index": index, "text": content["token"], "logprobs": logprobs, "finish_reason": "length"})
+
+        prompt_tokens = sum(_count_tokens(prompt) for prompt in prompts)
+        completion_tokens = len(prompts)
+        time.sleep(self.latency.sample(completion_tokens))
+        return {
+            "id": f"cmpl-{_stable_hash(prompts[0] if prompts else '')}",
+            "object": "text_completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": choices,
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self): # pylint: disable=invalid-name
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if server.error_status:
+                    server._count_request() # pylint: disable=protected-access
+                    payload = json.dumps({"error": {"message": "Mock server error"}}).encode()
+                    self.send_response(server.error_status)
+                elif self.path.rstrip("/").endswith("/chat/completions"):
+                    payload = json.dumps(server.chat_completion(body)).encode()
+                    self.send_response(200)
+                elif self.path.rstrip("/").endswith("/completions"):
+                    payload = json.dumps(server.completion(body)).encode()
+                    self.send_response(200)
+                else:
+                    payload = json.dumps({"error": {"message": f"Unknown path {self.path}"}}).encode()
+                    self.send_response(404)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self): # pylint: disable=invalid-name
+                if self.path.rstrip("/").endswith("/stats"):
+                    payload = json.dumps({"request_count": server.request_count}).encode()
+                    self.send_response(200)
+                else:
+                    payload = json.dumps({"error": {"message": f"Unknown path {self.path}"}}).encode()
+                    self.send_response(404)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args): # pylint: disable=redefined-builtin
+                pass
+
+        return Handler
+
+    def start(self) -> "MockLLMServer":
+        self._server = _MockHTTPServer((self.host, self.port), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def _serve(latency: tuple, glean_rounds: int, conn):
+    server = MockLLMServer(latency=LatencyModel(*latency), responder=MockResponder(glean_rounds=glean_rounds)).start()
+    conn.send(server.url)
+    server._thread.join() # pylint: disable=protected-access
+
+
+class MockLLMServerProcess:
+    """
+    Serve MockLLMServer from a child process, so that the CPU time and memory measured by a benchmark
+    are the client's alone. The request count is read from the /stats endpoint.
+    """
+
+    def __init__(self, latency: tuple = (), glean_rounds: int = 0):
+        """
+        :param latency: LatencyModel arguments
+        :param glean_rounds: see MockResponder
+        """
+        self.latency = latency
+        self.glean_rounds = glean_rounds
+        self.url = None
+        self._process = None
+
+    def start(self) -> "MockLLMServerProcess":
+        parent_conn, child_conn = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=_serve, args=(self.latency, self.glean_rounds, child_conn),
+                                                daemon=True)
+        self._process.start()
+        self.url = parent_conn.recv()
+        return self
+
+    @property
+    def request_count(self) -> int:
+        with urllib.request.urlopen(f"{self.url}/stats") as response:
+            return json.loads(response.read())["request_count"]
+
+    def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join()
+            self._process = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1", type=str)
+    parser.add_argument("--port", default=8000, type=int)
+    parser.add_argument("--latency", default="constant", choices=["constant", "uniform", "lognormal"])
+    parser.add_argument("--latency-mean", default=0.0, type=float, help="mean base latency in seconds")
+    parser.add_argument("--latency-per-token", default=0.0, type=float, help="extra latency per completion token")
+    parser.add_argument("--glean-rounds", default=0, type=int, help="gleaning rounds answered with 'yes'")
+    parser.add_argument("--seed", default=0, type=int)
+    args = parser.parse_args()
+
+    mock_server = MockLLMServer(
+        host=args.host,
+        port=args.port,
+        latency=LatencyModel(args.latency, args.latency_mean, args.latency_per_token, args.seed),
+        responder=MockResponder(glean_rounds=args.glean_rounds),
+    ).start()
+    print(f"Mock LLM server listening on {mock_server.url}")
+    try:
+        mock_server._thread.join() # pylint: disable=protected-access
+    except KeyboardInterrupt:
+        mock_server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -6,8 +6,10 @@ import yaml
 from dotenv import load_dotenv
 
 from .graphgen import GraphGen
-from .models import OpenAIModel, Tokenizer, TraverseStrategy
-from .utils import set_logger
+from .models import (OpenAIModel, CompletionsJudgeModel, Tokenizer, TraverseStrategy, GleanStrategy,
+                     ResolutionStrategy, DedupStrategy, LLMCache, AdaptiveConcurrency, EndpointPool,
+                     openai_embedding_func)
+from .utils import set_logger, logger
 
 sys_path = os.path.abspath(os.path.dirname(__file__))
 
@@ -24,6 +26,33 @@ def save_config(config_path, global_config):
     with open(config_path, "w", encoding='utf-8') as config_file:
         yaml.dump(global_config, config_file, default_flow_style=False, allow_unicode=True)
 
+def find_latest_unique_id(folder):
+    """
+    Find the unique id of the latest run in the output directory, None if there is no run yet.
+    """
+    data_dir = os.path.join(folder, "data", "graphgen")
+    unique_ids = [int(name) for name in os.listdir(data_dir) if name.isdigit()] if os.path.isdir(data_dir) else []
+    return max(unique_ids) if unique_ids else None
+
+def build_concurrency(concurrency_config: dict):
+    if not concurrency_config.get('adaptive', False):
+        return None
+    return AdaptiveConcurrency(
+        initial=concurrency_config.get('initial', 16),
+        min_limit=concurrency_config.get('min', 1),
+        max_limit=concurrency_config.get('max', 1000)
+    )
+
+def build_endpoint_pool(base_url: str, api_key: str, pool_config: dict):
+    """
+    Build an endpoint pool when several comma-separated base urls are given.
+    """
+    base_urls = [url.strip() for url in (base_url or "").split(",") if url.strip()]
+    if len(base_urls) <= 1:
+        return None
+    api_keys = [key.strip() for key in (api_key or "").split(",")]
+    return EndpointPool.from_urls(base_urls, api_keys, **pool_config)
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--config_file',
@@ -35,13 +64,23 @@ if __name__ == '__main__':
                         default=sys_path,
                         required=True,
                         type=str)
+    parser.add_argument('--resume',
+                        help='Resume the latest run in the output directory, finished chunks, quizzes, '
+                             'judgements and QA batches are not redone.',
+                        action='store_true')
 
     args = parser.parse_args()
 
     working_dir = args.output_dir
     set_working_dir(working_dir)
-    unique_id = int(time.time())
-    set_logger(os.path.join(working_dir, "logs", f"graphgen_{unique_id}.log"), if_stream=False)
+    unique_id = find_latest_unique_id(working_dir) if args.resume else None
+    resumed = unique_id is not None
+    if unique_id is None:
+        unique_id = int(time.time())
+    set_logger(os.path.join(working_dir, "logs", f"graphgen_{unique_id}.log"), if_stream=False,
+               file_mode='a' if resumed else 'w')
+    if resumed:
+        logger.info("Resuming run %s", unique_id)
 
     with open(args.config_file, "r", encoding='utf-8') as f:
         config = yaml.load(f, Loader=yaml.FullLoader)
@@ -57,40 +96,97 @@ if __name__ == '__main__':
     else:
         raise ValueError(f"Invalid data type: {config['data_type']}")
 
+    llm_cache = None
+    cache_config = config.get('llm_cache', {})
+    if cache_config.get('enabled', False):
+        llm_cache = LLMCache(
+            working_dir,
+            max_entries=cache_config.get('max_entries', 100000),
+            replay=cache_config.get('replay', False)
+        )
+
+    tokenizer_instance = Tokenizer(
+        model_name=config['tokenizer']
+    )
+
     synthesizer_llm_client = OpenAIModel(
         model_name=os.getenv("SYNTHESIZER_MODEL"),
         api_key=os.getenv("SYNTHESIZER_API_KEY"),
-        base_url=os.getenv("SYNTHESIZER_BASE_URL")
-    )
-    trainee_llm_client = OpenAIModel(
-        model_name=os.getenv("TRAINEE_MODEL"),
-        api_key=os.getenv("TRAINEE_API_KEY"),
-        base_url=os.getenv("TRAINEE_BASE_URL")
+        base_url=os.getenv("SYNTHESIZER_BASE_URL"),
+        cache=llm_cache,
+        tokenizer=tokenizer_instance,
+        concurrency=build_concurrency(config.get('concurrency', {})),
+        endpoint_pool=build_endpoint_pool(os.getenv("SYNTHESIZER_BASE_URL"), os.getenv("SYNTHESIZER_API_KEY"),
+                                          config.get('endpoint_pool', {}))
     )
+    judge_backend = dict(config.get('judge_backend', {}))
+    if judge_backend.pop('type', 'chat') == 'completions':
+        trainee_llm_client = CompletionsJudgeModel(
+            model_name=os.getenv("TRAINEE_MODEL"),
+            api_key=os.getenv("TRAINEE_API_KEY"),
+            base_url=os.getenv("TRAINEE_BASE_URL"),
+            cache=llm_cache,
+            **judge_backend
+        )
+    else:
+        trainee_llm_client = OpenAIModel(
+            model_name=os.getenv("TRAINEE_MODEL"),
+            api_key=os.getenv("TRAINEE_API_KEY"),
+            base_url=os.getenv("TRAINEE_BASE_URL"),
+            cache=llm_cache,
+            tokenizer=tokenizer_instance,
+            concurrency=build_concurrency(config.get('concurrency', {})),
+            endpoint_pool=build_endpoint_pool(os.getenv("TRAINEE_BASE_URL"), os.getenv("TRAINEE_API_KEY"),
+                                              config.get('endpoint_pool', {}))
+        )
 
     traverse_strategy = TraverseStrategy(
         **config['traverse_strategy']
     )
 
+    resolution_strategy = ResolutionStrategy(**config.get('resolution_strategy', {}))
+    embedding_func = None
+    if resolution_strategy.enabled and resolution_strategy.embedding == "openai":
+        embedding_func = openai_embedding_func(
+            model_name=os.getenv("EMBEDDING_MODEL"),
+            api_key=os.getenv("EMBEDDING_API_KEY"),
+            base_url=os.getenv("EMBEDDING_BASE_URL"),
+            embedding_dim=resolution_strategy.embedding_dim
+        )
+
+    path = os.path.join(working_dir, "data", "graphgen", str(unique_id), f"config-{unique_id}.yaml")
+    save_config(path, config)
+
     graph_gen = GraphGen(
         working_dir=working_dir,
         unique_id=unique_id,
         synthesizer_llm_client=synthesizer_llm_client,
         trainee_llm_client=trainee_llm_client,
         if_web_search=config['web_search'],
-        tokenizer_instance=Tokenizer(
-            model_name=config['tokenizer']
-        ),
-        traverse_strategy=traverse_strategy
+        tokenizer_instance=tokenizer_instance,
+        traverse_strategy=traverse_strategy,
+        chunking_batch_size=config.get('chunking', {}).get('batch_size', 256),
+        chunking_threads=config.get('chunking', {}).get('threads', 8),
+        dedup_strategy=DedupStrategy(**config.get('dedup_strategy', {})),
+        incremental_merge=config.get('incremental_merge', False),
+        extraction_batch_tokens=config.get('extraction_batch_tokens', 0),
+        glean_strategy=GleanStrategy(**config.get('glean_strategy', {})),
+        resolution_strategy=resolution_strategy,
+        embedding_func=embedding_func,
+        kv_backends=config.get('kv_backends', {}),
+        graph_backend=config.get('graph_backend', 'networkx'),
+        checkpoint_interval=config.get('checkpoint_interval', 60),
+        pipeline_queue_size=config.get('pipeline', {}).get('queue_size', 1000),
+        pipeline_workers=config.get('pipeline', {}).get('workers', 1000)
     )
 
-    graph_gen.insert(data, config['data_type'])
-
-    graph_gen.quiz(max_samples=config['quiz_samples'])
+    if config.get('pipeline', {}).get('enabled', False):
+        graph_gen.run_pipeline(data, config['data_type'], max_samples=config['quiz_samples'], re_judge=False)
+    else:
+        graph_gen.insert(data, config['data_type'])
 
-    graph_gen.judge(re_judge=False)
+        graph_gen.quiz(max_samples=config['quiz_samples'])
 
-    graph_gen.traverse()
+        graph_gen.judge(re_judge=False)
 
-    path = os.path.join(working_dir, "data", "graphgen", str(unique_id), f"config-{unique_id}.yaml")
-    save_config(path, config)
+        graph_gen.traverse()
@@ -3,22 +3,37 @@
 import os
 import asyncio
 import time
+import functools
 from typing import List, cast, Union
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 from tqdm.asyncio import tqdm as tqdm_async
 import gradio as gr
 
-from .models import Chunk, JsonKVStorage, OpenAIModel, NetworkXStorage, WikiSearch, Tokenizer, TraverseStrategy
-from .models.storage.base_storage import StorageNameSpace
+from .models import (Chunk, JsonKVStorage, LogKVStorage, SQLiteKVStorage, OpenAIModel, NetworkXStorage,
+                     SQLiteGraphStorage, WikiSearch, Tokenizer, TraverseStrategy, GleanStrategy, ResolutionStrategy,
+                     DedupStrategy, EmbeddingFunc, local_embedding_func, MinHashLSH, Checkpoint)
+from .models.storage.base_storage import StorageNameSpace, BaseKVStorage, BaseGraphStorage
 from .utils import create_event_loop, logger, compute_content_hash
 from .operators import (extract_kg, search_wikipedia, quiz, judge_statement,
                         skip_judge_statement, traverse_graph_by_edge,
-                        traverse_graph_atomically, traverse_graph_for_multi_hop)
+                        traverse_graph_atomically, traverse_graph_for_multi_hop,
+                        STOP, quiz_stage, judge_stage, atomic_qa_stage)
 
 
 sys_path = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 
+KV_STORAGE_BACKENDS = {
+    "json": JsonKVStorage,
+    "log": LogKVStorage,
+    "sqlite": SQLiteKVStorage,
+}
+
+GRAPH_STORAGE_BACKENDS = {
+    "networkx": NetworkXStorage,
+    "sqlite": SQLiteGraphStorage,
+}
+
 @dataclass
 class GraphGen:
     unique_id: int = int(time.time())
@@ -27,6 +42,21 @@ class GraphGen:
     # text chunking
     chunk_size: int = 1024
     chunk_overlap_size: int = 100
+    # documents encoded and decoded per batch call off the event loop, and threads of the tokenizer
+    chunking_batch_size: int = 256
+    chunking_threads: int = 8
+    # near-duplicate documents and chunks are dropped before extraction
+    dedup_strategy: DedupStrategy = field(default_factory=DedupStrategy)
+
+    # merge the records of each chunk into the graph as soon as it is extracted
+    incremental_merge: bool = False
+    # pack short chunks into one extraction request up to this many prompt tokens, 0 extracts each chunk on its own
+    extraction_batch_tokens: int = 0
+    # gleaning rounds after the first extraction
+    glean_strategy: GleanStrategy = field(default_factory=GleanStrategy)
+    # entity resolution before merging, embedding_func defaults to the local hashing embedding
+    resolution_strategy: ResolutionStrategy = field(default_factory=ResolutionStrategy)
+    embedding_func: EmbeddingFunc = None
 
     # llm
     synthesizer_llm_client: OpenAIModel = None
@@ -35,33 +65,128 @@ class GraphGen:
 
     # web search
     if_web_search: bool = False
-    wiki_client: WikiSearch = WikiSearch()
+    wiki_client: WikiSearch = field(default_factory=WikiSearch)
 
     # traverse strategy
-    traverse_strategy: TraverseStrategy = TraverseStrategy()
+    traverse_strategy: TraverseStrategy = field(default_factory=TraverseStrategy)
 
     # webui
     progress_bar: gr.Progress = None
 
+    # kv storage backend of each namespace, "json" (default), "log" or "sqlite"
+    # "log" is opt-in, it suits large append-mostly namespaces such as full_docs and text_chunks
+    kv_backends: dict = field(default_factory=dict)
+    # graph storage backend, "networkx" or "sqlite"
+    graph_backend: str = "networkx"
+
+    # seconds between checkpoint flushes while a stage is running
+    checkpoint_interval: float = 60.0
+
+    # pipeline mode, size of the queues between stages and number of items each stage processes concurrently
+    pipeline_queue_size: int = 1000
+    pipeline_workers: int = 1000
+
     def __post_init__(self):
-        self.full_docs_storage: JsonKVStorage = JsonKVStorage(
+        if self.resolution_strategy.enabled and self.embedding_func is None:
+            self.embedding_func = local_embedding_func(self.resolution_strategy.embedding_dim)
+        self.full_docs_storage: BaseKVStorage = self._new_kv_storage(
             self.working_dir, namespace="full_docs"
         )
-        self.text_chunks_storage: JsonKVStorage = JsonKVStorage(
+        self.text_chunks_storage: BaseKVStorage = self._new_kv_storage(
             self.working_dir, namespace="text_chunks"
         )
-        self.wiki_storage: JsonKVStorage = JsonKVStorage(
+        self.wiki_storage: BaseKVStorage = self._new_kv_storage(
             self.working_dir, namespace="wiki"
         )
-        self.graph_storage: NetworkXStorage = NetworkXStorage(
+        # near-duplicate docs and chunks, with the doc or chunk each was folded into
+        self.dedup_storage: BaseKVStorage = self._new_kv_storage(
+            self.working_dir, namespace="dedup"
+        )
+        # summaries of merged entity and relation descriptions, by the hash of (model, name, limit, description set)
+        self.summary_storage: BaseKVStorage = self._new_kv_storage(
+            self.working_dir, namespace="summary"
+        )
+        # embeddings of graph nodes for the entity resolution, by the hash of (model, name, description)
+        self.embedding_storage: BaseKVStorage = self._new_kv_storage(
+            self.working_dir, namespace="embedding"
+        )
+        if self.graph_backend not in GRAPH_STORAGE_BACKENDS:
+            raise ValueError(f"Invalid graph storage backend: {self.graph_backend}")
+        self.graph_storage: BaseGraphStorage = GRAPH_STORAGE_BACKENDS[self.graph_backend](
             self.working_dir, namespace="graph"
         )
-        self.rephrase_storage: JsonKVStorage = JsonKVStorage(
+        self.rephrase_storage: BaseKVStorage = self._new_kv_storage(
             self.working_dir, namespace="rephrase"
         )
-        self.qa_storage: JsonKVStorage = JsonKVStorage(
-            os.path.join(self.working_dir, "data", "graphgen", str(self.unique_id)), namespace=f"qa-{self.unique_id}"
+        # judgements of the trainee model by the hash of (backend, model, prompt template, prompt)
+        self.judgement_storage: BaseKVStorage = self._new_kv_storage(
+            self.working_dir, namespace="judgement"
+        )
+        self.qa_storage: BaseKVStorage = self._new_kv_storage(
+            os.path.join(self.working_dir, "data", "graphgen", str(self.unique_id)), namespace=f"qa-{self.unique_id}",
+            backend_key="qa"
         )
+        # results of finished chunks and QA batches, so that an interrupted run can be resumed
+        self.checkpoint_storage: BaseKVStorage = self._new_kv_storage(
+            self.working_dir, namespace="checkpoint", default_backend="log"
+        )
+
+    def _new_kv_storage(self, working_dir: str, namespace: str, backend_key: str = None,
+                        default_backend: str = "json") -> BaseKVStorage:
+        backend = self.kv_backends.get(backend_key or namespace, default_backend)
+        if backend not in KV_STORAGE_BACKENDS:
+            raise ValueError(f"Invalid kv storage backend: {backend}")
+        return KV_STORAGE_BACKENDS[backend](working_dir, namespace=namespace)
+
+    async def _fold_near_duplicates(self, items: dict, kind: str) -> dict:
+        """
+        Find the near-duplicates among items and record in dedup_storage which item each was folded into
+
+        :param items: docs or chunks by key
+        :param kind: "doc" or "chunk"
+        :return: {duplicate key: {"kept": key, "similarity": estimated Jaccard}}
+        """
+        if not self.dedup_strategy.enabled or len(items) < 2:
+            return {}
+        lsh = MinHashLSH(threshold=self.dedup_strategy.threshold, num_perm=self.dedup_strategy.num_perm,
+                         shingle_size=self.dedup_strategy.shingle_size)
+        duplicates = lsh.deduplicate({k: v['content'] for k, v in items.items()})
+        if duplicates:
+            await self.dedup_storage.upsert({k: {**v, 'type': kind} for k, v in duplicates.items()})
+            logger.info("[Dedup] folded %d of %d %ss into near-duplicates", len(duplicates), len(items), kind)
+        return duplicates
+
+    async def _chunk_docs(self, docs: dict) -> dict:
+        """
+        Chunk docs in batches of chunking_batch_size, each encoded and decoded at once in an executor thread,
+        so that the event loop is not blocked
+
+        :param docs: docs by key
+        :return: chunks by key
+        """
+        loop = asyncio.get_running_loop()
+        doc_items = list(docs.items())
+        chunks = {}
+        start_time = time.perf_counter()
+        with tqdm_async(total=len(doc_items), desc="Chunking documents", unit="doc") as pbar:
+            for start in range(0, len(doc_items), self.chunking_batch_size):
+                batch = doc_items[start:start + self.chunking_batch_size]
+                doc_chunks = await loop.run_in_executor(None, functools.partial(
+                    self.tokenizer_instance.chunk_documents, [doc['content'] for _, doc in batch],
+                    self.chunk_overlap_size, self.chunk_size, self.chunking_threads
+                ))
+                for (doc_key, _), dps in zip(batch, doc_chunks):
+                    for dp in dps:
+                        chunks[compute_content_hash(dp["content"], prefix="chunk-")] = {**dp, 'full_doc_id': doc_key}
+                pbar.update(len(batch))
+                if self.progress_bar is not None:
+                    self.progress_bar(
+                        (start + len(batch)) / len(doc_items), f"Chunking {batch[-1][0]}"
+                    )
+        elapsed = time.perf_counter() - start_time
+        logger.info("[Chunking] %d docs into %d chunks in %.2fs (%.1f docs/s)",
+                    len(doc_items), len(chunks), elapsed, len(doc_items) / max(elapsed, 1e-9))
+        return chunks
 
     async def async_split_chunks(self, data: Union[List[list], List[dict]], data_type: str) -> dict:
         # TODO： 是否进行指代消解
@@ -82,26 +207,12 @@ class GraphGen:
                 logger.warning("All docs are already in the storage")
                 return {}
             logger.info("[New Docs] inserting %d docs", len(new_docs))
+            # duplicate docs are still stored, so that they are skipped next time, but not chunked
+            duplicate_docs = await self._fold_near_duplicates(new_docs, "doc") if self.dedup_strategy.docs else {}
 
-            cur_index = 1
-            doc_number = len(new_docs)
-            for doc_key, doc in tqdm_async(
-                    new_docs.items(), desc="Chunking documents", unit="doc"
-                ):
-                chunks = {
-                    compute_content_hash(dp["content"], prefix="chunk-"): {
-                        **dp,
-                        'full_doc_id': doc_key
-                    } for dp in self.tokenizer_instance.chunk_by_token_size(doc["content"],
-                                                                            self.chunk_overlap_size, self.chunk_size)
-                }
-                inserting_chunks.update(chunks)
-
-                if self.progress_bar is not None:
-                    self.progress_bar(
-                        cur_index / doc_number, f"Chunking {doc_key}"
-                    )
-                    cur_index += 1
+            inserting_chunks = await self._chunk_docs(
+                {k: v for k, v in new_docs.items() if k not in duplicate_docs}
+            )
 
             _add_chunk_keys = await self.text_chunks_storage.filter_keys(list(inserting_chunks.keys()))
             inserting_chunks = {k: v for k, v in inserting_chunks.items() if k in _add_chunk_keys}
@@ -128,6 +239,10 @@ class GraphGen:
             _add_chunk_keys = await self.text_chunks_storage.filter_keys(list(inserting_chunks.keys()))
             inserting_chunks = {k: v for k, v in inserting_chunks.items() if k in _add_chunk_keys}
 
+        if self.dedup_strategy.chunks:
+            duplicate_chunks = await self._fold_near_duplicates(inserting_chunks, "chunk")
+            inserting_chunks = {k: v for k, v in inserting_chunks.items() if k not in duplicate_chunks}
+
         await self.full_docs_storage.upsert(new_docs)
         await self.text_chunks_storage.upsert(inserting_chunks)
 
@@ -137,10 +252,12 @@ class GraphGen:
         loop = create_event_loop()
         loop.run_until_complete(self.async_insert(data, data_type))
 
-    async def async_insert(self, data: Union[List[list], List[dict]], data_type: str):
+    async def async_insert(self, data: Union[List[list], List[dict]], data_type: str,
+                           merged_queue: asyncio.Queue = None):
         """
 
         insert chunks into the graph
+        :param merged_queue: put each node and edge once it is merged, see merge_nodes
         """
 
         inserting_chunks = await self.async_split_chunks(data, data_type)
@@ -151,12 +268,24 @@ class GraphGen:
         logger.info("[New Chunks] inserting %d chunks", len(inserting_chunks))
 
         logger.info("[Entity and Relation Extraction]...")
+        checkpoint = self._new_checkpoint(self.checkpoint_storage,
+                                          flush_storages=[self.summary_storage, self.embedding_storage],
+                                          prefix="extract-")
         _add_entities_and_relations = await extract_kg(
             llm_client=self.synthesizer_llm_client,
             kg_instance=self.graph_storage,
             tokenizer_instance=self.tokenizer_instance,
             chunks=[Chunk(id=k, content=v['content']) for k, v in inserting_chunks.items()],
             progress_bar = self.progress_bar,
+            checkpoint=checkpoint,
+            merged_queue=merged_queue,
+            incremental_merge=self.incremental_merge,
+            batch_token_budget=self.extraction_batch_tokens,
+            glean_strategy=self.glean_strategy,
+            resolution_strategy=self.resolution_strategy,
+            embedding_func=self.embedding_func,
+            summary_cache=self.summary_storage,
+            embedding_cache=self.embedding_storage
         )
         if not _add_entities_and_relations:
             logger.warning("No entities or relations extracted")
@@ -173,23 +302,53 @@ class GraphGen:
             await self.wiki_storage.upsert(_add_wiki_data)
 
         await self._insert_done()
+        await checkpoint.clear()
 
     async def _insert_done(self):
         tasks = []
         for storage_instance in [self.full_docs_storage, self.text_chunks_storage,
-                                 self.graph_storage, self.wiki_storage]:
+                                 self.graph_storage, self.wiki_storage, self.dedup_storage, self.summary_storage,
+                                 self.embedding_storage, self.checkpoint_storage]:
             if storage_instance is None:
                 continue
             tasks.append(cast(StorageNameSpace, storage_instance).index_done_callback())
         await asyncio.gather(*tasks)
+        await self._llm_cache_done()
+
+    def _llm_caches(self) -> list:
+        caches = []
+        for llm_client in [self.synthesizer_llm_client, self.trainee_llm_client]:
+            if llm_client is None or llm_client.cache is None:
+                continue
+            if all(llm_client.cache is not cache for cache in caches):
+                caches.append(llm_client.cache)
+        return caches
+
+    async def _llm_cache_done(self):
+        await asyncio.gather(*[cache.index_done_callback() for cache in self._llm_caches()])
+        # called at the end of each stage, the per-endpoint load is logged next to the cache stats
+        endpoint_pools = []
+        for llm_client in [self.synthesizer_llm_client, self.trainee_llm_client]:
+            endpoint_pool = getattr(llm_client, "endpoint_pool", None)
+            if endpoint_pool is not None and all(endpoint_pool is not pool for pool in endpoint_pools):
+                endpoint_pools.append(endpoint_pool)
+                logger.info("Endpoint pool stats of %s: %s", llm_client.model_name, endpoint_pool.stats)
+
+    def _new_checkpoint(self, storage: BaseKVStorage = None, flush_storages: list = None,
+                        prefix: str = "") -> Checkpoint:
+        # the llm caches are flushed too, so calls of unfinished units are replayed on resume
+        return Checkpoint(storage, (flush_storages or []) + self._llm_caches(),
+                          interval=self.checkpoint_interval, prefix=prefix)
 
     def quiz(self, max_samples=1):
         loop = create_event_loop()
         loop.run_until_complete(self.async_quiz(max_samples))
 
     async def async_quiz(self, max_samples=1):
-        await quiz(self.synthesizer_llm_client, self.graph_storage, self.rephrase_storage, max_samples)
+        await quiz(self.synthesizer_llm_client, self.graph_storage, self.rephrase_storage, max_samples,
+                   checkpoint=self._new_checkpoint(flush_storages=[self.rephrase_storage]))
         await self.rephrase_storage.index_done_callback()
+        await self._llm_cache_done()
 
     def judge(self, re_judge=False, skip=False):
         loop = create_event_loop()
@@ -199,9 +358,13 @@ class GraphGen:
         if skip:
             _update_relations = await skip_judge_statement(self.graph_storage)
         else:
+            checkpoint = self._new_checkpoint(flush_storages=[self.graph_storage, self.judgement_storage])
             _update_relations = await judge_statement(self.trainee_llm_client, self.graph_storage,
-                                                      self.rephrase_storage, re_judge)
+                                                      self.rephrase_storage, re_judge, checkpoint=checkpoint,
+                                                      judgement_cache=self.judgement_storage)
+            await self.judgement_storage.index_done_callback()
         await _update_relations.index_done_callback()
+        await self._llm_cache_done()
 
 
     def traverse(self):
@@ -209,26 +372,84 @@ class GraphGen:
         loop.run_until_complete(self.async_traverse())
 
     async def async_traverse(self):
+        checkpoint = self._new_checkpoint(self.checkpoint_storage, prefix=f"traverse-{self.unique_id}-")
         if self.traverse_strategy.qa_form == "atomic":
             results = await traverse_graph_atomically(self.synthesizer_llm_client,
                                                       self.tokenizer_instance,
                                                       self.graph_storage,
                                                       self.traverse_strategy,
                                                       self.text_chunks_storage,
-                                                      self.progress_bar)
+                                                      self.progress_bar,
+                                                      checkpoint=checkpoint)
         elif self.traverse_strategy.qa_form == "multi_hop":
             results = await traverse_graph_for_multi_hop(self.synthesizer_llm_client,
                                                             self.tokenizer_instance,
                                                             self.graph_storage,
                                                             self.traverse_strategy,
                                                             self.text_chunks_storage,
-                                                            self.progress_bar)
+                                                            self.progress_bar,
+                                                            checkpoint=checkpoint)
         else:
             results = await traverse_graph_by_edge(self.synthesizer_llm_client, self.tokenizer_instance,
                                                    self.graph_storage, self.traverse_strategy, self.text_chunks_storage,
-                                                   self.progress_bar)
+                                                   self.progress_bar, checkpoint=checkpoint)
         await self.qa_storage.upsert(results)
         await self.qa_storage.index_done_callback()
+        await checkpoint.clear()
+        await self._llm_cache_done()
+
+    def run_pipeline(self, data: Union[List[list], List[dict]], data_type: str, max_samples=1, re_judge=False):
+        loop = create_event_loop()
+        loop.run_until_complete(self.async_run_pipeline(data, data_type, max_samples, re_judge))
+
+    async def async_run_pipeline(self, data: Union[List[list], List[dict]], data_type: str, max_samples=1,
+                                 re_judge=False):
+        """
+        Run insert, quiz, judge and traverse with overlapped stages. A node or edge is quizzed as soon as it is
+        merged and judged as soon as it is quizzed, and in atomic mode its QAs are generated right after, so the
+        synthesizer and trainee models are busy at the same time. The stages are connected by bounded queues.
+        With incremental_merge, nodes and edges are streamed while chunks are still being extracted, and streamed
+        again when a later chunk changes their description. Otherwise they are only merged, and streamed, once
+        every chunk is extracted.
+
+        The regular stages run afterwards as a catch-up over the whole graph: they skip whatever was streamed and
+        handle what was not, e.g. nodes already in the graph before this run. Traversal for the aggregated and
+        multi-hop forms needs the loss terciles of the whole graph, so it only starts after the last judgement.
+        """
+        merged_queue = asyncio.Queue(self.pipeline_queue_size)
+        quizzed_queue = asyncio.Queue(self.pipeline_queue_size)
+        judged_queue = asyncio.Queue(self.pipeline_queue_size) if self.traverse_strategy.qa_form == "atomic" else None
+
+        stages = [
+            quiz_stage(self.synthesizer_llm_client, self.graph_storage, self.rephrase_storage,
+                       merged_queue, quizzed_queue, max_samples, self.pipeline_workers,
+                       checkpoint=self._new_checkpoint(flush_storages=[self.rephrase_storage])),
+            judge_stage(self.trainee_llm_client, self.graph_storage, self.rephrase_storage,
+                        quizzed_queue, judged_queue, re_judge, self.pipeline_workers,
+                        checkpoint=self._new_checkpoint(flush_storages=[self.graph_storage, self.judgement_storage]),
+                        judgement_cache=self.judgement_storage),
+        ]
+        if judged_queue is not None:
+            stages.append(atomic_qa_stage(
+                self.synthesizer_llm_client, self.graph_storage, judged_queue,
+                self._new_checkpoint(self.checkpoint_storage, prefix=f"traverse-{self.unique_id}-"),
+                self.pipeline_workers
+            ))
+        stage_tasks = [asyncio.create_task(stage) for stage in stages]
+        try:
+            await self.async_insert(data, data_type, merged_queue=merged_queue)
+        except BaseException:
+            # STOP could wait forever behind a full queue, so the stages are cancelled instead
+            for task in stage_tasks:
+                task.cancel()
+            await asyncio.gather(*stage_tasks, return_exceptions=True)
+            raise
+        await merged_queue.put(STOP)
+        await asyncio.gather(*stage_tasks)
+
+        await self.async_quiz(max_samples)
+        await self.async_judge(re_judge)
+        await self.async_traverse()
 
     def clear(self):
         loop = create_event_loop()
@@ -238,8 +459,13 @@ class GraphGen:
         await self.full_docs_storage.drop()
         await self.text_chunks_storage.drop()
         await self.wiki_storage.drop()
+        await self.dedup_storage.drop()
+        await self.summary_storage.drop()
+        await self.embedding_storage.drop()
         await self.graph_storage.clear()
         await self.rephrase_storage.drop()
+        await self.judgement_storage.drop()
         await self.qa_storage.drop()
+        await self.checkpoint_storage.drop()
 
         logger.info("All caches are cleared")
@@ -1,12 +1,23 @@
 from .text.chunk import Chunk
 from .text.text_pair import TextPair
+from .text.minhash import MinHashLSH
 
 from .llm.topk_token_model import Token, TopkTokenModel
 from .llm.openai_model import OpenAIModel
+from .llm.completions_judge_model import CompletionsJudgeModel
 from .llm.tokenizer import Tokenizer
+from .llm.llm_cache import LLMCache
+from .llm.limitter import AdaptiveConcurrency
+from .llm.endpoint_pool import Endpoint, EndpointPool
+
+from .embed.embedding import EmbeddingFunc, local_embedding_func, openai_embedding_func
+from .embed.similarity_index import HyperplaneIndex
 
 from .storage.networkx_storage import NetworkXStorage
 from .storage.json_storage import JsonKVStorage
+from .storage.log_storage import LogKVStorage
+from .storage.sqlite_storage import SQLiteKVStorage, SQLiteGraphStorage
+from .storage.checkpoint import Checkpoint
 
 from .search.wiki_search import WikiSearch
 
@@ -16,18 +27,36 @@ from .evaluate.reward_evaluator import RewardEvaluator
 from .evaluate.uni_evaluator import UniEvaluator
 
 from .strategy.travserse_strategy import TraverseStrategy
+from .strategy.glean_strategy import GleanStrategy
+from .strategy.resolution_strategy import ResolutionStrategy
+from .strategy.dedup_strategy import DedupStrategy
 
 
 __all__ = [
     # llm models
     "OpenAIModel",
+    "CompletionsJudgeModel",
     "TopkTokenModel",
     "Token",
     "Tokenizer",
+    "LLMCache",
+    "AdaptiveConcurrency",
+    "Endpoint",
+    "EndpointPool",
+    # embedding models
+    "EmbeddingFunc",
+    "local_embedding_func",
+    "openai_embedding_func",
+    "HyperplaneIndex",
     # storage models
     "Chunk",
+    "MinHashLSH",
     "NetworkXStorage",
     "JsonKVStorage",
+    "LogKVStorage",
+    "SQLiteKVStorage",
+    "SQLiteGraphStorage",
+    "Checkpoint",
     # search models
     "WikiSearch",
     # evaluate models
@@ -38,4 +67,7 @@ __all__ = [
     "UniEvaluator",
     # strategy models
     "TraverseStrategy",
+    "GleanStrategy",
+    "ResolutionStrategy",
+    "DedupStrategy",
 ]
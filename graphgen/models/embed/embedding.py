@@ -1,6 +1,8 @@
 from dataclasses import dataclass
+import zlib
 import asyncio
 import numpy as np
+from openai import AsyncOpenAI
 
 class UnlimitedSemaphore:
     """A context manager that allows unlimited access."""
@@ -17,6 +19,8 @@ class EmbeddingFunc:
     max_token_size: int
     func: callable
     concurrent_limit: int = 16
+    # identifies the embedding model, e.g. in keys of cached embeddings
+    model_name: str = None
 
     def __post_init__(self):
         if self.concurrent_limit != 0:
@@ -27,3 +31,64 @@ class EmbeddingFunc:
     async def __call__(self, *args, **kwargs) -> np.ndarray:
         async with self._semaphore:
             return await self.func(*args, **kwargs)
+
+
+def _hashed_features(text: str, ngram: int = 3) -> list:
+    text = " ".join(text.lower().split())
+    padded = f" {text} "
+    features = [padded[i:i + ngram] for i in range(max(1, len(padded) - ngram + 1))]
+    return features + text.split()
+
+
+def hashing_embedding(texts: list, embedding_dim: int = 256) -> np.ndarray:
+    """
+    Deterministic local embedding: character trigrams and words hashed into embedding_dim signed buckets,
+    L2-normalized. Texts sharing most of their surface form get a high cosine similarity.
+
+    :param texts
+    :param embedding_dim
+    :return: array of shape (len(texts), embedding_dim)
+    """
+    vectors = np.zeros((len(texts), embedding_dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        hashes = np.array([zlib.crc32(feature.encode("utf-8")) for feature in _hashed_features(text)],
+                          dtype=np.int64)
+        signs = np.where(hashes & (1 << 31), -1.0, 1.0)
+        np.add.at(vectors[row], hashes % embedding_dim, signs)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def local_embedding_func(embedding_dim: int = 256) -> EmbeddingFunc:
+    """
+    EmbeddingFunc over hashing_embedding, for tests and runs without an embedding model
+
+    :param embedding_dim
+    :return: embedding function
+    """
+    async def _embed(texts: list) -> np.ndarray:
+        return hashing_embedding(texts, embedding_dim)
+    return EmbeddingFunc(embedding_dim=embedding_dim, max_token_size=8192, func=_embed, concurrent_limit=0,
+                         model_name=f"hashing-{embedding_dim}")
+
+
+def openai_embedding_func(model_name: str, api_key: str, base_url: str = None, embedding_dim: int = 1536,
+                          max_token_size: int = 8192, concurrent_limit: int = 16) -> EmbeddingFunc:
+    """
+    EmbeddingFunc over an OpenAI compatible embeddings API
+
+    :param model_name: embedding model
+    :param api_key
+    :param base_url
+    :param embedding_dim: dimension of the model's embeddings
+    :param max_token_size: max tokens of a text
+    :param concurrent_limit: max concurrent requests
+    :return: embedding function
+    """
+    client = AsyncOpenAI(api_key=api_key, base_url=base_url)
+
+    async def _embed(texts: list) -> np.ndarray:
+        response = await client.embeddings.create(model=model_name, input=texts)
+        return np.array([d.embedding for d in response.data], dtype=np.float32)
+    return EmbeddingFunc(embedding_dim=embedding_dim, max_token_size=max_token_size, func=_embed,
+                         concurrent_limit=concurrent_limit, model_name=model_name)
@@ -0,0 +1,55 @@
+from dataclasses import dataclass
+import numpy as np
+
+
+@dataclass
+class HyperplaneIndex:
+    """
+    Near-duplicate search over embeddings with random-hyperplane LSH blocking.
+
+    In each of num_tables tables, a vector is bucketed by the signs of its projections on num_bits random
+    hyperplanes, so vectors with a high cosine similarity very likely share a bucket in at least one table.
+    Only vectors sharing a bucket are compared, with one matrix product per bucket, instead of all n² pairs.
+    """
+    num_tables: int = 16
+    num_bits: int = 10
+    # buckets larger than this are compared in blocks of this size
+    max_bucket_size: int = 1024
+    seed: int = 0
+
+    def similar_pairs(self, vectors: np.ndarray, threshold: float) -> np.ndarray:
+        """
+        Find the pairs of vectors whose cosine similarity is at least threshold
+
+        :param vectors: array of shape (n, dim)
+        :param threshold: min cosine similarity
+        :return: array of shape (k, 2) of index pairs (i, j) with i < j
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(vectors) < 2:
+            return np.zeros((0, 2), dtype=np.int64)
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+        rng = np.random.default_rng(self.seed)
+        planes = rng.standard_normal((self.num_tables, vectors.shape[1], self.num_bits)).astype(np.float32)
+        powers = 1 << np.arange(self.num_bits, dtype=np.int64)
+
+        found = []
+        for table in planes:
+            codes = ((vectors @ table) > 0).astype(np.int64) @ powers
+            order = np.argsort(codes, kind="stable")
+            boundaries = np.flatnonzero(np.diff(codes[order])) + 1
+            for bucket in np.split(order, boundaries):
+                for start in range(0, len(bucket) - 1, self.max_bucket_size):
+                    block = bucket[start:start + self.max_bucket_size]
+                    if len(block) < 2:
+                        continue
+                    similarities = vectors[block] @ vectors[block].T
+                    i, j = np.nonzero(np.triu(similarities >= threshold, k=1))
+                    found.append(np.stack([block[i], block[j]], axis=1))
+
+        if not found:
+            return np.zeros((0, 2), dtype=np.int64)
+        pairs = np.concatenate(found)
+        pairs = np.sort(pairs, axis=1)
+        return np.unique(pairs, axis=0)
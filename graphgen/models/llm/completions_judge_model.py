@@ -0,0 +1,154 @@
+import math
+import asyncio
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from openai import AsyncOpenAI
+from tenacity import (
+    retry,
+    stop_after_attempt,
+    wait_exponential,
+    retry_if_exception_type,
+)
+
+from graphgen.models.llm.topk_token_model import TopkTokenModel, Token
+from graphgen.models.llm.llm_cache import LLMCache, tokens_to_records, records_to_tokens
+from graphgen.models.llm.openai_model import OVERLOAD_ERRORS
+
+
+def get_first_completion_token(choice) -> Token:
+    """
+    First token of a legacy completions choice with its top candidates, whitespace stripped,
+    as completion tokens usually start with a space
+    """
+    logprobs = choice.logprobs
+    # some servers ignore the logprobs parameter
+    if logprobs is None or not logprobs.tokens:
+        raise ValueError(f"No logprobs in the completion of prompt {choice.index}")
+    top_logprobs = (logprobs.top_logprobs[0] if logprobs.top_logprobs else None) or {}
+    candidates = sorted(
+        (Token(token.strip(), math.exp(logprob)) for token, logprob in top_logprobs.items()),
+        key=lambda token: token.prob, reverse=True
+    )
+    return Token(logprobs.tokens[0].strip(), math.exp(logprobs.token_logprobs[0]), top_candidates=candidates)
+
+
+@dataclass
+class CompletionsJudgeModel(TopkTokenModel):
+    """
+    Judge model for OpenAI-compatible servers with a /v1/completions endpoint, e.g. vLLM.
+
+    Concurrent generate_topk_per_token calls are queued and sent together as the prompt list of one
+    completions request with max_tokens=1, so judging many statements takes one request per batch.
+    Only the first token of the answer and its top candidates are returned.
+    """
+    model_name: str = None
+    api_key: str = None
+    base_url: str = None
+
+    # completions are not chat formatted, wrap the prompt in the chat template of the model here
+    prompt_template: str = "{text}"
+    max_batch_size: int = 256
+    # seconds a prompt waits for more prompts before its batch is sent
+    max_wait: float = 0.05
+    max_concurrent_requests: int = 8
+
+    token_usage: list = field(default_factory=list)
+    cache: LLMCache = None
+
+    def __post_init__(self):
+        assert self.api_key is not None, "Please provide api key to access openai api."
+        self.client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
+        self._pending = []
+        self._timer = None
+        self._requests = set()
+        self._semaphore = None
+
+    @retry(
+        stop=stop_after_attempt(5),
+        wait=wait_exponential(multiplier=1, min=4, max=10),
+        retry=retry_if_exception_type(OVERLOAD_ERRORS),
+    )
+    async def _create_completion(self, prompts: List[str]):
+        return await self.client.completions.create(
+            model=self.model_name,
+            prompt=prompts,
+            max_tokens=1,
+            temperature=self.temperature,
+            logprobs=self.topk_per_token,
+        )
+
+    async def _send(self, batch: list):
+        try:
+            await self._send_batch(batch)
+        except Exception as e: # pylint: disable=broad-except
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            # e.g. the request was cancelled, nobody may wait forever for its batch
+            for _, future in batch:
+                if not future.done():
+                    future.cancel()
+
+    async def _send_batch(self, batch: list):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+        async with self._semaphore:
+            completion = await self._create_completion([prompt for prompt, _ in batch])
+
+        usage = getattr(completion, "usage", None)
+        if usage is not None:
+            self.token_usage.append({
+                "prompt_tokens": usage.prompt_tokens,
+                "completion_tokens": usage.completion_tokens,
+                "total_tokens": usage.total_tokens,
+            })
+        choices = {choice.index: choice for choice in completion.choices}
+        for index, (_, future) in enumerate(batch):
+            if future.done():
+                continue
+            if index not in choices:
+                future.set_exception(ValueError(f"No completion for prompt {index} of the batch"))
+                continue
+            # a malformed choice only fails its own prompt
+            try:
+                future.set_result([get_first_completion_token(choices[index])])
+            except Exception as e: # pylint: disable=broad-except
+                future.set_exception(e)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            batch = self._pending[:self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size:]
+            request = asyncio.ensure_future(self._send(batch))
+            self._requests.add(request)
+            request.add_done_callback(self._requests.discard)
+
+    async def generate_topk_per_token(self, text: str, history: Optional[List[str]] = None) -> List[Token]:
+        assert not history, "Completions judge model does not support history."
+        prompt = self.prompt_template.format(text=text)
+
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(self.model_name, "completions", prompt, self.temperature,
+                                            self.topk_per_token, sampled=self.temperature > 0)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return records_to_tokens(cached)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((prompt, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        tokens = await future
+
+        if cache_key is not None:
+            self.cache.set(cache_key, tokens_to_records(tokens))
+        return tokens
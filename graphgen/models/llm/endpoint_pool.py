@@ -0,0 +1,111 @@
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from openai import AsyncOpenAI, RateLimitError, APIConnectionError, InternalServerError
+
+from graphgen.utils import logger
+
+
+@dataclass
+class Endpoint:
+    base_url: str
+    api_key: str
+    client: AsyncOpenAI = None
+
+    outstanding: int = 0
+    latency: Optional[float] = None
+    failures: int = 0
+    ejected_until: float = 0.0
+    token_usage: list = field(default_factory=list)
+
+    def __post_init__(self):
+        if self.client is None:
+            self.client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(usage["total_tokens"] for usage in self.token_usage)
+
+
+@dataclass
+class EndpointPool:
+    """
+    A pool of OpenAI-compatible endpoints serving the same model.
+
+    Requests go to the healthy endpoint with the fewest outstanding requests ("least_outstanding")
+    or the lowest latency EWMA weighted by its queue ("latency"). An endpoint that fails
+    max_failures times in a row is ejected for eject_seconds.
+    """
+    endpoints: List[Endpoint]
+    strategy: str = "least_outstanding" # "least_outstanding" or "latency"
+    max_failures: int = 3
+    eject_seconds: float = 30.0
+    smoothing: float = 0.2
+
+    def __post_init__(self):
+        assert len(self.endpoints) > 0, "Please provide at least one endpoint."
+        assert self.strategy in ("least_outstanding", "latency"), f"Invalid strategy: {self.strategy}"
+
+    @classmethod
+    def from_urls(cls, base_urls: List[str], api_keys: List[str], **kwargs) -> "EndpointPool":
+        """
+        Build a pool from parallel lists of base urls and api keys.
+        A single api key is shared by all endpoints.
+        """
+        if len(api_keys) == 1:
+            api_keys = api_keys * len(base_urls)
+        assert len(api_keys) == len(base_urls), "Expect one api key, or one api key per base url."
+        return cls([Endpoint(base_url=url, api_key=key) for url, key in zip(base_urls, api_keys)], **kwargs)
+
+    def _score(self, endpoint: Endpoint) -> tuple:
+        if self.strategy == "latency":
+            return ((endpoint.latency or 0.0) * (endpoint.outstanding + 1), endpoint.outstanding)
+        return (endpoint.outstanding, endpoint.latency or 0.0)
+
+    def pick(self) -> Endpoint:
+        now = time.monotonic()
+        healthy = [endpoint for endpoint in self.endpoints if endpoint.ejected_until <= now]
+        if not healthy:
+            # every endpoint is ejected, fall back to the one that recovers first
+            return min(self.endpoints, key=lambda endpoint: endpoint.ejected_until)
+        return min(healthy, key=self._score)
+
+    @asynccontextmanager
+    async def endpoint(self):
+        endpoint = self.pick()
+        endpoint.outstanding += 1
+        start = time.monotonic()
+        try:
+            yield endpoint
+        except (RateLimitError, APIConnectionError, InternalServerError):
+            endpoint.failures += 1
+            if endpoint.failures >= self.max_failures:
+                endpoint.ejected_until = time.monotonic() + self.eject_seconds
+                logger.warning("Endpoint %s ejected for %ss after %d failures",
+                               endpoint.base_url, self.eject_seconds, endpoint.failures)
+            raise
+        else:
+            latency = time.monotonic() - start
+            if endpoint.latency is None:
+                endpoint.latency = latency
+            else:
+                endpoint.latency += self.smoothing * (latency - endpoint.latency)
+            endpoint.failures = 0
+        finally:
+            endpoint.outstanding -= 1
+
+    @property
+    def stats(self) -> List[dict]:
+        return [
+            {
+                "base_url": endpoint.base_url,
+                "outstanding": endpoint.outstanding,
+                "latency": endpoint.latency,
+                "requests": len(endpoint.token_usage),
+                "total_tokens": endpoint.total_tokens,
+                "ejected": endpoint.ejected_until > time.monotonic(),
+            }
+            for endpoint in self.endpoints
+        ]
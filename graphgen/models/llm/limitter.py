@@ -1,88 +1,183 @@
 import time
-from datetime import datetime, timedelta
 import asyncio
+from typing import Optional
 
 from graphgen.utils import logger
 
 
-class RPM:
+class TokenBucket:
+    """
+    Continuous token bucket shared by all coroutines of a client.
+
+    Tokens refill at `rate` per second up to `capacity`. A caller that needs more tokens
+    than are available waits just long enough for the deficit to refill, so requests are
+    spread evenly over time instead of bursting at wall-clock minute boundaries.
+    Waiters are served in FIFO order.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        assert rate > 0, "Refill rate must be positive."
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, amount: float = 1, silent: bool = False) -> float:
+        """
+        Wait until amount tokens are available and take them.
+
+        :param amount: tokens to take
+        :param silent: do not log the wait
+        :return: tokens taken, at most the capacity of the bucket
+        """
+        # a single request larger than the bucket can never fit, let it drain the bucket instead
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            self._refill()
+            deficit = amount - self.tokens
+            if deficit > 0:
+                sleep_time = deficit / self.rate
+                if not silent:
+                    logger.info('%s sleep %s', self.__class__.__name__, sleep_time)
+                await asyncio.sleep(sleep_time)
+                self._refill()
+            self.tokens -= amount
+        return amount
 
-    def __init__(self, rpm: int = 1000):
-        self.rpm = rpm
-        self.record = {'rpm_slot': self.get_minute_slot(), 'counter': 0}
+    def adjust(self, amount: float):
+        """
+        Correct the bucket after the real cost of a request is known.
 
-    def get_minute_slot(self):
-        current_time = time.time()
-        dt_object = datetime.fromtimestamp(current_time)
-        total_minutes_since_midnight = dt_object.hour * 60 + dt_object.minute
-        return total_minutes_since_midnight
+        :param amount: extra tokens to consume, negative to give tokens back
+        """
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
 
-    async def wait(self, silent=False):
-        current = time.time()
-        dt_object = datetime.fromtimestamp(current)
-        minute_slot = self.get_minute_slot()
-
-        if self.record['rpm_slot'] == minute_slot:
-            # check RPM exceed
-            if self.record['counter'] >= self.rpm:
-                # wait until next minute
-                next_minute = dt_object.replace(
-                    second=0, microsecond=0) + timedelta(minutes=1)
-                _next = next_minute.timestamp()
-                sleep_time = abs(_next - current)
-                if not silent:
-                    logger.info('RPM sleep %s', sleep_time)
-                await asyncio.sleep(sleep_time)
 
-                self.record = {
-                    'rpm_slot': self.get_minute_slot(),
-                    'counter': 0
-                }
-        else:
-            self.record = {'rpm_slot': self.get_minute_slot(), 'counter': 0}
-        self.record['counter'] += 1
+class RPM(TokenBucket):
 
+    def __init__(self, rpm: int = 1000, burst: Optional[int] = None):
+        self.rpm = rpm
+        super().__init__(rate=rpm / 60, capacity=burst or rpm)
+
+    async def wait(self, silent=False):
+        await self.acquire(1, silent=silent)
         if not silent:
-            logger.debug(self.record)
+            logger.debug('RPM tokens left %s', self.tokens)
 
 
-class TPM:
+class TPM(TokenBucket):
 
-    def __init__(self, tpm: int = 20000):
+    def __init__(self, tpm: int = 20000, burst: Optional[int] = None):
         self.tpm = tpm
-        self.record = {'tpm_slot': self.get_minute_slot(), 'counter': 0}
-
-    def get_minute_slot(self):
-        current_time = time.time()
-        dt_object = datetime.fromtimestamp(current_time)
-        total_minutes_since_midnight = dt_object.hour * 60 + dt_object.minute
-        return total_minutes_since_midnight
-
-    async def wait(self, token_count, silent=False):
-        current = time.time()
-        dt_object = datetime.fromtimestamp(current)
-        minute_slot = self.get_minute_slot()
-
-        # get next slot, skip
-        if self.record['tpm_slot'] != minute_slot:
-            self.record = {'tpm_slot': minute_slot, 'counter': token_count}
-            return
-
-        # check RPM exceed
-        self.record['counter'] += token_count
-        if self.record['counter'] > self.tpm:
-            # wait until next minute
-            next_minute = dt_object.replace(
-                second=0, microsecond=0) + timedelta(minutes=1)
-            _next = next_minute.timestamp()
-            sleep_time = abs(_next - current)
-            logger.info('TPM sleep %s', sleep_time)
-            await asyncio.sleep(sleep_time)
-
-            self.record = {
-                'tpm_slot': self.get_minute_slot(),
-                'counter': token_count
-            }
+        super().__init__(rate=tpm / 60, capacity=burst or tpm)
 
+    async def wait(self, token_count, silent=False) -> float:
+        reserved = await self.acquire(token_count, silent=silent)
         if not silent:
-            logger.debug(self.record)
+            logger.debug('TPM tokens left %s', self.tokens)
+        return reserved
+
+    def settle(self, reserved_tokens: float, actual_tokens: int):
+        """
+        Replace the reserved cost of a finished request with its actual usage.
+
+        :param reserved_tokens: tokens wait returned before the request, the estimate clamped to the capacity
+        :param actual_tokens: tokens reported by the response usage
+        """
+        self.adjust(actual_tokens - reserved_tokens)
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD controller of the number of in-flight requests of a client.
+
+    The limit grows additively (about +1 per limit-sized window of requests) while requests
+    succeed and the per-token latency stays within `latency_tolerance` times the best observed,
+    and is cut multiplicatively on overload errors such as 429s and timeouts, at most once per
+    round trip. Latency is tracked per request class, the power-of-two bucket of completion
+    tokens, as one-token judgements and long extractions differ by orders of magnitude per token.
+    """
+
+    def __init__(self, initial: int = 16, min_limit: int = 1, max_limit: int = 1000,
+                 decrease_factor: float = 0.5, latency_tolerance: float = 3.0, smoothing: float = 0.1):
+        assert 1 <= min_limit <= initial <= max_limit, "Expect min_limit <= initial <= max_limit."
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.smoothing = smoothing
+
+        self.in_flight = 0
+        self.latency = None
+        # smoothed and best latency per completion token by request class
+        self.token_latency = {}
+        self.best_token_latency = {}
+        self.successes = 0
+        self.overloads = 0
+        self._last_decrease = 0.0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, latency: float, tokens: int = 1, overloaded: bool = False, failed: bool = False):
+        """
+        Free a slot and feed the outcome of the request back into the limit.
+
+        :param latency: seconds the request took
+        :param tokens: completion tokens of the response, used to normalize latency
+        :param overloaded: whether the request failed because the server is overloaded
+        :param failed: whether the request failed for another reason, e.g. a bad request or a cancellation,
+                       which says nothing about the load so the limit is left as it is
+        """
+        old_limit = int(self.limit)
+        if overloaded:
+            self._on_overload()
+        elif not failed:
+            self._on_success(latency, tokens)
+
+        if int(self.limit) != old_limit:
+            logger.info("Adaptive concurrency limit %d -> %d (in flight %d, latency %.2fs, overloads %d)",
+                        old_limit, int(self.limit), self.in_flight, self.latency or 0.0, self.overloads)
+
+        async with self._cond:
+            self.in_flight -= 1
+            self._cond.notify(max(1, int(self.limit) - self.in_flight))
+
+    def _on_success(self, latency: float, tokens: int):
+        self.successes += 1
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += self.smoothing * (latency - self.latency)
+
+        tokens = max(tokens, 1)
+        request_class = tokens.bit_length()
+        token_latency = latency / tokens
+        if request_class in self.token_latency:
+            smoothed = self.token_latency[request_class]
+            token_latency = smoothed + self.smoothing * (token_latency - smoothed)
+        self.token_latency[request_class] = token_latency
+        best = min(self.best_token_latency.get(request_class, token_latency), token_latency)
+        self.best_token_latency[request_class] = best
+
+        if token_latency <= self.latency_tolerance * best:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def _on_overload(self):
+        self.overloads += 1
+        now = time.monotonic()
+        if now - self._last_decrease < (self.latency or 0.0):
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * self.decrease_factor)
@@ -0,0 +1,109 @@
+import os
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass, asdict
+from typing import Any, List, Union
+
+from graphgen.utils import logger, load_json, write_json, compute_args_hash
+from graphgen.models.storage.base_storage import StorageNameSpace
+from graphgen.models.llm.topk_token_model import Token
+
+
+def tokens_to_records(tokens: List[Token]) -> List[dict]:
+    return [asdict(token) for token in tokens]
+
+
+def records_to_tokens(records: List[dict]) -> List[Token]:
+    return [
+        Token(
+            text=record["text"],
+            prob=record["prob"],
+            top_candidates=records_to_tokens(record.get("top_candidates", [])),
+            ppl=record.get("ppl"),
+        )
+        for record in records
+    ]
+
+
+@dataclass
+class LLMCache(StorageNameSpace):
+    """
+    Content-addressed on-disk cache of LLM responses.
+
+    Keys are the hash of every request argument that affects the response, so the same
+    cache can be shared by several clients. Entries are evicted in LRU order once
+    max_entries is exceeded. In replay mode the cache is read-only and a miss raises
+    instead of reaching the API.
+    """
+    namespace: str = "llm_cache"
+    max_entries: int = 100000
+    replay: bool = False
+
+    def __post_init__(self):
+        self._file_name = os.path.join(self.working_dir, f"{self.namespace}.json")
+        self._data = OrderedDict(load_json(self._file_name) or {})
+        self._occurrences = defaultdict(int)
+        self._changed = False
+        self.hits = 0
+        self.misses = 0
+        logger.info("Load LLM cache %s with %d entries", self.namespace, len(self._data))
+
+    def make_key(self, *args, sampled: bool = False) -> str:
+        """
+        Build the cache key of a request.
+
+        Sampled requests (temperature > 0) that are issued several times in one run are told
+        apart by their occurrence index, so repeated samples are not collapsed into one response.
+
+        :param args: request arguments
+        :param sampled: whether the request is sampled
+        :return: cache key
+        """
+        key = compute_args_hash(*args)
+        if sampled:
+            index = self._occurrences[key]
+            self._occurrences[key] += 1
+            key = compute_args_hash(key, index)
+        return key
+
+    def get(self, key: str) -> Union[Any, None]:
+        if key not in self._data:
+            self.misses += 1
+            if self.replay:
+                raise LookupError(f"LLM cache miss in replay mode: {key}")
+            return None
+        self.hits += 1
+        if not self.replay:
+            # hits only reorder the entries in memory, the order is written with the next new entry
+            self._data.move_to_end(key)
+        return self._data[key]
+
+    def set(self, key: str, value: Any):
+        if self.replay:
+            return
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+        self._changed = True
+
+    @property
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    async def index_done_callback(self):
+        logger.info("LLM cache %s stats: %s", self.namespace, self.stats)
+        if self.replay or not self._changed:
+            return
+        write_json(self._data, self._file_name)
+        self._changed = False
+
+    async def drop(self):
+        self._data = OrderedDict()
+        self._occurrences = defaultdict(int)
+        self._changed = True
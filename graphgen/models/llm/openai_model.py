@@ -1,8 +1,9 @@
 import math
+import time
 from dataclasses import dataclass, field
 from typing import List, Dict, Optional
 import openai
-from openai import AsyncOpenAI, RateLimitError, APIConnectionError, APITimeoutError
+from openai import AsyncOpenAI, RateLimitError, APIConnectionError, APITimeoutError, InternalServerError
 from tenacity import (
     retry,
     stop_after_attempt,
@@ -12,7 +13,12 @@ from tenacity import (
 
 from graphgen.models.llm.topk_token_model import TopkTokenModel, Token
 from graphgen.models.llm.tokenizer import Tokenizer
-from graphgen.models.llm.limitter import RPM, TPM
+from graphgen.models.llm.limitter import RPM, TPM, AdaptiveConcurrency
+from graphgen.models.llm.llm_cache import LLMCache, tokens_to_records, records_to_tokens
+from graphgen.models.llm.endpoint_pool import EndpointPool
+
+# errors that mean the server is overloaded, they are retried and cut the adaptive concurrency limit
+OVERLOAD_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
 
 def get_top_response_tokens(response: openai.ChatCompletion) -> List[Token]:
     token_logprobs = response.choices[0].logprobs.content
@@ -42,8 +48,16 @@ class OpenAIModel(TopkTokenModel):
     rpm: RPM = field(default_factory=lambda: RPM(rpm=1000))
     tpm: TPM = field(default_factory=lambda: TPM(tpm=50000))
 
+    cache: LLMCache = None
+    tokenizer: Tokenizer = None
+    concurrency: AdaptiveConcurrency = None
+    # replicas of the same model, requests are load balanced across them instead of base_url
+    endpoint_pool: EndpointPool = None
 
     def __post_init__(self):
+        if self.endpoint_pool is not None:
+            self.client = None
+            return
         assert self.api_key is not None, "Please provide api key to access openai api."
         self.client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
 
@@ -70,12 +84,85 @@ class OpenAIModel(TopkTokenModel):
         kwargs['messages']= messages
         return kwargs
 
+    def _cache_key(self, kwargs: Dict) -> Optional[str]:
+        if self.cache is None:
+            return None
+        return self.cache.make_key(
+            self.model_name,
+            kwargs["messages"],
+            kwargs["temperature"],
+            kwargs["top_p"],
+            kwargs["max_tokens"],
+            kwargs.get("seed"),
+            kwargs.get("response_format"),
+            kwargs.get("logprobs"),
+            kwargs.get("top_logprobs"),
+            sampled=kwargs["temperature"] > 0,
+        )
 
     @retry(
         stop=stop_after_attempt(5),
         wait=wait_exponential(multiplier=1, min=4, max=10),
-        retry=retry_if_exception_type((RateLimitError, APIConnectionError, APITimeoutError)),
+        retry=retry_if_exception_type(OVERLOAD_ERRORS),
     )
+    async def _create_completion(self, kwargs: Dict) -> openai.ChatCompletion:
+        """
+        Send a chat completion request, holding rate limit tokens for the estimated cost and
+        settling them against the actual usage once the response arrives.
+        Retries only resend the request, so the cache key of the call is built once.
+        """
+        reserved_tokens = 0
+        if self.request_limit:
+            if self.tokenizer is None:
+                self.tokenizer = Tokenizer()
+            prompt_tokens = sum(self.tokenizer.count_tokens(message['content']) for message in kwargs['messages'])
+            estimated_tokens = prompt_tokens + kwargs['max_tokens']
+
+            await self.rpm.wait(silent=True)
+            reserved_tokens = await self.tpm.wait(estimated_tokens, silent=True)
+
+        if self.concurrency is not None:
+            await self.concurrency.acquire()
+        start = time.monotonic()
+        endpoint = None
+        try:
+            if self.endpoint_pool is not None:
+                async with self.endpoint_pool.endpoint() as endpoint:
+                    completion = await endpoint.client.chat.completions.create( # pylint: disable=E1125
+                        model=self.model_name,
+                        **kwargs
+                    )
+            else:
+                completion = await self.client.chat.completions.create( # pylint: disable=E1125
+                    model=self.model_name,
+                    **kwargs
+                )
+        except BaseException as e:
+            # also on cancellation, otherwise the concurrency slot is never freed
+            if self.request_limit:
+                self.tpm.settle(reserved_tokens, 0)
+            if self.concurrency is not None:
+                await self.concurrency.release(time.monotonic() - start,
+                                               overloaded=isinstance(e, OVERLOAD_ERRORS), failed=True)
+            raise
+
+        usage = getattr(completion, "usage", None)
+        if self.concurrency is not None:
+            await self.concurrency.release(time.monotonic() - start,
+                                           tokens=usage.completion_tokens if usage is not None else 1)
+        if usage is not None:
+            usage = {
+                "prompt_tokens": usage.prompt_tokens,
+                "completion_tokens": usage.completion_tokens,
+                "total_tokens": usage.total_tokens,
+            }
+            self.token_usage.append(usage)
+            if endpoint is not None:
+                endpoint.token_usage.append(usage)
+            if self.request_limit:
+                self.tpm.settle(reserved_tokens, usage["total_tokens"])
+        return completion
+
     async def generate_topk_per_token(self, text: str, history: Optional[List[str]] = None) -> List[Token]:
         kwargs = self._pre_generate(text, history)
         if self.topk_per_token > 0:
@@ -85,44 +172,35 @@ class OpenAIModel(TopkTokenModel):
         # Limit max_tokens to 1 to avoid long completions
         kwargs["max_tokens"] = 1
 
-        completion = await self.client.chat.completions.create( # pylint: disable=E1125
-            model=self.model_name,
-            **kwargs
-        )
+        cache_key = self._cache_key(kwargs)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return records_to_tokens(cached)
+
+        completion = await self._create_completion(kwargs)
 
         tokens = get_top_response_tokens(completion)
 
+        if cache_key is not None:
+            self.cache.set(cache_key, tokens_to_records(tokens))
         return tokens
 
-    @retry(
-        stop=stop_after_attempt(5),
-        wait=wait_exponential(multiplier=1, min=4, max=10),
-        retry=retry_if_exception_type((RateLimitError, APIConnectionError, APITimeoutError)),
-    )
     async def generate_answer(self, text: str, history: Optional[List[str]] = None, temperature: int = 0) -> str:
         kwargs = self._pre_generate(text, history)
         kwargs["temperature"] = temperature
 
-        prompt_tokens = 0
-        for message in kwargs['messages']:
-            prompt_tokens += len(Tokenizer().encode_string(message['content']))
-        estimated_tokens = prompt_tokens + kwargs['max_tokens']
-
-        if self.request_limit:
-            await self.rpm.wait(silent=True)
-            await self.tpm.wait(estimated_tokens, silent=True)
-
-        completion = await self.client.chat.completions.create( # pylint: disable=E1125
-            model=self.model_name,
-            **kwargs
-        )
-        if hasattr(completion, "usage"):
-            self.token_usage.append({
-                "prompt_tokens": completion.usage.prompt_tokens,
-                "completion_tokens": completion.usage.completion_tokens,
-                "total_tokens": completion.usage.total_tokens,
-            })
-        return completion.choices[0].message.content
+        cache_key = self._cache_key(kwargs)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        completion = await self._create_completion(kwargs)
+        answer = completion.choices[0].message.content
+        if cache_key is not None:
+            self.cache.set(cache_key, answer)
+        return answer
 
     async def generate_inputs_prob(self, text: str, history: Optional[List[str]] = None) -> List[Token]:
         raise NotImplementedError
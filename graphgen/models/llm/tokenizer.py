@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import List
 import tiktoken
 
@@ -10,6 +11,7 @@ except ImportError:
     TRANSFORMERS_AVAILABLE = False
 
 
+@lru_cache(maxsize=None)
 def get_tokenizer(tokenizer_name: str = "cl100k_base"):
     """
     Get a tokenizer instance by name.
@@ -30,9 +32,23 @@ def get_tokenizer(tokenizer_name: str = "cl100k_base"):
 @dataclass
 class Tokenizer:
     model_name: str = "cl100k_base"
+    count_cache_size: int = 65536
 
     def __post_init__(self):
         self.tokenizer = get_tokenizer(self.model_name)
+        self._count_tokens = lru_cache(maxsize=self.count_cache_size)(self._count)
+
+    def _count(self, text: str) -> int:
+        return len(self.tokenizer.encode(text))
+
+    def count_tokens(self, text: str) -> int:
+        """
+        Count tokens of text, memoizing repeated strings such as templates and history turns
+
+        :param text
+        :return: number of tokens
+        """
+        return self._count_tokens(text)
 
     def encode_string(self, text: str) -> List[int]:
         """
@@ -52,22 +68,71 @@ class Tokenizer:
         """
         return self.tokenizer.decode(tokens)
 
-    def chunk_by_token_size(
-        self, content: str, overlap_token_size=128, max_token_size=1024
-    ):
-        tokens = self.encode_string(content)
-        results = []
-        for index, start in enumerate(
-            range(0, len(tokens), max_token_size - overlap_token_size)
-        ):
-            chunk_content = self.decode_tokens(
-                tokens[start : start + max_token_size]
-            )
-            results.append(
+    def encode_batch(self, texts: List[str], num_threads: int = 8) -> List[List[int]]:
+        """
+        Encode texts at once, in native threads with tiktoken or a fast Hugging Face tokenizer
+
+        :param texts
+        :param num_threads: threads of tiktoken
+        :return: tokens of each text
+        """
+        if not texts:
+            return []
+        if hasattr(self.tokenizer, "encode_batch"):
+            return self.tokenizer.encode_batch(texts, num_threads=num_threads)
+        if getattr(self.tokenizer, "is_fast", False):
+            return self.tokenizer(texts)["input_ids"]
+        return [self.tokenizer.encode(text) for text in texts]
+
+    def decode_batch(self, token_lists: List[List[int]], num_threads: int = 8) -> List[str]:
+        """
+        Decode token lists at once, in native threads with tiktoken or a fast Hugging Face tokenizer
+
+        :param token_lists
+        :param num_threads: threads of tiktoken
+        :return: text of each token list
+        """
+        if not token_lists:
+            return []
+        if hasattr(self.tokenizer, "decode_batch"):
+            return self.tokenizer.decode_batch(token_lists, num_threads=num_threads)
+        if getattr(self.tokenizer, "is_fast", False):
+            return self.tokenizer.batch_decode(token_lists)
+        return [self.tokenizer.decode(tokens) for tokens in token_lists]
+
+    def chunk_documents(
+        self, contents: List[str], overlap_token_size=128, max_token_size=1024, num_threads: int = 8
+    ) -> List[List[dict]]:
+        """
+        Split documents into windows of max_token_size tokens overlapping by overlap_token_size,
+        encoding all documents and decoding all windows in two batch calls
+
+        :param contents: documents
+        :param overlap_token_size
+        :param max_token_size
+        :param num_threads: threads of tiktoken
+        :return: chunks of each document, see chunk_by_token_size
+        """
+        step = max_token_size - overlap_token_size
+        windows = []
+        for doc_index, tokens in enumerate(self.encode_batch(contents, num_threads)):
+            for index, start in enumerate(range(0, len(tokens), step)):
+                windows.append((doc_index, index, min(max_token_size, len(tokens) - start),
+                                tokens[start : start + max_token_size]))
+
+        results = [[] for _ in contents]
+        texts = self.decode_batch([window[3] for window in windows], num_threads)
+        for (doc_index, index, token_count, _), chunk_content in zip(windows, texts):
+            results[doc_index].append(
                 {
-                    "tokens": min(max_token_size, len(tokens) - start),
+                    "tokens": token_count,
                     "content": chunk_content.strip(),
                     "chunk_order_index": index,
                 }
             )
         return results
+
+    def chunk_by_token_size(
+        self, content: str, overlap_token_size=128, max_token_size=1024
+    ):
+        return self.chunk_documents([content], overlap_token_size, max_token_size)[0]
@@ -38,6 +38,9 @@ class BaseKVStorage(Generic[T], StorageNameSpace):
     async def upsert(self, data: dict[str, T]):
         raise NotImplementedError
 
+    async def delete(self, ids: list[str]):
+        raise NotImplementedError
+
     async def drop(self):
         raise NotImplementedError
 
@@ -77,6 +80,14 @@ class BaseGraphStorage(StorageNameSpace):
     async def get_all_edges(self) -> Union[list[dict], None]:
         raise NotImplementedError
 
+    async def get_dirty_nodes(self) -> list[tuple[str, dict]]:
+        """return the nodes without a loss, new ones and the ones whose description changed since judged"""
+        raise NotImplementedError
+
+    async def get_dirty_edges(self) -> list[tuple[str, str, dict]]:
+        """return the edges without a loss, new ones and the ones whose description changed since judged"""
+        raise NotImplementedError
+
     async def get_node_edges(
         self, source_node_id: str
     ) -> Union[list[tuple[str, str]], None]:
@@ -92,3 +103,18 @@ class BaseGraphStorage(StorageNameSpace):
 
     async def delete_node(self, node_id: str):
         raise NotImplementedError
+
+    @staticmethod
+    def invalidate_loss(data: dict, old_description: Union[str, None], new_data: dict) -> bool:
+        """
+        Drop the loss of merged node or edge data when the update changed its description, as the loss was
+        judged for the old one.
+
+        :param data: node or edge data after the update
+        :param old_description: description before the update
+        :param new_data: data of the update
+        :return: whether the node or edge is dirty, i.e. has no loss
+        """
+        if "loss" not in new_data and new_data.get("description", old_description) != old_description:
+            data.pop("loss", None)
+        return data.get("loss") is None
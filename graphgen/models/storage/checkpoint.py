@@ -0,0 +1,50 @@
+import time
+import asyncio
+from dataclasses import dataclass, field
+
+from .base_storage import BaseKVStorage, StorageNameSpace
+
+
+@dataclass
+class Checkpoint:
+    """
+    Checkpoint of a running stage.
+
+    The result of every finished unit (a chunk, a QA batch) is saved in storage under prefix + key, and storage
+    is flushed together with flush_storages at most every interval seconds, so an interrupted run loses at most
+    interval seconds of work and a resumed run loads finished units instead of recomputing them. Once the stage
+    has committed its results the saved units are no longer needed and `clear` deletes them.
+    """
+    storage: BaseKVStorage = None
+    flush_storages: list[StorageNameSpace] = field(default_factory=list)
+    interval: float = 60.0
+    prefix: str = ""
+
+    def __post_init__(self):
+        self._last_flush = time.monotonic()
+
+    async def load(self, key: str):
+        if self.storage is None:
+            return None
+        return await self.storage.get_by_id(self.prefix + key)
+
+    async def save(self, key: str, value):
+        if self.storage is not None:
+            await self.storage.upsert({self.prefix + key: value})
+        await self.step()
+
+    async def step(self):
+        if time.monotonic() - self._last_flush >= self.interval:
+            await self.flush()
+
+    async def flush(self):
+        storages = self.flush_storages + ([self.storage] if self.storage is not None else [])
+        await asyncio.gather(*[storage.index_done_callback() for storage in storages])
+        self._last_flush = time.monotonic()
+
+    async def clear(self):
+        if self.storage is None:
+            return
+        keys = [key for key in await self.storage.all_keys() if key.startswith(self.prefix)]
+        await self.storage.delete(keys)
+        await self.storage.index_done_callback()
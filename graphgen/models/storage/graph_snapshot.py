@@ -0,0 +1,196 @@
+"""
+Binary snapshot of a networkx graph.
+
+Layout (little-endian):
+
+    magic b"GGSNAP", version uint16, directed uint8
+    string table: count uint32, utf-8 byte size uint64, character lengths uint32[count], utf-8 text
+    node table:   count uint32, node id string indices uint32[count], attribute columns
+    edge table:   count uint32, source and target node indices uint32[count] each, attribute columns
+
+Every node id, attribute name and string value is interned in the string table once. An attribute column is
+the attribute name followed by one sparse section per value type (str, int, float, bool, json): the number of
+rows holding a value of that type, their row indices and the values. Sections are plain arrays, so loading is
+a handful of `array.frombytes` calls plus building the attribute dicts.
+"""
+
+import sys
+import json
+import struct
+from array import array
+from itertools import accumulate
+from typing import BinaryIO
+
+import networkx as nx
+
+MAGIC = b"GGSNAP"
+VERSION = 1
+
+STR, INT, FLOAT, BOOL, JSON = range(5)
+TYPECODES = {STR: "I", INT: "q", FLOAT: "d", BOOL: "B", JSON: "I"}
+
+
+class _Writer:
+    def __init__(self):
+        self.strings: dict[str, int] = {}
+        self.chunks: list[bytes] = []
+
+    def intern(self, text: str) -> int:
+        index = self.strings.get(text)
+        if index is None:
+            index = self.strings[text] = len(self.strings)
+        return index
+
+    def pack(self, fmt: str, *values):
+        self.chunks.append(struct.pack("<" + fmt, *values))
+
+    def array(self, typecode: str, values) -> None:
+        arr = array(typecode, values)
+        if sys.byteorder != "little":
+            arr.byteswap()
+        self.chunks.append(arr.tobytes())
+
+    def columns(self, rows: list[dict]):
+        columns: dict[str, dict[int, tuple[list, list]]] = {}
+        for row, attrs in enumerate(rows):
+            for key, value in attrs.items():
+                column = columns.setdefault(key, {kind: ([], []) for kind in TYPECODES})
+                if isinstance(value, str):
+                    kind, value = STR, self.intern(value)
+                elif isinstance(value, bool): # before int, bool is a subclass of int
+                    kind = BOOL
+                elif isinstance(value, int) and -2 ** 63 <= value < 2 ** 63:
+                    kind = INT
+                elif isinstance(value, float):
+                    kind = FLOAT
+                else:
+                    kind, value = JSON, self.intern(json.dumps(value, ensure_ascii=False))
+                column[kind][0].append(row)
+                column[kind][1].append(value)
+
+        self.pack("I", len(columns))
+        for key, column in columns.items():
+            self.pack("I", self.intern(key))
+            for kind, (row_indices, values) in column.items():
+                self.pack("I", len(row_indices))
+                self.array("I", row_indices)
+                self.array(TYPECODES[kind], values)
+
+
+class _Reader:
+    def __init__(self, buffer: bytes):
+        self.buffer = memoryview(buffer)
+        self.offset = 0
+        self.strings: list[str] = []
+
+    def unpack(self, fmt: str):
+        values = struct.unpack_from("<" + fmt, self.buffer, self.offset)
+        self.offset += struct.calcsize("<" + fmt)
+        return values
+
+    def array(self, typecode: str, count: int) -> array:
+        arr = array(typecode)
+        size = arr.itemsize * count
+        arr.frombytes(self.buffer[self.offset:self.offset + size])
+        if sys.byteorder != "little":
+            arr.byteswap()
+        self.offset += size
+        return arr
+
+    def read_strings(self):
+        count, byte_size = self.unpack("IQ")
+        lengths = self.array("I", count)
+        text = bytes(self.buffer[self.offset:self.offset + byte_size]).decode("utf-8")
+        self.offset += byte_size
+        ends = list(accumulate(lengths))
+        starts = [0] + ends[:-1]
+        self.strings = [text[start:end] for start, end in zip(starts, ends)]
+
+    def columns(self, rows: list[dict]):
+        strings = self.strings
+        (column_count,) = self.unpack("I")
+        for _ in range(column_count):
+            (key_index,) = self.unpack("I")
+            key = strings[key_index]
+            for kind, typecode in TYPECODES.items():
+                (count,) = self.unpack("I")
+                row_indices = self.array("I", count)
+                values = self.array(typecode, count)
+                if kind == STR:
+                    values = [strings[i] for i in values]
+                elif kind == BOOL:
+                    values = [bool(v) for v in values]
+                elif kind == JSON:
+                    values = [json.loads(strings[i]) for i in values]
+                for row, value in zip(row_indices, values):
+                    rows[row][key] = value
+
+
+def write_snapshot(graph: nx.Graph, f: BinaryIO):
+    """
+    Write the graph as a binary snapshot.
+
+    :param graph: graph to write
+    :param f: file opened in binary write mode
+    """
+    body = _Writer()
+    node_ids = list(graph.nodes)
+    node_index = {node_id: i for i, node_id in enumerate(node_ids)}
+    body.pack("I", len(node_ids))
+    body.array("I", [body.intern(str(node_id)) for node_id in node_ids])
+    body.columns([graph.nodes[node_id] for node_id in node_ids])
+
+    edges = list(graph.edges(data=True))
+    body.pack("I", len(edges))
+    body.array("I", [node_index[src] for src, _, _ in edges])
+    body.array("I", [node_index[tgt] for _, tgt, _ in edges])
+    body.columns([data for _, _, data in edges])
+
+    # the string table goes first but is only complete once the body is written
+    header = _Writer()
+    strings = list(body.strings)
+    text = "".join(strings).encode("utf-8")
+    header.chunks.append(MAGIC)
+    header.pack("HB", VERSION, graph.is_directed())
+    header.pack("IQ", len(strings), len(text))
+    header.array("I", [len(s) for s in strings])
+    header.chunks.append(text)
+
+    for chunk in header.chunks + body.chunks:
+        f.write(chunk)
+
+
+def read_snapshot(f: BinaryIO) -> nx.Graph:
+    """
+    Read a graph written by write_snapshot.
+
+    :param f: file opened in binary read mode
+    :return: graph
+    """
+    reader = _Reader(f.read())
+    if bytes(reader.buffer[:len(MAGIC)]) != MAGIC:
+        raise ValueError("Not a graph snapshot")
+    reader.offset = len(MAGIC)
+    version, directed = reader.unpack("HB")
+    if version != VERSION:
+        raise ValueError(f"Unsupported graph snapshot version: {version}")
+    reader.read_strings()
+    strings = reader.strings
+
+    (node_count,) = reader.unpack("I")
+    node_ids = [strings[i] for i in reader.array("I", node_count)]
+    node_attrs = [{} for _ in range(node_count)]
+    reader.columns(node_attrs)
+
+    (edge_count,) = reader.unpack("I")
+    sources = reader.array("I", edge_count)
+    targets = reader.array("I", edge_count)
+    edge_attrs = [{} for _ in range(edge_count)]
+    reader.columns(edge_attrs)
+
+    graph = nx.DiGraph() if directed else nx.Graph()
+    graph.add_nodes_from(zip(node_ids, node_attrs))
+    graph.add_edges_from(
+        (node_ids[src], node_ids[tgt], attrs) for src, tgt, attrs in zip(sources, targets, edge_attrs)
+    )
+    return graph
@@ -47,5 +47,9 @@ class JsonKVStorage(BaseKVStorage):
         self._data.update(left_data)
         return left_data
 
+    async def delete(self, ids: list[str]):
+        for id in ids:
+            self._data.pop(id, None)
+
     async def drop(self):
         self._data = {}
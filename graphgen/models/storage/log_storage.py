@@ -0,0 +1,169 @@
+import os
+import json
+from dataclasses import dataclass
+
+from graphgen.utils import logger, load_json
+from graphgen.models.storage.base_storage import BaseKVStorage
+
+
+@dataclass
+class LogKVStorage(BaseKVStorage):
+    """
+    Append-only log-structured KV storage.
+
+    Each record is one line `<json key>\\t<json value>` in `{namespace}.log`; the last record of a key wins and
+    a null value is a tombstone written by `delete`. Only an offset index is kept in memory and values are read
+    from disk on demand, so loading decodes keys only and `index_done_callback` appends just the records upserted
+    or deleted since the last call. The log is rewritten without deleted records once the stale records make up
+    more than compact_ratio of it.
+    """
+    compact_ratio: float = 0.5
+
+    def __post_init__(self):
+        self._file_name = os.path.join(self.working_dir, f"{self.namespace}.log")
+        self._index: dict[str, tuple[int, int]] = {}
+        self._pending: dict = {}
+        self._records = 0
+        self._reader = None
+        self._load()
+        logger.info("Load KV %s with %d data", self.namespace, len(self))
+
+    def _load(self):
+        if not os.path.exists(self._file_name):
+            # migrate the namespace from JsonKVStorage on first use
+            self._pending = load_json(os.path.join(self.working_dir, f"{self.namespace}.json")) or {}
+            return
+        offset = 0
+        valid_end = 0
+        with open(self._file_name, "rb") as f:
+            for line in f:
+                length = len(line)
+                if not line.endswith(b"\n"):
+                    # a torn write at the tail from an interrupted flush
+                    logger.warning("Drop incomplete record at the end of %s", self._file_name)
+                    break
+                key, value = line.split(b"\t", 1)
+                key = json.loads(key)
+                if value.rstrip(b"\n") == b"null":
+                    self._index.pop(key, None)
+                else:
+                    self._index[key] = (offset, length)
+                self._records += 1
+                offset += length
+                valid_end = offset
+        if valid_end != os.path.getsize(self._file_name):
+            with open(self._file_name, "r+b") as f:
+                f.truncate(valid_end)
+
+    def __len__(self):
+        return len(self._keys())
+
+    def _has(self, key: str) -> bool:
+        if key in self._pending:
+            return self._pending[key] is not None
+        return key in self._index
+
+    def _read(self, key: str):
+        if key in self._pending:
+            return self._pending[key]
+        position = self._index.get(key)
+        if position is None:
+            return None
+        offset, length = position
+        if self._reader is None:
+            self._reader = open(self._file_name, "rb") # pylint: disable=consider-using-with
+        self._reader.seek(offset)
+        line = self._reader.read(length)
+        return json.loads(line.split(b"\t", 1)[1])
+
+    def _close_reader(self):
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+    @property
+    def data(self):
+        return {key: self._read(key) for key in self._keys()}
+
+    def _keys(self) -> list[str]:
+        keys = [k for k in self._index if self._has(k)]
+        return keys + [k for k, v in self._pending.items() if k not in self._index and v is not None]
+
+    async def all_keys(self) -> list[str]:
+        return self._keys()
+
+    async def index_done_callback(self):
+        if not self._pending:
+            return
+        os.makedirs(self.working_dir, exist_ok=True)
+        with open(self._file_name, "ab") as f:
+            offset = f.tell()
+            for key, value in self._pending.items():
+                line = (json.dumps(key, ensure_ascii=False) + "\t" +
+                        json.dumps(value, ensure_ascii=False) + "\n").encode("utf-8")
+                f.write(line)
+                if value is None:
+                    self._index.pop(key, None)
+                else:
+                    self._index[key] = (offset, len(line))
+                offset += len(line)
+                self._records += 1
+        self._pending = {}
+
+        if self._records > 0 and 1 - len(self._index) / self._records > self.compact_ratio:
+            self.compact()
+
+    def compact(self):
+        """
+        Rewrite the log keeping only the live record of each key.
+        """
+        self._close_reader()
+        tmp_file_name = self._file_name + ".tmp"
+        new_index = {}
+        offset = 0
+        with open(self._file_name, "rb") as src, open(tmp_file_name, "wb") as dst:
+            for key, (old_offset, length) in self._index.items():
+                src.seek(old_offset)
+                dst.write(src.read(length))
+                new_index[key] = (offset, length)
+                offset += length
+        os.replace(tmp_file_name, self._file_name)
+        logger.info("Compact KV %s from %d to %d records", self.namespace, self._records, len(new_index))
+        self._index = new_index
+        self._records = len(new_index)
+
+    async def get_by_id(self, id):
+        return self._read(id)
+
+    async def get_by_ids(self, ids, fields=None) -> list:
+        values = [self._read(id) for id in ids]
+        if fields is None:
+            return values
+        return [
+            {k: v for k, v in value.items() if k in fields} if value else None
+            for value in values
+        ]
+
+    async def filter_keys(self, data: list[str]) -> set[str]:
+        return {s for s in data if not self._has(s)}
+
+    async def upsert(self, data: dict):
+        left_data = {k: v for k, v in data.items() if not self._has(k)}
+        self._pending.update(left_data)
+        return left_data
+
+    async def delete(self, ids: list[str]):
+        for id in ids:
+            if id in self._index:
+                self._pending[id] = None
+            else:
+                self._pending.pop(id, None)
+
+    async def drop(self):
+        self._close_reader()
+        self._index = {}
+        self._pending = {}
+        self._records = 0
+        if os.path.exists(self._file_name):
+            with open(self._file_name, "wb"):
+                pass
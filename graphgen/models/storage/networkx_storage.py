@@ -6,6 +6,7 @@ import networkx as nx
 
 from graphgen.utils import logger
 from .base_storage import BaseGraphStorage
+from .graph_snapshot import read_snapshot, write_snapshot
 
 @dataclass
 class NetworkXStorage(BaseGraphStorage):
@@ -20,6 +21,21 @@ class NetworkXStorage(BaseGraphStorage):
         logger.info("Writing graph with %d nodes, %d edges", graph.number_of_nodes(), graph.number_of_edges())
         nx.write_graphml(graph, file_name)
 
+    @staticmethod
+    def load_snapshot(file_name) -> Optional[nx.Graph]:
+        if os.path.exists(file_name):
+            with open(file_name, "rb") as f:
+                return read_snapshot(f)
+        return None
+
+    @staticmethod
+    def write_snapshot(graph: nx.Graph, file_name):
+        logger.info("Writing graph with %d nodes, %d edges", graph.number_of_nodes(), graph.number_of_edges())
+        tmp_file_name = file_name + ".tmp"
+        with open(tmp_file_name, "wb") as f:
+            write_snapshot(graph, f)
+        os.replace(tmp_file_name, file_name)
+
     @staticmethod
     def stable_largest_connected_component(graph: nx.Graph) -> nx.Graph:
         """Refer to https://github.com/microsoft/graphrag/index/graph/utils/stable_lcc.py
@@ -70,20 +86,53 @@ class NetworkXStorage(BaseGraphStorage):
     def __post_init__(self):
         """
         如果图文件存在，则加载图文件，否则创建一个新图
+        The graph is persisted as a binary snapshot, a GraphML file from an older run is loaded once and
+        migrated on the next write.
         """
+        self._snapshot_file = os.path.join(
+            self.working_dir, f"{self.namespace}.snapshot"
+        )
         self._graphml_xml_file = os.path.join(
             self.working_dir, f"{self.namespace}.graphml"
         )
-        preloaded_graph = NetworkXStorage.load_nx_graph(self._graphml_xml_file)
+        preloaded_file = self._snapshot_file
+        preloaded_graph = NetworkXStorage.load_snapshot(self._snapshot_file)
+        if preloaded_graph is None:
+            preloaded_file = self._graphml_xml_file
+            preloaded_graph = NetworkXStorage.load_nx_graph(self._graphml_xml_file)
         if preloaded_graph is not None:
             logger.info(
-                "Loaded graph from %s with %d nodes, %d edges", self._graphml_xml_file,
+                "Loaded graph from %s with %d nodes, %d edges", preloaded_file,
                 preloaded_graph.number_of_nodes(), preloaded_graph.number_of_edges()
             )
         self._graph = preloaded_graph or nx.Graph()
+        # nodes and edges without a loss, kept up to date by the upserts and updates
+        self._dirty_nodes = {node_id for node_id, data in self._graph.nodes(data=True) if data.get("loss") is None}
+        self._dirty_edges = {
+            self._edge_key(src, tgt) for src, tgt, data in self._graph.edges(data=True) if data.get("loss") is None
+        }
+
+    @staticmethod
+    def _edge_key(source_node_id: str, target_node_id: str) -> tuple:
+        return tuple(sorted((source_node_id, target_node_id)))
+
+    @staticmethod
+    def _mark(dirty: set, key, data: dict, old_description: Optional[str], new_data: dict):
+        if BaseGraphStorage.invalidate_loss(data, old_description, new_data):
+            dirty.add(key)
+        else:
+            dirty.discard(key)
 
     async def index_done_callback(self):
-        NetworkXStorage.write_nx_graph(self._graph, self._graphml_xml_file)
+        NetworkXStorage.write_snapshot(self._graph, self._snapshot_file)
+
+    async def export_graphml(self, file_name: str = None):
+        """
+        Export the graph as GraphML.
+
+        :param file_name: output file, `{namespace}.graphml` in the working dir by default
+        """
+        NetworkXStorage.write_nx_graph(self._graph, file_name or self._graphml_xml_file)
 
     async def has_node(self, node_id: str) -> bool:
         return self._graph.has_node(node_id)
@@ -111,6 +160,12 @@ class NetworkXStorage(BaseGraphStorage):
     async def get_all_edges(self) -> Union[list[dict], None]:
         return self._graph.edges(data=True)
 
+    async def get_dirty_nodes(self) -> list[tuple[str, dict]]:
+        return [(node_id, self._graph.nodes[node_id]) for node_id in self._dirty_nodes]
+
+    async def get_dirty_edges(self) -> list[tuple[str, str, dict]]:
+        return [(src, tgt, self._graph.edges[src, tgt]) for src, tgt in self._dirty_edges]
+
     async def get_node_edges(self, source_node_id: str) -> Union[list[tuple[str, str]], None]:
         if self._graph.has_node(source_node_id):
             return list(self._graph.edges(source_node_id, data=True))
@@ -120,22 +175,32 @@ class NetworkXStorage(BaseGraphStorage):
         return self._graph
 
     async def upsert_node(self, node_id: str, node_data: dict[str, str]):
+        old_description = self._graph.nodes[node_id].get("description") if self._graph.has_node(node_id) else None
         self._graph.add_node(node_id, **node_data)
+        self._mark(self._dirty_nodes, node_id, self._graph.nodes[node_id], old_description, node_data)
 
     async def update_node(self, node_id: str, node_data: dict[str, str]):
         if self._graph.has_node(node_id):
-            self._graph.nodes[node_id].update(node_data)
+            await self.upsert_node(node_id, node_data)
         else:
             logger.warning("Node %s not found in the graph for update.", node_id)
 
     async def upsert_edge(
         self, source_node_id: str, target_node_id: str, edge_data: dict[str, str]
     ):
+        edge = self._graph.edges.get((source_node_id, target_node_id))
+        old_description = edge.get("description") if edge is not None else None
+        for node_id in (source_node_id, target_node_id):
+            # like add_edge, an end node that is not in the graph is added without data
+            if not self._graph.has_node(node_id):
+                self._dirty_nodes.add(node_id)
         self._graph.add_edge(source_node_id, target_node_id, **edge_data)
+        self._mark(self._dirty_edges, self._edge_key(source_node_id, target_node_id),
+                   self._graph.edges[source_node_id, target_node_id], old_description, edge_data)
 
     async def update_edge(self, source_node_id: str, target_node_id: str, edge_data: dict[str, str]):
         if self._graph.has_edge(source_node_id, target_node_id):
-            self._graph.edges[(source_node_id, target_node_id)].update(edge_data)
+            await self.upsert_edge(source_node_id, target_node_id, edge_data)
         else:
             logger.warning("Edge %s -> %s not found in the graph for update.", source_node_id, target_node_id)
 
@@ -147,6 +212,8 @@ class NetworkXStorage(BaseGraphStorage):
         """
         if self._graph.has_node(node_id):
             self._graph.remove_node(node_id)
+            self._dirty_nodes.discard(node_id)
+            self._dirty_edges = {key for key in self._dirty_edges if node_id not in key}
             logger.info("Node %s deleted from the graph.", node_id)
         else:
             logger.warning("Node %s not found in the graph for deletion.", node_id)
@@ -156,4 +223,6 @@ class NetworkXStorage(BaseGraphStorage):
         Clear the graph by removing all nodes and edges.
         """
         self._graph.clear()
+        self._dirty_nodes.clear()
+        self._dirty_edges.clear()
         logger.info("Graph %s cleared.", self.namespace)
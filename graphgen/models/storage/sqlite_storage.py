@@ -0,0 +1,314 @@
+import os
+import json
+import sqlite3
+from typing import Union
+from dataclasses import dataclass
+
+import networkx as nx
+
+from graphgen.utils import logger, load_json
+from .base_storage import BaseKVStorage, BaseGraphStorage
+
+# stay below SQLITE_MAX_VARIABLE_NUMBER of older sqlite builds (999)
+MAX_VARIABLES = 900
+
+
+def _connect(file_name: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(file_name, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def _batches(items: list, size: int = MAX_VARIABLES):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False)
+
+
+@dataclass
+class SQLiteKVStorage(BaseKVStorage):
+    """
+    KV storage in `{namespace}.db`, one row per key with the value as json.
+
+    Writes are batched in one transaction that is committed by `index_done_callback`, bulk reads and writes
+    are issued as one statement per MAX_VARIABLES keys, and nothing but the connection is kept in memory.
+    """
+    def __post_init__(self):
+        os.makedirs(self.working_dir, exist_ok=True)
+        self._file_name = os.path.join(self.working_dir, f"{self.namespace}.db")
+        self._conn = _connect(self._file_name)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS kv (id TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.commit()
+        if len(self) == 0:
+            # migrate the namespace from JsonKVStorage on first use
+            data = load_json(os.path.join(self.working_dir, f"{self.namespace}.json")) or {}
+            if data:
+                self._conn.executemany("INSERT OR IGNORE INTO kv VALUES (?, ?)",
+                                       [(k, _dumps(v)) for k, v in data.items()])
+                self._conn.commit()
+        logger.info("Load KV %s with %d data", self.namespace, len(self))
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM kv").fetchone()[0]
+
+    @property
+    def data(self):
+        return {k: json.loads(v) for k, v in self._conn.execute("SELECT id, value FROM kv")}
+
+    async def all_keys(self) -> list[str]:
+        return [row[0] for row in self._conn.execute("SELECT id FROM kv")]
+
+    async def index_done_callback(self):
+        self._conn.commit()
+
+    async def get_by_id(self, id):
+        row = self._conn.execute("SELECT value FROM kv WHERE id = ?", (id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _fetch(self, ids: list[str]) -> dict:
+        found = {}
+        for batch in _batches(list(set(ids))):
+            placeholders = ",".join("?" * len(batch))
+            found.update(self._conn.execute(f"SELECT id, value FROM kv WHERE id IN ({placeholders})", batch))
+        return found
+
+    async def get_by_ids(self, ids, fields=None) -> list:
+        found = self._fetch(ids)
+        values = [json.loads(found[id]) if id in found else None for id in ids]
+        if fields is None:
+            return values
+        return [
+            {k: v for k, v in value.items() if k in fields} if value else None
+            for value in values
+        ]
+
+    async def filter_keys(self, data: list[str]) -> set[str]:
+        existing = set()
+        for batch in _batches(list(set(data))):
+            placeholders = ",".join("?" * len(batch))
+            existing.update(row[0] for row in
+                            self._conn.execute(f"SELECT id FROM kv WHERE id IN ({placeholders})", batch))
+        return {s for s in data if s not in existing}
+
+    async def upsert(self, data: dict):
+        new_keys = await self.filter_keys(list(data.keys()))
+        left_data = {k: v for k, v in data.items() if k in new_keys}
+        self._conn.executemany("INSERT OR IGNORE INTO kv VALUES (?, ?)",
+                               [(k, _dumps(v)) for k, v in left_data.items()])
+        return left_data
+
+    async def delete(self, ids: list[str]):
+        for batch in _batches(list(set(ids))):
+            placeholders = ",".join("?" * len(batch))
+            self._conn.execute(f"DELETE FROM kv WHERE id IN ({placeholders})", batch)
+
+    async def drop(self):
+        self._conn.execute("DELETE FROM kv")
+        self._conn.commit()
+
+
+@dataclass
+class SQLiteGraphStorage(BaseGraphStorage):
+    """
+    Undirected graph storage in `{namespace}.db` with a node table and an edge table, node and edge
+    attributes stored as json.
+
+    An edge is stored once in the orientation it was first inserted and found from either end through the
+    primary key on (src, tgt) and an index on tgt. Upserts merge attributes like networkx does.
+    The nodes and edges without a loss are listed in the dirty_nodes and dirty_edges tables.
+    """
+    def __post_init__(self):
+        os.makedirs(self.working_dir, exist_ok=True)
+        self._file_name = os.path.join(self.working_dir, f"{self.namespace}.db")
+        self._conn = _connect(self._file_name)
+        has_dirty_tables = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'dirty_nodes'"
+        ).fetchone() is not None
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS nodes (id TEXT PRIMARY KEY, data TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS edges (
+                src TEXT NOT NULL, tgt TEXT NOT NULL, data TEXT NOT NULL, PRIMARY KEY (src, tgt)
+            );
+            CREATE INDEX IF NOT EXISTS edges_tgt ON edges (tgt);
+            CREATE TABLE IF NOT EXISTS dirty_nodes (id TEXT PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS dirty_edges (src TEXT NOT NULL, tgt TEXT NOT NULL, PRIMARY KEY (src, tgt));
+            """
+        )
+        if not has_dirty_tables:
+            # a graph from an older run, its nodes and edges without a loss are dirty
+            self._conn.executemany("INSERT INTO dirty_nodes VALUES (?)", [
+                (node_id,) for node_id, data in self._conn.execute("SELECT id, data FROM nodes").fetchall()
+                if json.loads(data).get("loss") is None
+            ])
+            self._conn.executemany("INSERT INTO dirty_edges VALUES (?, ?)", [
+                (src, tgt) for src, tgt, data in self._conn.execute("SELECT src, tgt, data FROM edges").fetchall()
+                if json.loads(data).get("loss") is None
+            ])
+        self._conn.commit()
+        logger.info(
+            "Loaded graph from %s with %d nodes, %d edges", self._file_name,
+            self._count("nodes"), self._count("edges")
+        )
+
+    def _count(self, table: str) -> int:
+        return self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def _mark_node(self, node_id: str, dirty: bool):
+        if dirty:
+            self._conn.execute("INSERT OR IGNORE INTO dirty_nodes VALUES (?)", (node_id,))
+        else:
+            self._conn.execute("DELETE FROM dirty_nodes WHERE id = ?", (node_id,))
+
+    def _mark_edge(self, src: str, tgt: str, dirty: bool):
+        if dirty:
+            self._conn.execute("INSERT OR IGNORE INTO dirty_edges VALUES (?, ?)", (src, tgt))
+        else:
+            self._conn.execute("DELETE FROM dirty_edges WHERE src = ? AND tgt = ?", (src, tgt))
+
+    def _edge_row(self, source_node_id: str, target_node_id: str) -> Union[tuple, None]:
+        return self._conn.execute(
+            "SELECT src, tgt, data FROM edges WHERE (src = ? AND tgt = ?) OR (src = ? AND tgt = ?) LIMIT 1",
+            (source_node_id, target_node_id, target_node_id, source_node_id)
+        ).fetchone()
+
+    async def index_done_callback(self):
+        self._conn.commit()
+
+    async def has_node(self, node_id: str) -> bool:
+        return self._conn.execute("SELECT 1 FROM nodes WHERE id = ?", (node_id,)).fetchone() is not None
+
+    async def has_edge(self, source_node_id: str, target_node_id: str) -> bool:
+        return self._edge_row(source_node_id, target_node_id) is not None
+
+    async def get_node(self, node_id: str) -> Union[dict, None]:
+        row = self._conn.execute("SELECT data FROM nodes WHERE id = ?", (node_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def get_all_nodes(self) -> Union[list[dict], None]:
+        return [(node_id, json.loads(data)) for node_id, data in self._conn.execute("SELECT id, data FROM nodes")]
+
+    async def node_degree(self, node_id: str) -> int:
+        return self._conn.execute(
+            "SELECT (SELECT COUNT(*) FROM edges WHERE src = ?) + (SELECT COUNT(*) FROM edges WHERE tgt = ?)",
+            (node_id, node_id)
+        ).fetchone()[0]
+
+    async def edge_degree(self, src_id: str, tgt_id: str) -> int:
+        return await self.node_degree(src_id) + await self.node_degree(tgt_id)
+
+    async def get_edge(
+        self, source_node_id: str, target_node_id: str
+    ) -> Union[dict, None]:
+        row = self._edge_row(source_node_id, target_node_id)
+        return json.loads(row[2]) if row else None
+
+    async def get_all_edges(self) -> Union[list[dict], None]:
+        return [
+            (src, tgt, json.loads(data)) for src, tgt, data in self._conn.execute("SELECT src, tgt, data FROM edges")
+        ]
+
+    async def get_dirty_nodes(self) -> list[tuple[str, dict]]:
+        return [
+            (node_id, json.loads(data)) for node_id, data in
+            self._conn.execute("SELECT n.id, n.data FROM dirty_nodes d JOIN nodes n ON n.id = d.id")
+        ]
+
+    async def get_dirty_edges(self) -> list[tuple[str, str, dict]]:
+        return [
+            (src, tgt, json.loads(data)) for src, tgt, data in
+            self._conn.execute("SELECT e.src, e.tgt, e.data FROM dirty_edges d "
+                               "JOIN edges e ON e.src = d.src AND e.tgt = d.tgt")
+        ]
+
+    async def get_node_edges(self, source_node_id: str) -> Union[list[tuple[str, str]], None]:
+        if not await self.has_node(source_node_id):
+            return None
+        rows = self._conn.execute(
+            "SELECT tgt, data FROM edges WHERE src = ? "
+            "UNION ALL SELECT src, data FROM edges WHERE tgt = ? AND src != tgt",
+            (source_node_id, source_node_id)
+        )
+        return [(source_node_id, neighbor, json.loads(data)) for neighbor, data in rows]
+
+    async def get_graph(self) -> nx.Graph:
+        graph = nx.Graph()
+        graph.add_nodes_from(await self.get_all_nodes())
+        graph.add_edges_from(await self.get_all_edges())
+        return graph
+
+    async def upsert_node(self, node_id: str, node_data: dict[str, str]):
+        node = await self.get_node(node_id)
+        old_description = None if node is None else node.get("description")
+        if node is None:
+            node = dict(node_data)
+            dirty = BaseGraphStorage.invalidate_loss(node, old_description, node_data)
+            self._conn.execute("INSERT INTO nodes VALUES (?, ?)", (node_id, _dumps(node)))
+        else:
+            node.update(node_data)
+            dirty = BaseGraphStorage.invalidate_loss(node, old_description, node_data)
+            self._conn.execute("UPDATE nodes SET data = ? WHERE id = ?", (_dumps(node), node_id))
+        self._mark_node(node_id, dirty)
+
+    async def update_node(self, node_id: str, node_data: dict[str, str]):
+        if await self.has_node(node_id):
+            await self.upsert_node(node_id, node_data)
+        else:
+            logger.warning("Node %s not found in the graph for update.", node_id)
+
+    async def upsert_edge(
+        self, source_node_id: str, target_node_id: str, edge_data: dict[str, str]
+    ):
+        row = self._edge_row(source_node_id, target_node_id)
+        if row is None:
+            # like networkx, adding an edge adds its missing end nodes
+            for node_id in (source_node_id, target_node_id):
+                if self._conn.execute("INSERT OR IGNORE INTO nodes VALUES (?, '{}')", (node_id,)).rowcount:
+                    self._mark_node(node_id, True)
+            src, tgt, data = source_node_id, target_node_id, dict(edge_data)
+            dirty = BaseGraphStorage.invalidate_loss(data, None, edge_data)
+            self._conn.execute("INSERT INTO edges VALUES (?, ?, ?)", (src, tgt, _dumps(data)))
+        else:
+            src, tgt, data = row
+            data = json.loads(data)
+            old_description = data.get("description")
+            data.update(edge_data)
+            dirty = BaseGraphStorage.invalidate_loss(data, old_description, edge_data)
+            self._conn.execute("UPDATE edges SET data = ? WHERE src = ? AND tgt = ?", (_dumps(data), src, tgt))
+        self._mark_edge(src, tgt, dirty)
+
+    async def update_edge(self, source_node_id: str, target_node_id: str, edge_data: dict[str, str]):
+        if await self.has_edge(source_node_id, target_node_id):
+            await self.upsert_edge(source_node_id, target_node_id, edge_data)
+        else:
+            logger.warning("Edge %s -> %s not found in the graph for update.", source_node_id, target_node_id)
+
+    async def delete_node(self, node_id: str):
+        """
+        Delete a node and its edges from the graph based on the specified node_id.
+
+        :param node_id: The node_id to delete
+        """
+        if await self.has_node(node_id):
+            self._conn.execute("DELETE FROM edges WHERE src = ? OR tgt = ?", (node_id, node_id))
+            self._conn.execute("DELETE FROM nodes WHERE id = ?", (node_id,))
+            self._conn.execute("DELETE FROM dirty_edges WHERE src = ? OR tgt = ?", (node_id, node_id))
+            self._conn.execute("DELETE FROM dirty_nodes WHERE id = ?", (node_id,))
+            logger.info("Node %s deleted from the graph.", node_id)
+        else:
+            logger.warning("Node %s not found in the graph for deletion.", node_id)
+
+    async def clear(self):
+        """
+        Clear the graph by removing all nodes and edges.
+        """
+        self._conn.execute("DELETE FROM edges")
+        self._conn.execute("DELETE FROM nodes")
+        self._conn.execute("DELETE FROM dirty_edges")
+        self._conn.execute("DELETE FROM dirty_nodes")
+        self._conn.commit()
+        logger.info("Graph %s cleared.", self.namespace)
@@ -0,0 +1,25 @@
+from dataclasses import dataclass, fields
+
+from graphgen.models.strategy.base_strategy import BaseStrategy
+
+
+@dataclass
+class DedupStrategy(BaseStrategy):
+    # 是否在抽取前用MinHash+LSH去除近似重复的文档和文本块
+    enabled: bool = False
+    # 估计的Jaccard相似度不低于该值即视为重复
+    threshold: float = 0.8
+    # MinHash排列数
+    num_perm: int = 128
+    # 每个shingle包含的词数（中文按jieba分词）
+    shingle_size: int = 5
+    # 对文档去重（仅raw数据）
+    docs: bool = True
+    # 对文本块去重
+    chunks: bool = True
+
+    def to_yaml(self):
+        strategy_dict = {}
+        for f in fields(self):
+            strategy_dict[f.name] = getattr(self, f.name)
+        return {"dedup_strategy": strategy_dict}
@@ -0,0 +1,20 @@
+from dataclasses import dataclass, fields
+
+from graphgen.models.strategy.base_strategy import BaseStrategy
+
+
+@dataclass
+class GleanStrategy(BaseStrategy):
+    # 每次抽取后最多追加的补充抽取（gleaning）轮数，0表示不补充抽取
+    max_rounds: int = 3
+    # 每轮前是否询问模型是否还有遗漏（IF_LOOP），否则根据上一轮新增的记录数决定是否继续
+    ask_if_loop: bool = True
+    # 某轮新增记录数少于该值时停止，0表示不根据新增记录数停止
+    # 不询问模型（ask_if_loop为false）时至少按1处理，即某轮没有新增记录时停止
+    min_new_records: int = 0
+
+    def to_yaml(self):
+        strategy_dict = {}
+        for f in fields(self):
+            strategy_dict[f.name] = getattr(self, f.name)
+        return {"glean_strategy": strategy_dict}
@@ -0,0 +1,29 @@
+from dataclasses import dataclass, fields
+
+from graphgen.models.strategy.base_strategy import BaseStrategy
+
+
+@dataclass
+class ResolutionStrategy(BaseStrategy):
+    # 是否在合并前对抽取出的实体做实体消解（合并指代同一事物的不同名称）
+    enabled: bool = False
+    # 嵌入模型："hashing"（本地确定性嵌入）或 "openai"（EMBEDDING_MODEL 等环境变量指定的嵌入接口）
+    embedding: str = "hashing"
+    embedding_dim: int = 256
+    # 每次嵌入请求的文本数
+    batch_size: int = 256
+    # 名称与描述的嵌入按该权重加权平均
+    name_weight: float = 0.7
+    # 余弦相似度不低于该值的实体视为同一实体
+    similarity_threshold: float = 0.9
+    # 随机超平面分桶的表数与每表的超平面数
+    num_tables: int = 16
+    num_bits: int = 10
+    # 是否也与图中已有的节点做消解
+    include_graph_nodes: bool = True
+
+    def to_yaml(self):
+        strategy_dict = {}
+        for f in fields(self):
+            strategy_dict[f.name] = getattr(self, f.name)
+        return {"resolution_strategy": strategy_dict}
@@ -0,0 +1,114 @@
+import re
+import zlib
+from dataclasses import dataclass
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import jieba
+import numpy as np
+
+from graphgen.utils import detect_main_language
+
+WORD_PATTERN = re.compile(r"\w+")
+# minhash permutations are computed modulo this Mersenne prime
+MERSENNE_PRIME = (1 << 31) - 1
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased words, segmented with jieba for Chinese text
+
+    :param text
+    :return: tokens
+    """
+    if detect_main_language(text) == "zh":
+        return [token for token in jieba.lcut(text) if WORD_PATTERN.search(token)]
+    return WORD_PATTERN.findall(text.lower())
+
+
+def optimal_bands(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """
+    Bands and rows per band whose LSH S-curve (1 / bands) ** (1 / rows) is closest to threshold
+
+    :param threshold: Jaccard similarity
+    :param num_perm: number of minhash permutations
+    :return: bands, rows
+    """
+    candidates = [(b, num_perm // b) for b in range(1, num_perm + 1)]
+    return min(candidates, key=lambda c: abs((1 / c[0]) ** (1 / c[1]) - threshold))
+
+
+@dataclass
+class MinHashLSH:
+    """
+    Near-duplicate detection of texts by estimated Jaccard similarity of their token shingles.
+
+    A text's signature is the min of num_perm random hash permutations over its shingles, computed at once with
+    NumPy. Signatures are split into bands, and only texts sharing a band bucket are compared.
+    """
+    threshold: float = 0.8
+    num_perm: int = 128
+    shingle_size: int = 5
+    seed: int = 0
+
+    def __post_init__(self):
+        assert 0 < self.threshold <= 1, "threshold must be in (0, 1]"
+        rng = np.random.default_rng(self.seed)
+        self._a = rng.integers(1, MERSENNE_PRIME, size=self.num_perm, dtype=np.int64)
+        self._b = rng.integers(0, MERSENNE_PRIME, size=self.num_perm, dtype=np.int64)
+        self.bands, self.rows = optimal_bands(self.threshold, self.num_perm)
+        self._buckets = [defaultdict(list) for _ in range(self.bands)]
+        self._signatures: Dict[str, np.ndarray] = {}
+
+    def shingles(self, text: str) -> set:
+        tokens = tokenize(text)
+        if len(tokens) <= self.shingle_size:
+            return {" ".join(tokens)}
+        return {" ".join(tokens[i:i + self.shingle_size]) for i in range(len(tokens) - self.shingle_size + 1)}
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) & MERSENNE_PRIME for s in self.shingles(text)),
+                             dtype=np.int64)
+        return ((np.outer(self._a, hashes) + self._b[:, None]) % MERSENNE_PRIME).min(axis=1)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def query(self, signature: np.ndarray) -> Optional[Tuple[str, float]]:
+        """
+        Most similar inserted text whose estimated Jaccard similarity reaches the threshold
+
+        :param signature
+        :return: (key, similarity) or None
+        """
+        candidates = set()
+        for bucket, band_key in zip(self._buckets, self._band_keys(signature)):
+            candidates.update(bucket.get(band_key, ()))
+        best_key, best_similarity = None, 0.0
+        for key in candidates:
+            similarity = float(np.mean(self._signatures[key] == signature))
+            if similarity >= self.threshold and similarity > best_similarity:
+                best_key, best_similarity = key, similarity
+        return (best_key, best_similarity) if best_key is not None else None
+
+    def insert(self, key: str, signature: np.ndarray):
+        self._signatures[key] = signature
+        for bucket, band_key in zip(self._buckets, self._band_keys(signature)):
+            bucket[band_key].append(key)
+
+    def deduplicate(self, texts: Dict[str, str]) -> Dict[str, dict]:
+        """
+        Fold each text into an earlier near-duplicate, in order
+
+        :param texts: text by key
+        :return: {duplicate key: {"kept": key of the text it was folded into, "similarity": estimated Jaccard}}
+        """
+        duplicates = {}
+        for key, text in texts.items():
+            signature = self.signature(text)
+            match = self.query(signature)
+            if match is not None:
+                duplicates[key] = {"kept": match[0], "similarity": match[1]}
+            else:
+                self.insert(key, signature)
+        return duplicates
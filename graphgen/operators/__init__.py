@@ -1,16 +1,23 @@
 from .extract_kg import extract_kg
+from .resolve_entities import resolve_entities
 from .quiz import quiz
 from .judge import judge_statement, skip_judge_statement
 from .search_wikipedia import search_wikipedia
 from .traverse_graph import traverse_graph_by_edge, traverse_graph_atomically, traverse_graph_for_multi_hop
+from .pipeline import STOP, quiz_stage, judge_stage, atomic_qa_stage
 
 __all__ = [
     "extract_kg",
+    "resolve_entities",
     "quiz",
     "judge_statement",
     "skip_judge_statement",
     "search_wikipedia",
     "traverse_graph_by_edge",
     "traverse_graph_atomically",
-    "traverse_graph_for_multi_hop"
+    "traverse_graph_for_multi_hop",
+    "STOP",
+    "quiz_stage",
+    "judge_stage",
+    "atomic_qa_stage"
 ]
@@ -1,27 +1,156 @@
-import re
 import asyncio
 from typing import List
+from dataclasses import dataclass, field
 from collections import defaultdict
 
 import gradio as gr
 from tqdm.asyncio import tqdm as tqdm_async
-from graphgen.models import Chunk, OpenAIModel, Tokenizer
-from graphgen.models.storage.base_storage import BaseGraphStorage
-from graphgen.templates import KG_EXTRACTION_PROMPT
-from graphgen.utils import (logger, pack_history_conversations, split_string_by_multi_markers,
-                            handle_single_entity_extraction, handle_single_relationship_extraction,
-                            detect_if_chinese)
-from graphgen.operators.merge_kg import merge_nodes, merge_edges
+from graphgen.models import Chunk, OpenAIModel, Tokenizer, Checkpoint, GleanStrategy, ResolutionStrategy
+from graphgen.models.embed.embedding import EmbeddingFunc
+from graphgen.models.storage.base_storage import BaseGraphStorage, BaseKVStorage
+from graphgen.templates import KG_EXTRACTION_PROMPT, CompiledPrompt, compile_prompt
+from graphgen.utils import logger, pack_history_conversations, detect_if_chinese, RecordParser
+from graphgen.operators.resolve_entities import resolve_entities
+from graphgen.operators.merge_kg import (merge_nodes, merge_edges, merge_node, merge_edge, add_placeholder_nodes,
+                                        KeyedLocks)
 
 
-# pylint: disable=too-many-statements
+def extraction_prompt(language: str) -> CompiledPrompt:
+    """
+    Extraction prompt of a language, with only input_text left to fill
+
+    :param language: English or Chinese
+    :return: compiled prompt
+    """
+    return compile_prompt(KG_EXTRACTION_PROMPT[language]["TEMPLATE"],
+                          **{**KG_EXTRACTION_PROMPT["FORMAT"], "language": language})
+
+
+RECORD_PARSER = RecordParser(
+    tuple_delimiter=KG_EXTRACTION_PROMPT["FORMAT"]["tuple_delimiter"],
+    record_delimiter=KG_EXTRACTION_PROMPT["FORMAT"]["record_delimiter"],
+    completion_delimiter=KG_EXTRACTION_PROMPT["FORMAT"]["completion_delimiter"]
+)
+
+# tag of the passage of a chunk in a batched extraction prompt, numbered from 1
+CHUNK_TAG = "C{}"
+
+
+def batch_extraction_prompt(language: str) -> CompiledPrompt:
+    """
+    Extraction prompt for several tagged chunks of a language, with only input_text left to fill
+
+    :param language: English or Chinese
+    :return: compiled prompt
+    """
+    return compile_prompt(KG_EXTRACTION_PROMPT[language]["BATCH_TEMPLATE"],
+                          **{**KG_EXTRACTION_PROMPT["FORMAT"], "language": language})
+
+
+# passages of a batched extraction prompt are joined with this separator
+PASSAGE_SEPARATOR = "\n\n"
+
+
+def tagged_passage(index: int, chunk: Chunk) -> str:
+    return f"[{CHUNK_TAG.format(index)}] {chunk.content}"
+
+
+def _passage_tokens(index: int, chunk: Chunk, tokenizer_instance: Tokenizer) -> int:
+    # the tag and separator are counted apart from the content, whose token count is memoized
+    return (tokenizer_instance.count_tokens(chunk.content)
+            + tokenizer_instance.count_tokens(f"[{CHUNK_TAG.format(index)}] {PASSAGE_SEPARATOR}"))
+
+
+def pack_chunks(chunks: List[Chunk], tokenizer_instance: Tokenizer, batch_token_budget: int) -> List[List[Chunk]]:
+    """
+    Pack chunks of the same language, in order, into batches whose batched extraction prompt has at most
+    batch_token_budget tokens: the static part of the prompt, counted once per tokenizer, plus the tagged
+    passage of each chunk. A chunk that does not fit in an empty batch gets a batch of its own.
+
+    :param chunks
+    :param tokenizer_instance
+    :param batch_token_budget: 0 puts every chunk in its own batch
+    :return: batches
+    """
+    if batch_token_budget <= 0:
+        return [[chunk] for chunk in chunks]
+    batches = []
+    open_batches = {}
+    for chunk in chunks:
+        language = "Chinese" if detect_if_chinese(chunk.content) else "English"
+        static_tokens = batch_extraction_prompt(language).static_token_count(tokenizer_instance)
+        batch, batch_tokens = open_batches.get(language, ([], static_tokens))
+        if batch and batch_tokens + _passage_tokens(len(batch) + 1, chunk, tokenizer_instance) > batch_token_budget:
+            batches.append(batch)
+            batch, batch_tokens = [], static_tokens
+        batch.append(chunk)
+        open_batches[language] = (batch, batch_tokens + _passage_tokens(len(batch), chunk, tokenizer_instance))
+    batches.extend(batch for batch, _ in open_batches.values())
+    return batches
+
+
+def record_chunk_id(record_attributes: List[str], batch: List[Chunk]) -> str:
+    """
+    Source id of an extracted record. In a batch, the last field of a record is the tag of its chunk,
+    a record without a known tag is attributed to all chunks of the batch.
+
+    :param record_attributes: fields of the record
+    :param batch: chunks of the extraction request
+    :return: chunk id, or chunk ids joined with <SEP>
+    """
+    if len(batch) == 1:
+        return batch[0].id
+    if len(record_attributes) >= 5:
+        tag = record_attributes[-1].strip().strip('"').strip("[]").strip()
+        for index, chunk in enumerate(batch, 1):
+            if tag == CHUNK_TAG.format(index):
+                return chunk.id
+    return "<SEP>".join(chunk.id for chunk in batch)
+
+
+@dataclass
+class GleanStats:
+    """
+    Records extracted in each round of a run, round 0 being the first extraction request.
+    """
+    requests: list = field(default_factory=list)
+    records: list = field(default_factory=list)
+    new_records: list = field(default_factory=list)
+    if_loop_calls: int = 0
+
+    def add(self, round_index: int, records: int, new_records: int):
+        while len(self.requests) <= round_index:
+            self.requests.append(0)
+            self.records.append(0)
+            self.new_records.append(0)
+        self.requests[round_index] += 1
+        self.records[round_index] += records
+        self.new_records[round_index] += new_records
+
+    def summary(self) -> str:
+        rounds = [f"round {i}: {self.requests[i]} requests, {self.records[i]} records, {self.new_records[i]} new"
+                  for i in range(len(self.requests))]
+        return "; ".join(rounds + [f"{self.if_loop_calls} IF_LOOP calls"])
+
+
+# pylint: disable=too-many-statements,too-many-branches
 async def extract_kg(
         llm_client: OpenAIModel,
         kg_instance: BaseGraphStorage,
         tokenizer_instance: Tokenizer,
         chunks: List[Chunk],
         progress_bar: gr.Progress = None,
-        max_concurrent: int = 1000
+        max_concurrent: int = 1000,
+        checkpoint: Checkpoint = None,
+        merged_queue: asyncio.Queue = None,
+        incremental_merge: bool = False,
+        batch_token_budget: int = 0,
+        glean_strategy: GleanStrategy = None,
+        glean_stats: GleanStats = None,
+        resolution_strategy: ResolutionStrategy = None,
+        embedding_func: EmbeddingFunc = None,
+        summary_cache: BaseKVStorage = None,
+        embedding_cache: BaseKVStorage = None
 ):
     """
     :param llm_client: Synthesizer LLM model to extract entities and relationships
@@ -30,30 +159,59 @@ async def extract_kg(
     :param chunks
     :param progress_bar: Gradio progress bar to show the progress of the extraction
     :param max_concurrent
+    :param checkpoint: save the records of each chunk as it is extracted and reuse the saved ones
+    :param merged_queue: put each node and edge once it is merged, see merge_nodes
+    :param incremental_merge: merge the records of each chunk into the graph as soon as it is extracted, under
+                              a lock per entity and per relationship, instead of merging all records at the end.
+                              A description is summarized under the lock once it is over the summary limit.
+                              Nodes and edges are put into merged_queue as they are merged, and put again
+                              whenever a later chunk changes their description
+    :param batch_token_budget: pack chunks of the same language into one extraction request until its prompt
+                               reaches this many tokens, records are tagged with the chunk they come from.
+                               0 sends one request per chunk
+    :param glean_strategy: when to ask for missed records after the first extraction, see GleanStrategy
+    :param glean_stats: collect the number of records of each gleaning round, they are logged at the end
+    :param resolution_strategy: resolve near-duplicate entity names before merging, see resolve_entities.
+                                Not available with incremental_merge, which merges before all names are known
+    :param embedding_func: embeds entity names and descriptions for the entity resolution
+    :param summary_cache: summaries of merged descriptions, see merge_node
+    :param embedding_cache: embeddings of graph nodes for the entity resolution, see resolve_entities
     :return:
     """
 
     semaphore = asyncio.Semaphore(max_concurrent)
+    glean_strategy = glean_strategy or GleanStrategy()
+    glean_stats = glean_stats if glean_stats is not None else GleanStats()
 
-    async def _process_single_content(chunk: Chunk, max_loop: int = 3):
-        async with semaphore:
-            chunk_id = chunk.id
-            content = chunk.content
-            if detect_if_chinese(content):
-                language = "Chinese"
-            else:
-                language = "English"
-            KG_EXTRACTION_PROMPT["FORMAT"]["language"] = language
-
-            hint_prompt = KG_EXTRACTION_PROMPT[language]["TEMPLATE"].format(
-                **KG_EXTRACTION_PROMPT["FORMAT"], input_text=content
-            )
+    async def _extract_records(batch: List[Chunk]) -> dict:
+        if detect_if_chinese(batch[0].content):
+            language = "Chinese"
+        else:
+            language = "English"
+
+        if len(batch) == 1:
+            hint_prompt = extraction_prompt(language).format(input_text=batch[0].content)
+        else:
+            hint_prompt = batch_extraction_prompt(language).format(input_text=PASSAGE_SEPARATOR.join(
+                tagged_passage(index, chunk) for index, chunk in enumerate(batch, 1)
+            ))
 
-            final_result = await llm_client.generate_answer(hint_prompt)
-            logger.info('First result: %s', final_result)
+        final_result = await llm_client.generate_answer(hint_prompt)
+        logger.info('First result: %s', final_result)
+        records = RECORD_PARSER.split_records(final_result)
+        seen_records = set(records)
+        glean_stats.add(0, len(records), len(seen_records))
+        new_records = len(seen_records)
 
-            history = pack_history_conversations(hint_prompt, final_result)
-            for loop_index in range(max_loop):
+        history = pack_history_conversations(hint_prompt, final_result)
+        # without IF_LOOP, a round that adds nothing is the only sign that the model has nothing left
+        min_new_records = glean_strategy.min_new_records if glean_strategy.ask_if_loop \
+            else max(glean_strategy.min_new_records, 1)
+        for loop_index in range(glean_strategy.max_rounds):
+            if new_records < min_new_records:
+                break
+            if glean_strategy.ask_if_loop:
+                glean_stats.if_loop_calls += 1
                 if_loop_result = await llm_client.generate_answer(
                     text=KG_EXTRACTION_PROMPT[language]["IF_LOOP"],
                     history=history
@@ -62,59 +220,128 @@ async def extract_kg(
                 if if_loop_result != "yes":
                     break
 
-                glean_result = await llm_client.generate_answer(
-                    text=KG_EXTRACTION_PROMPT[language]["CONTINUE"],
-                    history=history
-                )
-                logger.info('Loop %s glean: %s', loop_index, glean_result)
+            glean_result = await llm_client.generate_answer(
+                text=KG_EXTRACTION_PROMPT[language]["CONTINUE"],
+                history=history
+            )
+            logger.info('Loop %s glean: %s', loop_index, glean_result)
 
-                history += pack_history_conversations(KG_EXTRACTION_PROMPT[language]["CONTINUE"], glean_result)
-                final_result += glean_result
-                if loop_index == max_loop - 1:
-                    break
+            history += pack_history_conversations(KG_EXTRACTION_PROMPT[language]["CONTINUE"], glean_result)
+            glean_records = RECORD_PARSER.split_records(glean_result)
+            new_records = len(set(glean_records) - seen_records)
+            seen_records.update(glean_records)
+            glean_stats.add(loop_index + 1, len(glean_records), new_records)
+            records += glean_records
 
-            records = split_string_by_multi_markers(
-                final_result,
-                [
-                KG_EXTRACTION_PROMPT["FORMAT"]["record_delimiter"],
-                KG_EXTRACTION_PROMPT["FORMAT"]["completion_delimiter"]],
-            )
+        # records of each chunk, the ones without a valid tag are kept with the first chunk of the batch
+        results = {chunk.id: (defaultdict(list), defaultdict(list)) for chunk in batch}
+        for record in records:
+            record_attributes = RECORD_PARSER.split_attributes(record)
+            chunk_id = record_chunk_id(record_attributes, batch)
+            nodes, edges = results.get(chunk_id, results[batch[0].id])
 
+            kind, parsed = RECORD_PARSER.parse_attributes(record_attributes, chunk_id)
+            if kind == "entity":
+                nodes[parsed["entity_name"]].append(parsed)
+            elif kind == "relationship":
+                edges[(parsed["src_id"], parsed["tgt_id"])].append(parsed)
+        return results
+
+    async def _process_batch(batch: List[Chunk]):
+        async with semaphore:
             nodes = defaultdict(list)
             edges = defaultdict(list)
-
-            for record in records:
-                record = re.search(r"\((.*)\)", record)
-                if record is None:
+            pending = []
+            for chunk in batch:
+                saved = await checkpoint.load(chunk.id) if checkpoint is not None else None
+                if saved is None:
+                    pending.append(chunk)
                     continue
-                record = record.group(1) # 提取括号内的内容
-                record_attributes = split_string_by_multi_markers(
-                    record, [KG_EXTRACTION_PROMPT["FORMAT"]["tuple_delimiter"]]
-                )
+                for k, v in saved["nodes"].items():
+                    nodes[k].extend(v)
+                for src, tgt, relations in saved["edges"]:
+                    edges[(src, tgt)].extend(relations)
 
-                entity = await handle_single_entity_extraction(record_attributes, chunk_id)
-                if entity is not None:
-                    nodes[entity["entity_name"]].append(entity)
-                    continue
-                relation = await handle_single_relationship_extraction(record_attributes, chunk_id)
-                if relation is not None:
-                    edges[(relation["src_id"], relation["tgt_id"])].append(relation)
+            if pending:
+                for chunk_id, (chunk_nodes, chunk_edges) in (await _extract_records(pending)).items():
+                    if checkpoint is not None:
+                        await checkpoint.save(chunk_id, {
+                            "nodes": dict(chunk_nodes),
+                            "edges": [[src, tgt, relations] for (src, tgt), relations in chunk_edges.items()]
+                        })
+                    for k, v in chunk_nodes.items():
+                        nodes[k].extend(v)
+                    for k, v in chunk_edges.items():
+                        edges[k].extend(v)
             return dict(nodes), dict(edges)
 
+    node_locks = KeyedLocks()
+    edge_locks = KeyedLocks()
+    merge_semaphore = asyncio.Semaphore(max_concurrent)
+    merged_edges = {}
+
+    async def _merge_single_node(entity_name: str, node_data: list[dict]):
+        async with node_locks.lock(entity_name), merge_semaphore:
+            try:
+                await merge_node(entity_name, node_data, kg_instance, llm_client, tokenizer_instance,
+                                 summary_cache=summary_cache, merged_queue=merged_queue)
+            except Exception as e: # pylint: disable=broad-except
+                logger.error("Error occurred while inserting entity %s into storage: %s", entity_name, e)
+
+    async def _merge_single_edge(src_id: str, tgt_id: str, edge_data: list[dict]):
+        async with edge_locks.lock((src_id, tgt_id)), merge_semaphore:
+            try:
+                merged_edges[(src_id, tgt_id)] = await merge_edge(
+                    src_id, tgt_id, edge_data, kg_instance, llm_client, tokenizer_instance, add_missing_nodes=False,
+                    summary_cache=summary_cache, merged_queue=merged_queue
+                )
+            except Exception as e: # pylint: disable=broad-except
+                logger.error("Error occurred while inserting relationship %s -> %s into storage: %s",
+                             src_id, tgt_id, e)
+
+    async def _process_and_merge(batch: List[Chunk]):
+        chunk_nodes, chunk_edges = await _process_batch(batch)
+        # nodes first, so that an edge finds the nodes of its own chunk
+        await asyncio.gather(*[_merge_single_node(k, v) for k, v in chunk_nodes.items()])
+        await asyncio.gather(*[_merge_single_edge(*sorted(k), v) for k, v in chunk_edges.items()])
+        return {}, {}
+
+    batches = pack_chunks(chunks, tokenizer_instance, batch_token_budget)
+    if batch_token_budget > 0:
+        logger.info("Packed %d chunks into %d extraction requests", len(chunks), len(batches))
+
     results = []
-    chunk_number = len(chunks)
+    done_number = 0
+    chunk_number = len(batches)
     for result in tqdm_async(
-        asyncio.as_completed([_process_single_content(c) for c in chunks]),
-        total=len(chunks),
+        asyncio.as_completed([_process_and_merge(b) if incremental_merge else _process_batch(b)
+                              for b in batches]),
+        total=len(batches),
         desc="Extracting entities and relationships from chunks",
-        unit="chunk",
+        unit="batch" if batch_token_budget > 0 else "chunk",
     ):
         try:
-            results.append(await result)
+            chunk_result = await result
+            if not incremental_merge:
+                results.append(chunk_result)
+            done_number += 1
             if progress_bar is not None:
-                progress_bar(len(results) / chunk_number, desc="Extracting entities and relationships from chunks")
+                progress_bar(done_number / chunk_number, desc="Extracting entities and relationships from chunks")
         except Exception as e: # pylint: disable=broad-except
             logger.error("Error occurred while extracting entities and relationships from chunks: %s", e)
+    if glean_stats.requests:
+        logger.info("[Gleaning] %s", glean_stats.summary())
+
+    resolve = resolution_strategy is not None and resolution_strategy.enabled
+    if resolve and incremental_merge:
+        logger.warning("Entity resolution is skipped with incremental merge")
+
+    if incremental_merge:
+        added_nodes = await add_placeholder_nodes(list(merged_edges.values()), kg_instance)
+        if merged_queue is not None:
+            for node_id in added_nodes:
+                await merged_queue.put(("node", (node_id,)))
+        return kg_instance
 
     nodes = defaultdict(list)
     edges = defaultdict(list)
@@ -124,7 +351,14 @@ async def extract_kg(
         for k, v in e.items():
             edges[tuple(sorted(k))].extend(v)
 
-    await merge_nodes(nodes, kg_instance, llm_client, tokenizer_instance)
-    await merge_edges(edges, kg_instance, llm_client, tokenizer_instance)
+    if resolve:
+        assert embedding_func is not None, "Entity resolution needs an embedding function."
+        nodes, edges, _ = await resolve_entities(nodes, edges, embedding_func, resolution_strategy, kg_instance,
+                                                 embedding_cache=embedding_cache)
+
+    await merge_nodes(nodes, kg_instance, llm_client, tokenizer_instance, merged_queue=merged_queue,
+                      summary_cache=summary_cache)
+    await merge_edges(edges, kg_instance, llm_client, tokenizer_instance, merged_queue=merged_queue,
+                      summary_cache=summary_cache)
 
     return kg_instance
@@ -1,126 +1,175 @@
 import math
 import asyncio
 from tqdm.asyncio import tqdm as tqdm_async
-from graphgen.models import NetworkXStorage, OpenAIModel, JsonKVStorage
-from graphgen.utils import logger, yes_no_loss_entropy
+from graphgen.models import NetworkXStorage, OpenAIModel, JsonKVStorage, Checkpoint
+from graphgen.models.llm.llm_cache import tokens_to_records, records_to_tokens
+from graphgen.models.storage.base_storage import BaseKVStorage
+from graphgen.operators.merge_kg import KeyedLocks
+from graphgen.utils import (logger, yes_no_loss_entropy, yes_no_losses_entropy, pack_yes_no_judgements,
+                            compute_args_hash)
 from graphgen.templates import STATEMENT_JUDGEMENT_PROMPT
 
+# a statement shared by several descriptions is judged once, the others wait for its cached judgement
+_judgement_locks = KeyedLocks()
 
-async def judge_statement( # pylint: disable=too-many-statements
+# losses of judged edges and nodes are computed and stored together in batches of this size
+LOSS_BATCH_SIZE = 1024
+DEFAULT_LOSS = -math.log(0.1)
+
+
+async def judge_single_statement(
+        trainee_llm_client: OpenAIModel,
+        statement: str,
+        judgement_cache: BaseKVStorage = None) -> list:
+    """
+    Judge a statement, reusing the judgement of the same trainee model and prompt cached in judgement_cache
+
+    :param trainee_llm_client: judge the statement
+    :param statement
+    :param judgement_cache: judgements by the hash of (backend, trainee model, prompt template of the backend,
+                            judgement prompt), a chat and a completions backend of one model answer differently
+    :return: top candidates of the first token of the answer
+    """
+    prompt = STATEMENT_JUDGEMENT_PROMPT['TEMPLATE'].format(statement=statement)
+    if judgement_cache is None:
+        judgement = await trainee_llm_client.generate_topk_per_token(prompt)
+        return judgement[0].top_candidates
+
+    backend = type(trainee_llm_client).__name__
+    key = compute_args_hash(backend, trainee_llm_client.model_name,
+                            getattr(trainee_llm_client, "prompt_template", None), prompt)
+    async with _judgement_locks.lock(key):
+        cached = await judgement_cache.get_by_id(key)
+        if cached is not None:
+            return records_to_tokens(cached["top_candidates"])
+        judgement = await trainee_llm_client.generate_topk_per_token(prompt)
+        await judgement_cache.upsert({key: {
+            "backend": backend,
+            "model": trainee_llm_client.model_name,
+            "statement": statement,
+            "top_candidates": tokens_to_records(judgement[0].top_candidates)
+        }})
+        return judgement[0].top_candidates
+
+
+async def collect_judgements(
         trainee_llm_client: OpenAIModel,
-        graph_storage: NetworkXStorage,
         rephrase_storage: JsonKVStorage,
-        re_judge: bool = False,
-        max_concurrent: int = 1000) -> NetworkXStorage:
+        description: str,
+        judgement_cache: BaseKVStorage = None) -> tuple:
     """
-    Get all edges and nodes and judge them
+    Judge the quizzed statements of a description
 
-    :param trainee_llm_client: judge the statements to get comprehension loss
-    :param graph_storage: graph storage instance
+    :param trainee_llm_client: judge the statements
     :param rephrase_storage: rephrase storage instance
-    :param re_judge: re-judge the relations
-    :param max_concurrent: max concurrent
-    :return:
+    :param description: description quizzed into rephrase_storage
+    :param judgement_cache: see judge_single_statement
+    :return: judgements and their ground truths
     """
+    descriptions = await rephrase_storage.get_by_id(description)
+    assert descriptions is not None
 
-    semaphore = asyncio.Semaphore(max_concurrent)
-
-    async def _judge_single_relation(
-        edge: tuple,
-    ):
-        async with semaphore:
-            source_id = edge[0]
-            target_id = edge[1]
-            edge_data = edge[2]
-
-            if (not re_judge) and "loss" in edge_data and edge_data["loss"] is not None:
-                logger.info("Edge %s -> %s already judged, loss: %s, skip", source_id, target_id, edge_data["loss"])
-                return source_id, target_id, edge_data
+    gts = [gt for _, gt in descriptions]
+    # the statements are judged concurrently, the loss only needs all of them
+    judgements = await asyncio.gather(*[
+        judge_single_statement(trainee_llm_client, statement, judgement_cache) for statement, _ in descriptions
+    ])
+    return list(judgements), gts
 
-            description = edge_data["description"]
 
-            try:
-                descriptions = await rephrase_storage.get_by_id(description)
-                assert descriptions is not None
+async def judge_description(
+        trainee_llm_client: OpenAIModel,
+        rephrase_storage: JsonKVStorage,
+        description: str,
+        judgement_cache: BaseKVStorage = None) -> float:
+    """
+    Judge the quizzed statements of a description and get the comprehension loss of the trainee model
 
-                judgements = []
-                gts = [gt for _, gt in descriptions]
-                for description, gt in descriptions:
-                    judgement = await trainee_llm_client.generate_topk_per_token(
-                        STATEMENT_JUDGEMENT_PROMPT['TEMPLATE'].format(statement=description)
-                    )
-                    judgements.append(judgement[0].top_candidates)
+    :param trainee_llm_client: judge the statements
+    :param rephrase_storage: rephrase storage instance
+    :param description: description quizzed into rephrase_storage
+    :param judgement_cache: see judge_single_statement
+    :return: loss
+    """
+    judgements, gts = await collect_judgements(trainee_llm_client, rephrase_storage, description, judgement_cache)
+    return yes_no_loss_entropy(judgements, gts)
 
-                loss = yes_no_loss_entropy(judgements, gts)
 
-                logger.info("Edge %s -> %s description: %s loss: %s", source_id, target_id, description, loss)
+def _name(ids: tuple) -> str:
+    return f"Node {ids[0]}" if len(ids) == 1 else f"Edge {ids[0]} -> {ids[1]}"
 
-                edge_data["loss"] = loss
-            except Exception as e: # pylint: disable=broad-except
-                logger.error("Error in judging relation %s -> %s: %s", source_id, target_id, e)
-                logger.info("Use default loss 0.1")
-                edge_data["loss"] = -math.log(0.1)
 
-            await graph_storage.update_edge(source_id, target_id, edge_data)
-            return source_id, target_id, edge_data
+async def judge_statement(
+        trainee_llm_client: OpenAIModel,
+        graph_storage: NetworkXStorage,
+        rephrase_storage: JsonKVStorage,
+        re_judge: bool = False,
+        max_concurrent: int = 1000,
+        checkpoint: Checkpoint = None,
+        judgement_cache: BaseKVStorage = None) -> NetworkXStorage:
+    """
+    Judge the edges and nodes without a loss, or all of them with re_judge
 
-    edges = await graph_storage.get_all_edges()
+    :param trainee_llm_client: judge the statements to get comprehension loss
+    :param graph_storage: graph storage instance
+    :param rephrase_storage: rephrase storage instance
+    :param re_judge: re-judge the relations
+    :param max_concurrent: max concurrent
+    :param checkpoint: periodically flush graph_storage while judging
+    :param judgement_cache: see judge_single_statement
+    :return:
+    """
 
-    results = []
-    for result in tqdm_async(
-            asyncio.as_completed([_judge_single_relation(edge) for edge in edges]),
-            total=len(edges),
-            desc="Judging relations"
-    ):
-        results.append(await result)
+    semaphore = asyncio.Semaphore(max_concurrent)
 
-    async def _judge_single_entity(
-        node: tuple,
-    ):
+    async def _judge_single(ids: tuple, data: dict) -> tuple:
         async with semaphore:
-            node_id = node[0]
-            node_data = node[1]
-
-            if (not re_judge) and "loss" in node_data and node_data["loss"] is not None:
-                logger.info("Node %s already judged, loss: %s, skip", node_id, node_data["loss"])
-                return node_id, node_data
-
-            description = node_data["description"]
-
             try:
-                descriptions = await rephrase_storage.get_by_id(description)
-                assert descriptions is not None
-
-                judgements = []
-                gts = [gt for _, gt in descriptions]
-                for description, gt in descriptions:
-                    judgement = await trainee_llm_client.generate_topk_per_token(
-                        STATEMENT_JUDGEMENT_PROMPT['TEMPLATE'].format(statement=description)
-                    )
-                    judgements.append(judgement[0].top_candidates)
-
-                loss = yes_no_loss_entropy(judgements, gts)
-
-                logger.info("Node %s description: %s loss: %s", node_id, description, loss)
-
-                node_data["loss"] = loss
+                judgements = await collect_judgements(trainee_llm_client, rephrase_storage, data["description"],
+                                                      judgement_cache)
             except Exception as e: # pylint: disable=broad-except
-                logger.error("Error in judging entity %s: %s", node_id, e)
-                logger.info("Use default loss 0.1")
-                node_data["loss"] = -math.log(0.1)
-
-            await graph_storage.update_node(node_id, node_data)
-            return node_id, node_data
-
-    nodes = await graph_storage.get_all_nodes()
-
-    results = []
+                logger.error("Error in judging %s: %s", _name(ids), e)
+                judgements = ([], [])
+            return ids, data, judgements
+
+    async def _store_losses(judged: list):
+        losses = yes_no_losses_entropy(*pack_yes_no_judgements(
+            [judgements for _, _, (judgements, _) in judged], [gts for _, _, (_, gts) in judged]
+        ))
+        for (ids, data, _), loss in zip(judged, losses.tolist()):
+            if math.isnan(loss):
+                logger.info("Use default loss 0.1 for %s", _name(ids))
+                loss = DEFAULT_LOSS
+            else:
+                logger.info("%s description: %s loss: %s", _name(ids), data["description"], loss)
+            data["loss"] = loss
+            if len(ids) == 1:
+                await graph_storage.update_node(ids[0], data)
+            else:
+                await graph_storage.update_edge(*ids, data)
+            if checkpoint is not None:
+                await checkpoint.step()
+
+    if re_judge:
+        edges = await graph_storage.get_all_edges()
+        nodes = await graph_storage.get_all_nodes()
+    else:
+        edges = await graph_storage.get_dirty_edges()
+        nodes = await graph_storage.get_dirty_nodes()
+
+    # edges and nodes share one task pool, so the semaphore stays full until the last one is judged
+    judged = []
     for result in tqdm_async(
-            asyncio.as_completed([_judge_single_entity(node) for node in nodes]),
-            total=len(nodes),
-            desc="Judging entities"
+            asyncio.as_completed([_judge_single((src, tgt), data) for src, tgt, data in edges] +
+                                 [_judge_single((node_id,), data) for node_id, data in nodes]),
+            total=len(edges) + len(nodes),
+            desc="Judging relations and entities"
     ):
-        results.append(await result)
+        judged.append(await result)
+        if len(judged) >= LOSS_BATCH_SIZE:
+            await _store_losses(judged)
+            judged = []
+    await _store_losses(judged)
 
     return graph_storage
 
@@ -148,11 +197,11 @@ async def skip_judge_statement(
                 logger.info("Edge %s -> %s already judged, loss: %s, skip", source_id, target_id, edge_data["loss"])
                 return source_id, target_id, edge_data
 
-            edge_data["loss"] = -math.log(0.1)
+            edge_data["loss"] = DEFAULT_LOSS
             await graph_storage.update_edge(source_id, target_id, edge_data)
             return source_id, target_id, edge_data
 
-    edges = await graph_storage.get_all_edges()
+    edges = await graph_storage.get_dirty_edges()
     results = []
     for result in tqdm_async(
             asyncio.as_completed([_skip_single_relation(edge) for edge in edges]),
@@ -172,11 +221,11 @@ async def skip_judge_statement(
                 logger.info("Node %s already judged, loss: %s, skip", node_id, node_data["loss"])
                 return node_id, node_data
 
-            node_data["loss"] = -math.log(0.1)
+            node_data["loss"] = DEFAULT_LOSS
             await graph_storage.update_node(node_id, node_data)
             return node_id, node_data
 
-    nodes = await graph_storage.get_all_nodes()
+    nodes = await graph_storage.get_dirty_nodes()
     results = []
     for result in tqdm_async(
             asyncio.as_completed([_skip_single_entity(node) for node in nodes]),
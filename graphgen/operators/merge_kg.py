@@ -1,19 +1,42 @@
-from collections import Counter
+from collections import Counter, defaultdict
+from contextlib import asynccontextmanager
 import asyncio
 from tqdm.asyncio import tqdm as tqdm_async
 
 from graphgen.utils.format import split_string_by_multi_markers
-from graphgen.utils import logger, detect_main_language
+from graphgen.utils import logger, detect_main_language, compute_content_hash, compute_args_hash
 from graphgen.models import TopkTokenModel, Tokenizer
-from graphgen.models.storage.base_storage import BaseGraphStorage
-from graphgen.templates import KG_SUMMARIZATION_PROMPT, KG_EXTRACTION_PROMPT
+from graphgen.models.storage.base_storage import BaseGraphStorage, BaseKVStorage
+from graphgen.templates import KG_SUMMARIZATION_PROMPT, compile_prompt
+
+MAX_SUMMARY_TOKENS = 200
+
+# summary_cache keys, of the summary of a description set and of the descriptions a summary was made from
+SUMMARY_PREFIX = "summary-"
+SUMMARIZED_PREFIX = "summarized-"
+
+
+def _truncate_descriptions(descriptions: list[str], token_counts: list[int], tokenizer_instance: Tokenizer,
+                           max_tokens: int) -> list[str]:
+    truncated = []
+    for description, count in zip(descriptions, token_counts):
+        if count > max_tokens:
+            if max_tokens > 0:
+                tokens = tokenizer_instance.encode_string(description)
+                truncated.append(tokenizer_instance.decode_tokens(tokens[:max_tokens]))
+            break
+        truncated.append(description)
+        max_tokens -= count
+    return truncated
+
 
 async def _handle_kg_summary(
     entity_or_relation_name: str,
     description: str,
     llm_client: TopkTokenModel,
     tokenizer_instance: Tokenizer,
-    max_summary_tokens: int = 200
+    max_summary_tokens: int = MAX_SUMMARY_TOKENS,
+    summary_cache: BaseKVStorage = None
 ) -> str:
     """
     处理实体或关系的描述信息
@@ -23,36 +46,309 @@ async def _handle_kg_summary(
     :param llm_client
     :param tokenizer_instance
     :param max_summary_tokens
+    :param summary_cache: summaries by the hash of the model, the name, max_summary_tokens and the sorted
+                          description set, reused instead of summarizing again
     :return: new description
     """
+    descriptions = description.split('<SEP>')
+    # memoized, a description merged again on a later insert is not tokenized again
+    token_counts = [tokenizer_instance.count_tokens(d) for d in descriptions]
+    separator_tokens = tokenizer_instance.count_tokens('<SEP>')
+    if sum(token_counts) + separator_tokens * (len(descriptions) - 1) < max_summary_tokens:
+        return description
+
+    cache_key = SUMMARY_PREFIX + compute_args_hash(llm_client.model_name, entity_or_relation_name, max_summary_tokens,
+                                                   sorted(set(descriptions)))
+    if summary_cache is not None:
+        cached = await summary_cache.get_by_id(cache_key)
+        if cached is not None:
+            return cached["description"]
+
     language = detect_main_language(description)
     if language == "en":
         language = "English"
     else:
         language = "Chinese"
-    KG_EXTRACTION_PROMPT["FORMAT"]["language"] = language
-
-    tokens = tokenizer_instance.encode_string(description)
-    if len(tokens) <  max_summary_tokens:
-        return description
 
-    use_description = tokenizer_instance.decode_tokens(tokens[:max_summary_tokens])
-    prompt = KG_SUMMARIZATION_PROMPT[language]["TEMPLATE"].format(
+    prompt = compile_prompt(
+        KG_SUMMARIZATION_PROMPT[language]["TEMPLATE"],
+        **{**KG_SUMMARIZATION_PROMPT["FORMAT"], "language": language}
+    ).format(
         entity_name=entity_or_relation_name,
-        description_list=use_description.split('<SEP>'),
-        **KG_SUMMARIZATION_PROMPT["FORMAT"]
+        description_list=_truncate_descriptions(descriptions, token_counts, tokenizer_instance, max_summary_tokens)
     )
     new_description = await llm_client.generate_answer(prompt)
     logger.info("Entity or relation %s summary: %s", entity_or_relation_name, new_description)
+
+    if summary_cache is not None:
+        await summary_cache.upsert({
+            cache_key: {"description": new_description},
+            compute_content_hash(new_description, prefix=SUMMARIZED_PREFIX): {
+                "descriptions": sorted(set(await _summarized_descriptions(description, summary_cache)))
+            }
+        })
     return new_description
 
 
+async def _summarized_descriptions(description: str, summary_cache: BaseKVStorage = None) -> list[str]:
+    """
+    Descriptions a merged description stands for, the ones it was summarized from if it is a summary
+
+    :param description: joined with <SEP>
+    :param summary_cache
+    :return: descriptions
+    """
+    descriptions = []
+    for d in description.split('<SEP>'):
+        summarized = await summary_cache.get_by_id(
+            compute_content_hash(d, prefix=SUMMARIZED_PREFIX)
+        ) if summary_cache is not None else None
+        descriptions.extend(summarized["descriptions"] if summarized is not None else [d])
+    return descriptions
+
+
+async def _merge_descriptions(
+    new_descriptions: list[str],
+    existing_description: str = None,
+    summary_cache: BaseKVStorage = None
+) -> str:
+    """
+    Join the new descriptions with the existing ones. The existing description is kept as it is when every new
+    description is already in it, or in the descriptions it was summarized from.
+
+    :param new_descriptions
+    :param existing_description
+    :param summary_cache
+    :return: merged description
+    """
+    if existing_description is None:
+        return '<SEP>'.join(sorted(set(new_descriptions)))
+    if set(new_descriptions) <= set(await _summarized_descriptions(existing_description, summary_cache)):
+        return existing_description
+    return '<SEP>'.join(sorted(set(new_descriptions + existing_description.split('<SEP>'))))
+
+
+class KeyedLocks:
+    """
+    One asyncio lock per key, dropped once no coroutine holds or waits for it.
+    """
+    def __init__(self):
+        self._locks = {}
+        self._users = defaultdict(int)
+
+    @asynccontextmanager
+    async def lock(self, key):
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._users[key] += 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._users[key] -= 1
+            if self._users[key] == 0:
+                del self._users[key]
+                del self._locks[key]
+
+
+async def merge_node(
+    entity_name: str,
+    node_data: list[dict],
+    kg_instance: BaseGraphStorage,
+    llm_client: TopkTokenModel,
+    tokenizer_instance: Tokenizer,
+    max_summary_tokens: int = MAX_SUMMARY_TOKENS,
+    summary_cache: BaseKVStorage = None,
+    merged_queue: asyncio.Queue = None
+) -> dict:
+    """
+    Merge the extracted records of an entity into its node
+
+    :param entity_name
+    :param node_data: records extracted for the entity
+    :param kg_instance
+    :param llm_client
+    :param tokenizer_instance
+    :param max_summary_tokens: summarize the merged description from this length
+    :param summary_cache: see _handle_kg_summary
+    :param merged_queue: put ("node", (entity_name,)) once the node is new or its description changed,
+                         the description is already summarized then
+    :return: merged node data
+    """
+    entity_types = []
+    source_ids = []
+    existing_description = None
+
+    node = await kg_instance.get_node(entity_name)
+    # a node added implicitly by an edge has no data yet
+    if node:
+        entity_types.append(node["entity_type"])
+        source_ids.extend(
+            split_string_by_multi_markers(node["source_id"], ['<SEP>'])
+        )
+        existing_description = node["description"]
+
+    # 统计当前节点数据和已有节点数据的entity_type出现次数，取出现次数最多的entity_type
+    entity_type = sorted(
+        Counter(
+            [dp["entity_type"] for dp in node_data] + entity_types
+        ).items(),
+        key=lambda x: x[1],
+        reverse=True,
+    )[0][0]
+
+    description = await _merge_descriptions(
+        [dp["description"] for dp in node_data], existing_description, summary_cache
+    )
+    # an unchanged description set was already summarized when it was merged
+    if description != existing_description:
+        description = await _handle_kg_summary(
+            entity_name, description, llm_client, tokenizer_instance, max_summary_tokens, summary_cache
+        )
+
+    # a record of a batched extraction may come from several chunks
+    for dp in node_data:
+        source_ids.extend(split_string_by_multi_markers(dp["source_id"], ['<SEP>']))
+    source_id = '<SEP>'.join(set(source_ids))
+
+    node_data = {
+        "entity_type": entity_type,
+        "description": description,
+        "source_id": source_id
+    }
+    await kg_instance.upsert_node(
+        entity_name,
+        node_data=node_data
+    )
+    if merged_queue is not None and description != existing_description:
+        await merged_queue.put(("node", (entity_name,)))
+    node_data["entity_name"] = entity_name
+    return node_data
+
+
+async def merge_edge(
+    src_id: str,
+    tgt_id: str,
+    edge_data: list[dict],
+    kg_instance: BaseGraphStorage,
+    llm_client: TopkTokenModel,
+    tokenizer_instance: Tokenizer,
+    add_missing_nodes: bool = True,
+    max_summary_tokens: int = MAX_SUMMARY_TOKENS,
+    summary_cache: BaseKVStorage = None,
+    merged_queue: asyncio.Queue = None
+) -> dict:
+    """
+    Merge the extracted records of a relationship into its edge
+
+    :param src_id
+    :param tgt_id
+    :param edge_data: records extracted for the relationship
+    :param kg_instance
+    :param llm_client
+    :param tokenizer_instance
+    :param add_missing_nodes: add an UNKNOWN node for an end node that is not in the graph
+    :param max_summary_tokens: summarize the merged description from this length
+    :param summary_cache: see _handle_kg_summary
+    :param merged_queue: put ("node", (node_id,)) for an end node it adds, and ("edge", (src_id, tgt_id)) once
+                         the edge is new or its description changed
+    :return: merged edge data with the ids of the end nodes it added
+    """
+    source_ids = []
+    existing_description = None
+
+    edge = await kg_instance.get_edge(src_id, tgt_id)
+    if edge is not None:
+        source_ids.extend(
+            split_string_by_multi_markers(edge["source_id"], ['<SEP>'])
+        )
+        existing_description = edge["description"]
+
+    description = await _merge_descriptions(
+        [dp["description"] for dp in edge_data], existing_description, summary_cache
+    )
+    # a record of a batched extraction may come from several chunks
+    for dp in edge_data:
+        source_ids.extend(split_string_by_multi_markers(dp["source_id"], ['<SEP>']))
+    source_id = '<SEP>'.join(set(source_ids))
+
+    added_nodes = []
+    if add_missing_nodes:
+        for insert_id in [src_id, tgt_id]:
+            if not await kg_instance.has_node(insert_id):
+                await kg_instance.upsert_node(
+                    insert_id,
+                    node_data={
+                        "source_id": source_id,
+                        "description": description,
+                        "entity_type": "UNKNOWN"
+                    }
+                )
+                added_nodes.append(insert_id)
+
+    if description != existing_description:
+        description = await _handle_kg_summary(
+            f"({src_id}, {tgt_id})", description, llm_client, tokenizer_instance, max_summary_tokens, summary_cache
+        )
+
+    await kg_instance.upsert_edge(
+        src_id,
+        tgt_id,
+        edge_data={
+            "source_id": source_id,
+            "description": description
+        }
+    )
+    if merged_queue is not None:
+        for insert_id in added_nodes:
+            await merged_queue.put(("node", (insert_id,)))
+        if description != existing_description:
+            await merged_queue.put(("edge", (src_id, tgt_id)))
+
+    return {
+        "src_id": src_id,
+        "tgt_id": tgt_id,
+        "description": description,
+        "source_id": source_id,
+        "added_nodes": added_nodes
+    }
+
+
+async def add_placeholder_nodes(
+    edges: list[dict],
+    kg_instance: BaseGraphStorage
+) -> list[str]:
+    """
+    Add an UNKNOWN node for every end node of the merged edges that was never merged itself,
+    described by the first edge that refers to it. Used after merging with add_missing_nodes=False.
+
+    :param edges: merged edge data returned by merge_edge
+    :param kg_instance
+    :return: ids of the added nodes
+    """
+    added_nodes = []
+    for edge in edges:
+        for insert_id in [edge["src_id"], edge["tgt_id"]]:
+            if not await kg_instance.get_node(insert_id):
+                await kg_instance.upsert_node(
+                    insert_id,
+                    node_data={
+                        "source_id": edge["source_id"],
+                        "description": edge["description"],
+                        "entity_type": "UNKNOWN"
+                    }
+                )
+                added_nodes.append(insert_id)
+    return added_nodes
+
+
 async def merge_nodes(
     nodes_data: dict,
     kg_instance: BaseGraphStorage,
     llm_client: TopkTokenModel,
     tokenizer_instance: Tokenizer,
-    max_concurrent: int = 1000
+    max_concurrent: int = 1000,
+    merged_queue: asyncio.Queue = None,
+    summary_cache: BaseKVStorage = None
 ):
     """
     Merge nodes
@@ -62,6 +358,8 @@ async def merge_nodes(
     :param llm_client
     :param tokenizer_instance
     :param max_concurrent
+    :param merged_queue: see merge_node
+    :param summary_cache: see _handle_kg_summary
     :return
     """
 
@@ -69,49 +367,8 @@ async def merge_nodes(
 
     async def process_single_node(entity_name: str, node_data: list[dict]):
         async with semaphore:
-            entity_types = []
-            source_ids = []
-            descriptions = []
-
-            node = await kg_instance.get_node(entity_name)
-            if node is not None:
-                entity_types.append(node["entity_type"])
-                source_ids.extend(
-                    split_string_by_multi_markers(node["source_id"], ['<SEP>'])
-                )
-                descriptions.append(node["description"])
-
-            # 统计当前节点数据和已有节点数据的entity_type出现次数，取出现次数最多的entity_type
-            entity_type = sorted(
-                Counter(
-                    [dp["entity_type"] for dp in node_data] + entity_types
-                ).items(),
-                key=lambda x: x[1],
-                reverse=True,
-            )[0][0]
-
-            description = '<SEP>'.join(
-                sorted(set([dp["description"] for dp in node_data] + descriptions))
-            )
-            description = await _handle_kg_summary(
-                entity_name, description, llm_client, tokenizer_instance
-            )
-
-            source_id = '<SEP>'.join(
-                set([dp["source_id"] for dp in node_data] + source_ids)
-            )
-
-            node_data = {
-                "entity_type": entity_type,
-                "description": description,
-                "source_id": source_id
-            }
-            await kg_instance.upsert_node(
-                entity_name,
-                node_data=node_data
-            )
-            node_data["entity_name"] = entity_name
-            return node_data
+            return await merge_node(entity_name, node_data, kg_instance, llm_client, tokenizer_instance,
+                                    summary_cache=summary_cache, merged_queue=merged_queue)
 
     logger.info("Inserting entities into storage...")
     entities_data = []
@@ -134,7 +391,9 @@ async def merge_edges(
     kg_instance: BaseGraphStorage,
     llm_client: TopkTokenModel,
     tokenizer_instance: Tokenizer,
-    max_concurrent: int = 1000
+    max_concurrent: int = 1000,
+    merged_queue: asyncio.Queue = None,
+    summary_cache: BaseKVStorage = None
 ):
     """
     Merge edges
@@ -144,6 +403,8 @@ async def merge_edges(
     :param llm_client
     :param tokenizer_instance
     :param max_concurrent
+    :param merged_queue: see merge_edge
+    :param summary_cache: see _handle_kg_summary
     :return
     """
 
@@ -151,53 +412,8 @@ async def merge_edges(
 
     async def process_single_edge(src_id: str, tgt_id: str, edge_data: list[dict]):
         async with semaphore:
-            source_ids = []
-            descriptions = []
-
-            edge = await kg_instance.get_edge(src_id, tgt_id)
-            if edge is not None:
-                source_ids.extend(
-                    split_string_by_multi_markers(edge["source_id"], ['<SEP>'])
-                )
-                descriptions.append(edge["description"])
-
-            description = '<SEP>'.join(
-                sorted(set([dp["description"] for dp in edge_data] + descriptions))
-            )
-            source_id = '<SEP>'.join(
-                set([dp["source_id"] for dp in edge_data] + source_ids)
-            )
-
-            for insert_id in [src_id, tgt_id]:
-                if not await kg_instance.has_node(insert_id):
-                    await kg_instance.upsert_node(
-                        insert_id,
-                        node_data={
-                            "source_id": source_id,
-                            "description": description,
-                            "entity_type": "UNKNOWN"
-                        }
-                    )
-
-            description = await _handle_kg_summary(
-                f"({src_id}, {tgt_id})", description, llm_client, tokenizer_instance
-            )
-
-            await kg_instance.upsert_edge(
-                src_id,
-                tgt_id,
-                edge_data={
-                    "source_id": source_id,
-                    "description": description
-                }
-            )
-
-            edge_data = {
-                "src_id": src_id,
-                "tgt_id": tgt_id,
-                "description": description
-            }
-            return edge_data
+            return await merge_edge(src_id, tgt_id, edge_data, kg_instance, llm_client, tokenizer_instance,
+                                    summary_cache=summary_cache, merged_queue=merged_queue)
 
     logger.info("Inserting relationships into storage...")
     relationships_data = []
@@ -0,0 +1,180 @@
+import math
+import asyncio
+
+from graphgen.models import OpenAIModel, NetworkXStorage, JsonKVStorage, Checkpoint
+from graphgen.models.storage.base_storage import BaseKVStorage
+from graphgen.utils import logger
+from graphgen.operators.quiz import quiz_description
+from graphgen.operators.judge import judge_description
+from graphgen.operators.traverse_graph import (atomic_units, generate_atomic_qa, node_or_edge_key,
+                                               run_with_checkpoint)
+
+# put into a queue after the last item
+STOP = None
+
+
+async def _consume(in_queue: asyncio.Queue, handler, workers: int) -> int:
+    """
+    Run handler on the items of in_queue with the given number of workers until STOP arrives.
+
+    :return: number of handled items
+    """
+    handled = 0
+
+    async def _worker():
+        nonlocal handled
+        while True:
+            item = await in_queue.get()
+            if item is STOP:
+                # let the other workers see it too
+                await in_queue.put(STOP)
+                return
+            try:
+                await handler(item)
+                handled += 1
+            except Exception as e: # pylint: disable=broad-except
+                logger.error("Error occurred while streaming %s: %s", item, e)
+
+    await asyncio.gather(*[_worker() for _ in range(workers)])
+    return handled
+
+
+async def _get_node_or_edge(graph_storage: NetworkXStorage, item: tuple) -> tuple:
+    kind, ids = item
+    if kind == "node":
+        data = await graph_storage.get_node(ids[0])
+    else:
+        data = await graph_storage.get_edge(*ids)
+    return (*ids, data) if data is not None else None
+
+
+async def quiz_stage(
+    synth_llm_client: OpenAIModel,
+    graph_storage: NetworkXStorage,
+    rephrase_storage: JsonKVStorage,
+    in_queue: asyncio.Queue,
+    out_queue: asyncio.Queue,
+    max_samples: int = 1,
+    workers: int = 1000,
+    checkpoint: Checkpoint = None
+):
+    """
+    Quiz the description of each merged node and edge from in_queue, then pass it on to out_queue
+
+    :param synth_llm_client: generate statements
+    :param graph_storage: graph storage instance
+    :param rephrase_storage: rephrase storage instance
+    :param in_queue: ("node", (node_id,)) or ("edge", (src_id, tgt_id)) items, ended by STOP
+    :param out_queue: the quizzed items, ended by STOP
+    :param max_samples: max samples for each description
+    :param workers: number of items quizzed concurrently
+    :param checkpoint: periodically flush rephrase_storage while quizzing
+    """
+    semaphore = asyncio.Semaphore(workers)
+
+    async def _handle(item: tuple):
+        node_or_edge = await _get_node_or_edge(graph_storage, item)
+        if node_or_edge is None:
+            return
+        description, samples = await quiz_description(synth_llm_client, rephrase_storage,
+                                                       node_or_edge[-1]["description"], max_samples, semaphore)
+        await rephrase_storage.upsert({description: samples})
+        if checkpoint is not None:
+            await checkpoint.step()
+        await out_queue.put(item)
+
+    handled = await _consume(in_queue, _handle, workers)
+    await out_queue.put(STOP)
+    logger.info("[Pipeline] quizzed %d nodes and edges", handled)
+
+
+async def judge_stage(
+    trainee_llm_client: OpenAIModel,
+    graph_storage: NetworkXStorage,
+    rephrase_storage: JsonKVStorage,
+    in_queue: asyncio.Queue,
+    out_queue: asyncio.Queue = None,
+    re_judge: bool = False,
+    workers: int = 1000,
+    checkpoint: Checkpoint = None,
+    judgement_cache: BaseKVStorage = None
+):
+    """
+    Judge each quizzed node and edge from in_queue, then pass it on to out_queue
+
+    :param trainee_llm_client: judge the statements to get comprehension loss
+    :param graph_storage: graph storage instance
+    :param rephrase_storage: rephrase storage instance
+    :param in_queue: quizzed items, ended by STOP
+    :param out_queue: the judged items, ended by STOP
+    :param re_judge: re-judge nodes and edges that already have a loss
+    :param workers: number of items judged concurrently
+    :param checkpoint: periodically flush graph_storage while judging
+    :param judgement_cache: see judge_single_statement
+    """
+
+    async def _handle(item: tuple):
+        node_or_edge = await _get_node_or_edge(graph_storage, item)
+        if node_or_edge is None:
+            return
+        *ids, data = node_or_edge
+        if re_judge or data.get("loss") is None:
+            description = data["description"]
+            try:
+                loss = await judge_description(trainee_llm_client, rephrase_storage, description, judgement_cache)
+            except Exception as e: # pylint: disable=broad-except
+                logger.error("Error in judging %s: %s", ids, e)
+                logger.info("Use default loss 0.1")
+                loss = -math.log(0.1)
+            # a later chunk may have changed the description while it was judged, the item is queued again then
+            # and stays without a loss until its new description is judged
+            node_or_edge = await _get_node_or_edge(graph_storage, item)
+            if node_or_edge is None or node_or_edge[-1]["description"] != description:
+                return
+            # another worker may have judged the same description meanwhile
+            if re_judge or node_or_edge[-1].get("loss") is None:
+                if item[0] == "node":
+                    await graph_storage.update_node(*ids, {"loss": loss})
+                else:
+                    await graph_storage.update_edge(*ids, {"loss": loss})
+                if checkpoint is not None:
+                    await checkpoint.step()
+        if out_queue is not None:
+            await out_queue.put(item)
+
+    handled = await _consume(in_queue, _handle, workers)
+    if out_queue is not None:
+        await out_queue.put(STOP)
+    logger.info("[Pipeline] judged %d nodes and edges", handled)
+
+
+async def atomic_qa_stage(
+    llm_client: OpenAIModel,
+    graph_storage: NetworkXStorage,
+    in_queue: asyncio.Queue,
+    checkpoint: Checkpoint,
+    workers: int = 1000
+):
+    """
+    Generate the atomic QAs of each judged node and edge from in_queue. The QAs are saved in the checkpoint
+    under the keys traverse_graph_atomically uses, which collects them afterwards without generating them again.
+
+    :param llm_client: generate QAs
+    :param graph_storage: graph storage instance
+    :param in_queue: judged items, ended by STOP
+    :param checkpoint: checkpoint of the traversal
+    :param workers: number of items processed concurrently
+    """
+    semaphore = asyncio.Semaphore(workers)
+
+    async def _handle(item: tuple):
+        node_or_edge = await _get_node_or_edge(graph_storage, item)
+        if node_or_edge is None:
+            return
+        await asyncio.gather(*[
+            run_with_checkpoint(checkpoint, node_or_edge_key(unit), generate_atomic_qa(llm_client, unit, semaphore))
+            for unit in atomic_units(node_or_edge)
+        ])
+
+    handled = await _consume(in_queue, _handle, workers)
+    logger.info("[Pipeline] generated QAs of %d nodes and edges", handled)
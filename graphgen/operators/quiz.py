@@ -1,30 +1,29 @@
 import asyncio
-from collections import defaultdict
 
 from tqdm.asyncio import tqdm as tqdm_async
-from graphgen.models import JsonKVStorage, OpenAIModel, NetworkXStorage
+from graphgen.models import JsonKVStorage, OpenAIModel, NetworkXStorage, Checkpoint
 from graphgen.utils import logger, detect_main_language
 from graphgen.templates import DESCRIPTION_REPHRASING_PROMPT
 
 
-async def quiz(
+async def quiz_description(
         synth_llm_client: OpenAIModel,
-        graph_storage: NetworkXStorage,
         rephrase_storage: JsonKVStorage,
+        description: str,
         max_samples: int = 1,
-        max_concurrent: int = 1000) -> JsonKVStorage:
+        semaphore: asyncio.Semaphore = None) -> tuple:
     """
-    Get all edges and quiz them
+    Quiz all samples of a description. The samples are returned together once all of them are done,
+    so a description in rephrase_storage is always complete.
 
     :param synth_llm_client: generate statements
-    :param graph_storage: graph storage instance
-    :param rephrase_storage: rephrase storage instance
-    :param max_samples: max samples for each edge
-    :param max_concurrent: max concurrent
-    :return:
+    :param rephrase_storage: rephrase storage instance, descriptions already in it are not quizzed again
+    :param description: description to quiz
+    :param max_samples: max samples for the description
+    :param semaphore: limit of concurrent requests
+    :return: description and its statements with ground truths
     """
-
-    semaphore = asyncio.Semaphore(max_concurrent)
+    semaphore = semaphore or asyncio.Semaphore(2 * max_samples)
 
     async def _process_single_quiz(
         des: str,
@@ -48,62 +47,65 @@ async def quiz(
                 logger.error("Error when quizzing description %s: %s", des, e)
                 return None
 
+    language = "English" if detect_main_language(description) == "en" else "Chinese"
+    tasks = []
+    for i in range(max_samples):
+        if i > 0:
+            tasks.append(
+                _process_single_quiz(description,
+                                      DESCRIPTION_REPHRASING_PROMPT[language]['TEMPLATE'].format(
+                                          input_sentence=description), 'yes')
+            )
+        tasks.append(_process_single_quiz(description,
+                                          DESCRIPTION_REPHRASING_PROMPT[language]['ANTI_TEMPLATE'].format(
+                                              input_sentence=description), 'no'))
+
+    results = [(description, 'yes')]
+    for new_result in await asyncio.gather(*tasks):
+        if new_result:
+            results.extend(new_result[description])
+    return description, list(set(results))
 
-    edges = await graph_storage.get_all_edges()
-    nodes = await graph_storage.get_all_nodes()
 
-    results = defaultdict(list)
-    tasks = []
-    for edge in edges:
-        edge_data = edge[2]
+async def quiz(
+        synth_llm_client: OpenAIModel,
+        graph_storage: NetworkXStorage,
+        rephrase_storage: JsonKVStorage,
+        max_samples: int = 1,
+        max_concurrent: int = 1000,
+        checkpoint: Checkpoint = None) -> JsonKVStorage:
+    """
+    Quiz the descriptions of the edges and nodes that are not judged yet, see get_dirty_edges
+
+    :param synth_llm_client: generate statements
+    :param graph_storage: graph storage instance
+    :param rephrase_storage: rephrase storage instance
+    :param max_samples: max samples for each edge
+    :param max_concurrent: max concurrent
+    :param checkpoint: periodically flush rephrase_storage while quizzing
+    :return:
+    """
 
-        description = edge_data["description"]
-        language = "English" if detect_main_language(description) == "en" else "Chinese"
+    semaphore = asyncio.Semaphore(max_concurrent)
 
-        results[description] = [(description, 'yes')]
+    edges = await graph_storage.get_dirty_edges()
+    nodes = await graph_storage.get_dirty_nodes()
 
-        for i in range(max_samples):
-            if i > 0:
-                tasks.append(
-                    _process_single_quiz(description,
-                                          DESCRIPTION_REPHRASING_PROMPT[language]['TEMPLATE'].format(
-                                              input_sentence=description), 'yes')
-                )
-            tasks.append(_process_single_quiz(description,
-                                              DESCRIPTION_REPHRASING_PROMPT[language]['ANTI_TEMPLATE'].format(
-                                                  input_sentence=description), 'no'))
-
-    for node in nodes:
-        node_data = node[1]
-        description = node_data["description"]
-        language = "English" if detect_main_language(description) == "en" else "Chinese"
-
-        results[description] = [(description, 'yes')]
-
-        for i in range(max_samples):
-            if i > 0:
-                tasks.append(
-                    _process_single_quiz(description,
-                                          DESCRIPTION_REPHRASING_PROMPT[language]['TEMPLATE'].format(
-                                              input_sentence=description), 'yes')
-                )
-            tasks.append(_process_single_quiz(description,
-                                              DESCRIPTION_REPHRASING_PROMPT[language]['ANTI_TEMPLATE'].format(
-                                                  input_sentence=description), 'no'))
+    descriptions = dict.fromkeys(
+        [edge[2]["description"] for edge in edges] + [node[1]["description"] for node in nodes]
+    )
 
     for result in tqdm_async(
-            asyncio.as_completed(tasks),
-            total=len(tasks),
+            asyncio.as_completed([
+                quiz_description(synth_llm_client, rephrase_storage, des, max_samples, semaphore)
+                for des in descriptions
+            ]),
+            total=len(descriptions),
             desc="Quizzing descriptions"
     ):
-        new_result = await result
-        if new_result:
-            for key, value in new_result.items():
-                results[key].extend(value)
-
-    for key, value in results.items():
-        results[key] = list(set(value))
-        await rephrase_storage.upsert({key: results[key]})
-
+        description, samples = await result
+        await rephrase_storage.upsert({description: samples})
+        if checkpoint is not None:
+            await checkpoint.step()
 
     return rephrase_storage
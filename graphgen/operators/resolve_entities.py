@@ -0,0 +1,190 @@
+import base64
+import asyncio
+from collections import defaultdict
+
+import numpy as np
+
+from graphgen.models import ResolutionStrategy
+from graphgen.models.embed.embedding import EmbeddingFunc
+from graphgen.models.embed.similarity_index import HyperplaneIndex
+from graphgen.models.storage.base_storage import BaseGraphStorage, BaseKVStorage
+from graphgen.utils import logger, compute_args_hash
+
+# characters of the description embedded for an entity
+MAX_DESCRIPTION_CHARS = 512
+
+
+class _UnionFind:
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, x: int) -> int:
+        root = x
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[x] != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, x: int, y: int):
+        root_x, root_y = self.find(x), self.find(y)
+        if root_x != root_y:
+            self.parent[max(root_x, root_y)] = min(root_x, root_y)
+
+
+async def _embed(texts: list, embedding_func: EmbeddingFunc, batch_size: int) -> np.ndarray:
+    batches = await asyncio.gather(*[
+        embedding_func(texts[start:start + batch_size]) for start in range(0, len(texts), batch_size)
+    ])
+    vectors = np.concatenate([np.asarray(batch, dtype=np.float32) for batch in batches])
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+async def _embed_entities(names: list, descriptions: list, embedding_func: EmbeddingFunc,
+                          resolution_strategy: ResolutionStrategy) -> np.ndarray:
+    name_vectors, description_vectors = await asyncio.gather(
+        _embed(names, embedding_func, resolution_strategy.batch_size),
+        _embed([d[:MAX_DESCRIPTION_CHARS] for d in descriptions], embedding_func, resolution_strategy.batch_size)
+    )
+    weight = resolution_strategy.name_weight
+    return weight * name_vectors + (1 - weight) * description_vectors
+
+
+async def _embed_graph_nodes(names: list, descriptions: list, embedding_func: EmbeddingFunc,
+                             resolution_strategy: ResolutionStrategy, embedding_cache: BaseKVStorage) -> np.ndarray:
+    """
+    Embed nodes already in the graph, reusing the embeddings cached by node name and description,
+    so only new and changed nodes are embedded
+    """
+    if embedding_cache is None:
+        return await _embed_entities(names, descriptions, embedding_func, resolution_strategy)
+    keys = [
+        compute_args_hash(embedding_func.model_name, resolution_strategy.name_weight, name,
+                          description[:MAX_DESCRIPTION_CHARS])
+        for name, description in zip(names, descriptions)
+    ]
+    cached = await embedding_cache.get_by_ids(keys)
+    missing = [i for i, record in enumerate(cached) if record is None]
+    vectors = [
+        np.frombuffer(base64.b64decode(record["vector"]), dtype=np.float32) if record is not None else None
+        for record in cached
+    ]
+    if missing:
+        embedded = await _embed_entities([names[i] for i in missing], [descriptions[i] for i in missing],
+                                         embedding_func, resolution_strategy)
+        embedded = embedded.astype(np.float32)
+        for i, vector in zip(missing, embedded):
+            vectors[i] = vector
+        await embedding_cache.upsert({
+            keys[i]: {"vector": base64.b64encode(vector.tobytes()).decode("ascii")}
+            for i, vector in zip(missing, embedded)
+        })
+    logger.info("[Entity Resolution] embedded %d of %d graph nodes, the others are cached",
+                len(missing), len(names))
+    return np.stack(vectors)
+
+
+async def _entity_vectors(names: list, descriptions: list, num_new: int, embedding_func: EmbeddingFunc,
+                          resolution_strategy: ResolutionStrategy, embedding_cache: BaseKVStorage) -> np.ndarray:
+    # the first num_new entities are extracted ones, the others are graph nodes
+    vectors = await _embed_entities(names[:num_new], descriptions[:num_new], embedding_func, resolution_strategy)
+    if len(names) == num_new:
+        return vectors
+    graph_vectors = await _embed_graph_nodes(names[num_new:], descriptions[num_new:], embedding_func,
+                                             resolution_strategy, embedding_cache)
+    return np.concatenate([vectors, graph_vectors])
+
+
+def _canonical_name(group: list, names: list, record_counts: list, num_new: int) -> int:
+    existing = [i for i in group if i >= num_new]
+    if existing:
+        return min(existing, key=lambda i: names[i])
+    # the most extracted name, then the longest one
+    return max(group, key=lambda i: (record_counts[i], len(names[i]), names[i]))
+
+
+def _rename(nodes_data: dict, edges_data: dict, aliases: dict) -> tuple:
+    resolved_nodes = defaultdict(list)
+    for name, records in nodes_data.items():
+        canonical = aliases.get(name, name)
+        resolved_nodes[canonical].extend({**dp, "entity_name": canonical} for dp in records)
+
+    resolved_edges = defaultdict(list)
+    for (src_id, tgt_id), records in edges_data.items():
+        src_id, tgt_id = aliases.get(src_id, src_id), aliases.get(tgt_id, tgt_id)
+        if src_id == tgt_id:
+            continue
+        key = tuple(sorted((src_id, tgt_id)))
+        resolved_edges[key].extend({**dp, "src_id": key[0], "tgt_id": key[1]} for dp in records)
+
+    return dict(resolved_nodes), dict(resolved_edges)
+
+
+async def resolve_entities(
+    nodes_data: dict,
+    edges_data: dict,
+    embedding_func: EmbeddingFunc,
+    resolution_strategy: ResolutionStrategy,
+    kg_instance: BaseGraphStorage = None,
+    embedding_cache: BaseKVStorage = None
+) -> tuple:
+    """
+    Find extracted entities whose names and descriptions are near-duplicates ("U.S.", "USA"), and rename them to
+    one canonical name before merging. An entity resolved to a node already in the graph takes the node's name.
+
+    :param nodes_data: extracted entity records by entity name
+    :param edges_data: extracted relationship records by (src_id, tgt_id)
+    :param embedding_func: embeds a list of texts
+    :param resolution_strategy
+    :param kg_instance: graph whose nodes are resolved against when include_graph_nodes is set
+    :param embedding_cache: embeddings of graph nodes by the hash of (embedding model, name weight, name,
+                            description), so a graph node is only embedded again once its description changes
+    :return: nodes_data, edges_data and {alias: canonical name}
+    """
+    names = list(nodes_data.keys())
+    descriptions = [" ".join(dp["description"] for dp in records) for records in nodes_data.values()]
+    record_counts = [len(records) for records in nodes_data.values()]
+    num_new = len(names)
+
+    if resolution_strategy.include_graph_nodes and kg_instance is not None:
+        for node_id, node_data in await kg_instance.get_all_nodes():
+            if node_id not in nodes_data:
+                names.append(node_id)
+                descriptions.append(node_data.get("description", ""))
+                record_counts.append(0)
+
+    if num_new == 0 or len(names) < 2:
+        return nodes_data, edges_data, {}
+
+    vectors = await _entity_vectors(names, descriptions, num_new, embedding_func, resolution_strategy,
+                                    embedding_cache)
+
+    index = HyperplaneIndex(num_tables=resolution_strategy.num_tables, num_bits=resolution_strategy.num_bits)
+    pairs = index.similar_pairs(vectors, resolution_strategy.similarity_threshold)
+
+    union_find = _UnionFind(len(names))
+    for i, j in pairs:
+        # nodes already in the graph are never merged with each other
+        if i < num_new or j < num_new:
+            union_find.union(int(i), int(j))
+
+    groups = defaultdict(list)
+    for i in range(len(names)):
+        groups[union_find.find(i)].append(i)
+
+    aliases = {}
+    for group in groups.values():
+        if len(group) < 2:
+            continue
+        canonical = names[_canonical_name(group, names, record_counts, num_new)]
+        for i in group:
+            if i < num_new and names[i] != canonical:
+                aliases[names[i]] = canonical
+
+    if not aliases:
+        return nodes_data, edges_data, {}
+
+    resolved_nodes, resolved_edges = _rename(nodes_data, edges_data, aliases)
+    logger.info("[Entity Resolution] resolved %d entity names into %d entities",
+                len(nodes_data), len(resolved_nodes))
+    return resolved_nodes, resolved_edges, aliases
@@ -1,9 +1,11 @@
+import json
 import asyncio
 import gradio as gr
+import numpy as np
 
 from tqdm.asyncio import tqdm as tqdm_async
 
-from graphgen.models import OpenAIModel, NetworkXStorage, TraverseStrategy, Tokenizer, JsonKVStorage
+from graphgen.models import OpenAIModel, NetworkXStorage, TraverseStrategy, Tokenizer, JsonKVStorage, Checkpoint
 from graphgen.templates import ANSWER_REPHRASING_PROMPT, QUESTION_GENERATION_PROMPT, MULTI_HOP_GENERATION_PROMPT
 from graphgen.utils import detect_main_language, compute_content_hash, logger
 from graphgen.operators.split_graph import get_batches_with_strategy
@@ -92,12 +94,42 @@ async def _construct_rephrasing_prompt(_process_nodes: list,
     )
     return prompt
 
-def get_loss_tercile(losses: list) -> (float, float):
-    losses = sorted(losses)
+def _batch_key(batch: tuple) -> str:
+    nodes, edges, difficulty = batch
+    return compute_content_hash(json.dumps([
+        sorted(node['node_id'] for node in nodes), sorted([edge[0], edge[1]] for edge in edges), difficulty
+    ], ensure_ascii=False))
+
+def node_or_edge_key(node_or_edge: tuple) -> str:
+    # the graph is undirected, an edge may come back in either orientation
+    return compute_content_hash(json.dumps(
+        sorted(node_or_edge[:-1]) + [node_or_edge[-1]['description']], ensure_ascii=False
+    ))
+
+async def run_with_checkpoint(checkpoint: Checkpoint, key: str, coro) -> dict:
+    """
+    Return the saved QAs of a unit if there are any, otherwise run coro and save its QAs.
+    """
+    if checkpoint is None:
+        return await coro
+    saved = await checkpoint.load(key)
+    if saved is not None:
+        coro.close()
+        return saved
+    result = await coro
+    if result:
+        await checkpoint.save(key, result)
+    return result
+
+def get_loss_tercile(losses: np.ndarray) -> (float, float):
+    """
+    The losses at a third and two thirds of the sorted losses, found in linear time with np.partition.
+    np.quantile is not used as none of its methods picks the same elements.
+    """
     q1_index = int(len(losses) * (1 / 3))
     q2_index = int(len(losses) * (2 / 3))
-
-    return losses[q1_index], losses[q2_index]
+    q1, q2 = np.partition(losses, [q1_index, q2_index])[[q1_index, q2_index]]
+    return float(q1), float(q2)
 
 def assign_difficulty(subgraphs: list, difficulty_order: list, loss_strategy: str) -> list:
     """
@@ -108,24 +140,17 @@ def assign_difficulty(subgraphs: list, difficulty_order: list, loss_strategy: st
     :param loss_strategy
     :return
     """
-    losses = []
-    for subgraph in subgraphs:
-        loss = get_average_loss(subgraph, loss_strategy)
-        losses.append(loss)
+    if not subgraphs:
+        return subgraphs
+    losses = np.fromiter((get_average_loss(subgraph, loss_strategy) for subgraph in subgraphs),
+                         dtype=np.float64, count=len(subgraphs))
     q1, q2 = get_loss_tercile(losses)
 
-    for i, subgraph in enumerate(subgraphs):
-        loss = get_average_loss(subgraph, loss_strategy)
-        if loss < q1:
-            # easy
-            subgraphs[i] = (subgraph[0], subgraph[1], difficulty_order[0])
-        elif loss < q2:
-            # medium
-            subgraphs[i] = (subgraph[0], subgraph[1], difficulty_order[1])
-        else:
-            # hard
-            subgraphs[i] = (subgraph[0], subgraph[1], difficulty_order[2])
-    return subgraphs
+    # 0 easy (below q1), 1 medium (below q2), 2 hard
+    levels = (losses >= q1).astype(np.int64) + (losses >= q2)
+    return [
+        (subgraph[0], subgraph[1], difficulty_order[level]) for subgraph, level in zip(subgraphs, levels.tolist())
+    ]
 
 def get_average_loss(batch: tuple, loss_strategy: str) -> float:
     if loss_strategy == "only_edge":
@@ -169,7 +194,8 @@ async def traverse_graph_by_edge(
     traverse_strategy: TraverseStrategy,
     text_chunks_storage: JsonKVStorage,
     progress_bar: gr.Progress = None,
-    max_concurrent: int = 1000
+    max_concurrent: int = 1000,
+    checkpoint: Checkpoint = None
 ) -> dict:
     """
     Traverse the graph
@@ -181,6 +207,7 @@ async def traverse_graph_by_edge(
     :param text_chunks_storage
     :param progress_bar
     :param max_concurrent
+    :param checkpoint: save the QAs of each batch as they are generated and reuse the saved ones
     :return: question and answer
     """
 
@@ -291,7 +318,8 @@ async def traverse_graph_by_edge(
                                            traverse_strategy.loss_strategy)
 
     for result in tqdm_async(asyncio.as_completed(
-        [_process_single_batch(batch) for batch in processing_batches]
+        [run_with_checkpoint(checkpoint, _batch_key(batch), _process_single_batch(batch))
+         for batch in processing_batches]
     ), total=len(processing_batches), desc="Generating QAs"):
         try:
             results.update(await result)
@@ -303,6 +331,75 @@ async def traverse_graph_by_edge(
     return results
 
 
+def atomic_units(node_or_edge: tuple) -> list:
+    """
+    Split a node or an edge into one unit per merged description.
+
+    :param node_or_edge
+    :return: nodes or edges with a single description each
+    """
+    *ids, data = node_or_edge
+    if "<SEP>" in data['description']:
+        return [(*ids, {"description": item, 'loss': data['loss']}) for item in data['description'].split("<SEP>")]
+    return [node_or_edge]
+
+async def generate_atomic_qa(
+    llm_client: OpenAIModel,
+    node_or_edge: tuple,
+    semaphore: asyncio.Semaphore
+) -> dict:
+    """
+    Generate a QA from the description of a node (node_id, data) or an edge (src_id, tgt_id, data)
+
+    :param llm_client
+    :param node_or_edge
+    :param semaphore
+    :return: question and answer
+    """
+    if len(node_or_edge) == 2:
+        des = node_or_edge[0] + ": " + node_or_edge[1]['description']
+        loss = node_or_edge[1]['loss']
+    else:
+        des = node_or_edge[2]['description']
+        loss = node_or_edge[2]['loss']
+
+    async with semaphore:
+        try:
+            language = "Chinese" if detect_main_language(des) == "zh" else "English"
+
+            qa = await llm_client.generate_answer(
+                QUESTION_GENERATION_PROMPT[language]['SINGLE_QA_TEMPLATE'].format(
+                    doc=des
+                )
+            )
+
+            if "Question:" in qa and "Answer:" in qa:
+                question = qa.split("Question:")[1].split("Answer:")[0].strip()
+                answer = qa.split("Answer:")[1].strip()
+            elif "问题：" in qa and "答案：" in qa:
+                question = qa.split("问题：")[1].split("答案：")[0].strip()
+                answer = qa.split("答案：")[1].strip()
+            else:
+                return {}
+
+            question = question.strip("\"")
+            answer = answer.strip("\"")
+
+            logger.info("Question: %s", question)
+            logger.info("Answer: %s", answer)
+            return {
+                compute_content_hash(question): {
+                    "question": question,
+                    "answer": answer,
+                    "loss": loss,
+                    "difficulty": "medium"
+                }
+            }
+        except Exception as e: # pylint: disable=broad-except
+            logger.error("Error occurred while generating question: %s", e)
+            return {}
+
+
 async def traverse_graph_atomically(
     llm_client: OpenAIModel,
     tokenizer: Tokenizer,
@@ -310,7 +407,8 @@ async def traverse_graph_atomically(
     traverse_strategy: TraverseStrategy,
     text_chunks_storage: JsonKVStorage,
     progress_bar: gr.Progress = None,
-    max_concurrent: int = 1000
+    max_concurrent: int = 1000,
+    checkpoint: Checkpoint = None
 ) -> dict:
     """
     Traverse the graph atomicly
@@ -322,81 +420,24 @@ async def traverse_graph_atomically(
     :param text_chunks_storage
     :param progress_bar
     :param max_concurrent
+    :param checkpoint: save the QAs of each node and edge as they are generated and reuse the saved ones
     :return: question and answer
     """
     assert traverse_strategy.qa_form == "atomic"
 
     semaphore = asyncio.Semaphore(max_concurrent)
-    async def _generate_question(
-        node_or_edge: tuple
-    ):
-        if len(node_or_edge) == 2:
-            des = node_or_edge[0] + ": " + node_or_edge[1]['description']
-            loss = node_or_edge[1]['loss']
-        else:
-            des = node_or_edge[2]['description']
-            loss = node_or_edge[2]['loss']
-
-        async with semaphore:
-            try:
-                language = "Chinese" if detect_main_language(des) == "zh" else "English"
-
-                qa = await llm_client.generate_answer(
-                    QUESTION_GENERATION_PROMPT[language]['SINGLE_QA_TEMPLATE'].format(
-                        doc=des
-                    )
-                )
-
-                if "Question:" in qa and "Answer:" in qa:
-                    question = qa.split("Question:")[1].split("Answer:")[0].strip()
-                    answer = qa.split("Answer:")[1].strip()
-                elif "问题：" in qa and "答案：" in qa:
-                    question = qa.split("问题：")[1].split("答案：")[0].strip()
-                    answer = qa.split("答案：")[1].strip()
-                else:
-                    return {}
-
-                question = question.strip("\"")
-                answer = answer.strip("\"")
-
-                logger.info("Question: %s", question)
-                logger.info("Answer: %s", answer)
-                return {
-                    compute_content_hash(question): {
-                        "question": question,
-                        "answer": answer,
-                        "loss": loss,
-                        "difficulty": "medium"
-                    }
-                }
-            except Exception as e: # pylint: disable=broad-except
-                logger.error("Error occurred while generating question: %s", e)
-                return {}
-
     results = {}
     edges = list(await graph_storage.get_all_edges())
     nodes = list(await graph_storage.get_all_nodes())
 
     edges, nodes = await _pre_tokenize(graph_storage, tokenizer, edges, nodes)
 
-    tasks = []
-    for node in nodes:
-        if "<SEP>" in node[1]['description']:
-            description_list = node[1]['description'].split("<SEP>")
-            for item in description_list:
-                tasks.append((node[0], {"description": item, 'loss': node[1]['loss']}))
-        else:
-            tasks.append((node[0], node[1]))
-    for edge in edges:
-        if "<SEP>" in edge[2]['description']:
-            description_list = edge[2]['description'].split("<SEP>")
-            for item in description_list:
-                tasks.append((edge[0], edge[1], {"description": item, 'loss': edge[2]['loss']}))
-        else:
-            tasks.append((edge[0], edge[1], edge[2]))
+    tasks = [unit for node_or_edge in nodes + edges for unit in atomic_units(node_or_edge)]
 
     for result in tqdm_async(
-        asyncio.as_completed([_generate_question(task) for task in tasks]),
+        asyncio.as_completed([run_with_checkpoint(checkpoint, node_or_edge_key(task),
+                                                   generate_atomic_qa(llm_client, task, semaphore))
+                              for task in tasks]),
         total=len(tasks),
         desc="Generating QAs"
     ):
@@ -415,7 +456,8 @@ async def traverse_graph_for_multi_hop(
     traverse_strategy: TraverseStrategy,
     text_chunks_storage: JsonKVStorage,
     progress_bar: gr.Progress = None,
-    max_concurrent: int = 1000
+    max_concurrent: int = 1000,
+    checkpoint: Checkpoint = None
 ) -> dict:
     """
     Traverse the graph for multi-hop
@@ -427,6 +469,7 @@ async def traverse_graph_for_multi_hop(
     :param text_chunks_storage
     :param progress_bar
     :param max_concurrent
+    :param checkpoint: save the QAs of each batch as they are generated and reuse the saved ones
     :return: question and answer
     """
     assert traverse_strategy.qa_form == "multi_hop"
@@ -508,7 +551,8 @@ async def traverse_graph_for_multi_hop(
                 return {}
 
     for result in tqdm_async(
-        asyncio.as_completed([_process_single_batch(batch) for batch in processing_batches]),
+        asyncio.as_completed([run_with_checkpoint(checkpoint, _batch_key(batch), _process_single_batch(batch))
+                              for batch in processing_batches]),
         total=len(processing_batches),
         desc="Generating QAs"
     ):
@@ -7,3 +7,4 @@ from .answer_rephrasing import ANSWER_REPHRASING_PROMPT
 from .question_generation import QUESTION_GENERATION_PROMPT
 from .multi_hop_generation import MULTI_HOP_GENERATION_PROMPT
 from .coreference_resolution import COREFERENCE_RESOLUTION_TEMPLATE
+from .prompt_compiler import CompiledPrompt, compile_prompt
@@ -188,14 +188,39 @@ Answer YES | NO if there are still entities and relationships that need to be ad
 
 IF_LOOP_ZH: str = """看起来可能仍然遗漏了一些实体和关系。如果仍有实体和关系需要添加，请回答YES | NO。"""
 
+BATCH_INSTRUCTION_EN: str = """-Passages-
+The text below is made of several independent passages, each starting with a tag such as [C1].
+Extract entities and relationships from every passage, and append the tag of the passage a record comes from \
+as the last field of the record, without brackets, for example:
+("entity"{tuple_delimiter}<entity_name>{tuple_delimiter}<entity_type>{tuple_delimiter}<entity_summary>{tuple_delimiter}C1)
+("relationship"{tuple_delimiter}<source_entity>{tuple_delimiter}<target_entity>{tuple_delimiter}<relationship_summary>{tuple_delimiter}C1)
+Only relate entities of the same passage.
+
+"""
+
+BATCH_INSTRUCTION_ZH: str = """-段落-
+下面的文本由若干相互独立的段落组成，每个段落以[C1]这样的标签开头。
+请从每个段落中提取实体和关系，并将记录所在段落的标签（不带方括号）作为记录的最后一个字段，例如：
+("entity"{tuple_delimiter}<entity_name>{tuple_delimiter}<entity_type>{tuple_delimiter}<entity_summary>{tuple_delimiter}C1)
+("relationship"{tuple_delimiter}<source_entity>{tuple_delimiter}<target_entity>{tuple_delimiter}<relationship_summary>{tuple_delimiter}C1)
+只关联同一段落中的实体。
+
+"""
+
+# several short chunks in one request, input_text holds the tagged passages
+BATCH_TEMPLATE_EN: str = TEMPLATE_EN.replace("-Real Data-", BATCH_INSTRUCTION_EN + "-Real Data-", 1)
+BATCH_TEMPLATE_ZH: str = TEMPLATE_ZH.replace("-真实数据-", BATCH_INSTRUCTION_ZH + "-真实数据-", 1)
+
 KG_EXTRACTION_PROMPT: dict = {
     "English": {
         "TEMPLATE": TEMPLATE_EN,
+        "BATCH_TEMPLATE": BATCH_TEMPLATE_EN,
         "CONTINUE": CONTINUE_EN,
         "IF_LOOP": IF_LOOP_EN,
     },
     "Chinese": {
         "TEMPLATE": TEMPLATE_ZH,
+        "BATCH_TEMPLATE": BATCH_TEMPLATE_ZH,
         "CONTINUE": CONTINUE_ZH,
         "IF_LOOP": IF_LOOP_ZH,
     },
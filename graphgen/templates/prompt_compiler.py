@@ -0,0 +1,90 @@
+from string import Formatter
+from functools import lru_cache
+from dataclasses import dataclass, field
+
+_FORMATTER = Formatter()
+
+
+@dataclass(frozen=True)
+class CompiledPrompt:
+    """
+    A prompt template whose static fields (delimiters, language, entity types...) are already rendered.
+
+    parts holds literal text and (field_name, conversion, format_spec) tuples of the fields left for each call,
+    so format only joins strings and never touches shared template state.
+    """
+    parts: tuple
+    _token_counts: dict = field(default_factory=dict, compare=False, repr=False)
+
+    @property
+    def static_text(self) -> str:
+        return "".join(part for part in self.parts if isinstance(part, str))
+
+    def format(self, **kwargs) -> str:
+        """
+        Interpolate the per-call fields
+
+        :param kwargs: values of the fields left by compile_prompt
+        :return: prompt
+        """
+        pieces = []
+        for part in self.parts:
+            if isinstance(part, str):
+                pieces.append(part)
+            else:
+                name, conversion, format_spec = part
+                value = _FORMATTER.convert_field(kwargs[name], conversion)
+                pieces.append(_FORMATTER.format_field(value, format_spec))
+        return "".join(pieces)
+
+    def static_token_count(self, tokenizer_instance) -> int:
+        """
+        Count the tokens of the rendered static text, once per tokenizer
+
+        :param tokenizer_instance: graphgen.models.Tokenizer
+        :return: number of tokens the prompt costs besides its per-call fields
+        """
+        name = tokenizer_instance.model_name
+        if name not in self._token_counts:
+            self._token_counts[name] = tokenizer_instance.count_tokens(self.static_text)
+        return self._token_counts[name]
+
+
+def _compile(template: str, static_fields: dict) -> CompiledPrompt:
+    parts = []
+    literal = []
+    for text, name, format_spec, conversion in _FORMATTER.parse(template):
+        literal.append(text)
+        if name is None:
+            continue
+        if name in static_fields:
+            # static fields are rendered with the same rules as str.format
+            value = _FORMATTER.convert_field(static_fields[name], conversion)
+            literal.append(_FORMATTER.format_field(value, format_spec))
+        else:
+            parts.append("".join(literal))
+            literal = []
+            parts.append((name, conversion, format_spec))
+    parts.append("".join(literal))
+    return CompiledPrompt(parts=tuple(part for part in parts if part != ""))
+
+
+@lru_cache(maxsize=None)
+def _compile_cached(template: str, static_items: tuple) -> CompiledPrompt:
+    return _compile(template, dict(static_items))
+
+
+def compile_prompt(template: str, **static_fields) -> CompiledPrompt:
+    """
+    Pre-render the static fields of a template. Compiled prompts are cached by template and static values,
+    so callers can compile on every call and only pay for it the first time.
+
+    Example:
+        compile_prompt(KG_EXTRACTION_PROMPT["English"]["TEMPLATE"], **KG_EXTRACTION_PROMPT["FORMAT"])
+        .format(input_text=content)
+
+    :param template: str.format template
+    :param static_fields: values shared by all calls, fields the template does not use are ignored
+    :return: compiled prompt
+    """
+    return _compile_cached(template, tuple(sorted(static_fields.items())))
@@ -3,7 +3,8 @@ from .loop import create_event_loop
 from .format import (pack_history_conversations, split_string_by_multi_markers,
                      handle_single_entity_extraction, handle_single_relationship_extraction,
                      load_json, write_json)
+from .record_parser import RecordParser
 from .hash import compute_content_hash, compute_args_hash
 from .detect_lang import detect_main_language, detect_if_chinese
-from .calculate_confidence import yes_no_loss_entropy
+from .calculate_confidence import yes_no_loss_entropy, yes_no_losses_entropy, pack_yes_no_judgements
 from .help_nltk import NLTKHelper
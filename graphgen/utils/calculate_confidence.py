@@ -1,5 +1,6 @@
 import math
 from typing import List
+import numpy as np
 from graphgen.models.llm.topk_token_model import Token
 
 def preprocess_tokens(tokens: List[Token]) -> List[Token]:
@@ -41,14 +42,55 @@ def yes_no_loss(tokens_list: List[List[Token]], ground_truth: List[str]) -> floa
             losses.append(token.prob)
     return sum(losses) / len(losses)
 
+def pack_yes_no_judgements(judgements_list: List[List[List[Token]]], ground_truths: List[List[str]]) -> tuple:
+    """
+    Pack the first tokens of the yes/no judgements of several elements into arrays.
+
+    :param judgements_list: judgements of each element, each judgement a list of tokens
+    :param ground_truths: ground truth of each judgement of each element
+    :return: probs and correctness of the first token of every judgement, index of the element of every judgement,
+             and whether every judgement of each element is a yes or a no. An element with an empty judgement,
+             or with not as many judgements as ground truths, is invalid
+    """
+    probs, correct, element_index = [], [], []
+    valid = np.ones(len(judgements_list), dtype=bool)
+    for i, (tokens_list, ground_truth) in enumerate(zip(judgements_list, ground_truths)):
+        if len(tokens_list) != len(ground_truth):
+            valid[i] = False
+            continue
+        for tokens, gt in zip(tokens_list, ground_truth):
+            if not tokens:
+                valid[i] = False
+                continue
+            token = tokens[0]
+            if token.text.lower() not in ("yes", "no"):
+                valid[i] = False
+            probs.append(token.prob)
+            correct.append(token.text == gt)
+            element_index.append(i)
+    return (np.asarray(probs, dtype=np.float64), np.asarray(correct, dtype=bool),
+            np.asarray(element_index, dtype=np.int64), valid)
+
+def yes_no_losses_entropy(probs: np.ndarray, correct: np.ndarray, element_index: np.ndarray,
+                          valid: np.ndarray) -> np.ndarray:
+    """
+    Calculate the entropy loss of yes/no questions of many elements at once, see pack_yes_no_judgements.
+
+    :return: mean loss of the judgements of each element, NaN for an element without judgements,
+             with a judgement that is neither yes nor no or with an infinite loss
+    """
+    with np.errstate(divide="ignore"):
+        losses = -np.log(np.where(correct, probs, 1 - probs))
+    counts = np.bincount(element_index, minlength=len(valid))
+    sums = np.bincount(element_index, weights=losses, minlength=len(valid))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        element_losses = sums / counts
+    element_losses[~valid | ~np.isfinite(element_losses)] = np.nan
+    return element_losses
+
 def yes_no_loss_entropy(tokens_list: List[List[Token]], ground_truth: List[str]) -> float:
     """Calculate the loss for yes/no question using entropy."""
-    losses = []
-    for i, tokens in enumerate(tokens_list):
-        token = tokens[0]
-        assert token.text.lower() in ["yes", "no"]
-        if token.text == ground_truth[i]:
-            losses.append(-math.log(token.prob))
-        else:
-            losses.append(-math.log(1 - token.prob))
-    return sum(losses) / len(losses)
+    loss = yes_no_losses_entropy(*pack_yes_no_judgements([tokens_list], [ground_truth]))[0]
+    if np.isnan(loss):
+        raise ValueError("Judgements must be yes or no with a probability between 0 and 1")
+    return float(loss)
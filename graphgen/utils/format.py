@@ -3,19 +3,27 @@ import os
 import json
 import html
 
+from functools import lru_cache
 from typing import Any
 
+CONTROL_CHARACTERS = re.compile(r"[\x00-\x1f\x7f-\x9f]")
+
 def pack_history_conversations(*args: str):
     roles = ["user", "assistant"]
     return [
         {"role": roles[i % 2], "content": content} for i, content in enumerate(args)
     ]
 
+@lru_cache(maxsize=None)
+def compile_markers(markers: tuple) -> re.Pattern:
+    """Compile the pattern matching any of the markers"""
+    return re.compile("|".join(re.escape(marker) for marker in markers))
+
 def split_string_by_multi_markers(content: str, markers: list[str]) -> list[str]:
     """Split a string by multiple markers"""
     if not markers:
         return [content]
-    results = re.split("|".join(re.escape(marker) for marker in markers), content)
+    results = compile_markers(tuple(markers)).split(content)
     return [r.strip() for r in results if r.strip()]
 
 # Refer the utils functions of the official GraphRAG implementation:
@@ -26,11 +34,16 @@ def clean_str(input: Any) -> str:
     if not isinstance(input, str):
         return input
 
-    result = html.unescape(input.strip())
+    result = input.strip()
+    if "&" in result:
+        result = html.unescape(result)
+    # control characters are never printable, most fields need no substitution
+    if result.isprintable():
+        return result
     # https://stackoverflow.com/questions/4324790/removing-control-characters-from-a-string-in-python
-    return re.sub(r"[\x00-\x1f\x7f-\x9f]", "", result)
+    return CONTROL_CHARACTERS.sub("", result)
 
-async def handle_single_entity_extraction(
+def handle_single_entity_extraction(
     record_attributes: list[str],
     chunk_key: str,
 ):
@@ -53,7 +66,7 @@ async def handle_single_entity_extraction(
 def is_float_regex(value):
     return bool(re.match(r"^[-+]?[0-9]*\.?[0-9]+$", value))
 
-async def handle_single_relationship_extraction(
+def handle_single_relationship_extraction(
     record_attributes: list[str],
     chunk_key: str,
 ):
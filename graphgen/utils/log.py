@@ -2,14 +2,14 @@ import logging
 
 logger = logging.getLogger("graphgen")
 
-def set_logger(log_file: str, log_level: int = logging.INFO, if_stream: bool = True):
+def set_logger(log_file: str, log_level: int = logging.INFO, if_stream: bool = True, file_mode: str = 'w'):
     logger.setLevel(log_level)
 
     formatter = logging.Formatter(
         "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
     )
 
-    file_handler = logging.FileHandler(log_file, mode='w')
+    file_handler = logging.FileHandler(log_file, mode=file_mode)
     file_handler.setLevel(log_level)
     file_handler.setFormatter(formatter)
 
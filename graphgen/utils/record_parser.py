@@ -0,0 +1,88 @@
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from .format import compile_markers, handle_single_entity_extraction, handle_single_relationship_extraction
+
+RECORD_CONTENT = re.compile(r"\((.*)\)")
+
+
+@dataclass
+class RecordParser:
+    """
+    Parser of the tuple-delimited records in KG extraction answers, e.g.
+    ("entity"<|>"NAME"<|>"type"<|>"summary")##("relationship"<|>"SRC"<|>"TGT"<|>"summary")<|COMPLETE|>
+
+    The delimiter patterns are compiled once, and each record is turned into an entity or a relationship
+    by looking at its first field once instead of trying both handlers.
+    """
+    tuple_delimiter: str = "<|>"
+    record_delimiter: str = "##"
+    completion_delimiter: str = "<|COMPLETE|>"
+
+    def __post_init__(self):
+        self._record_splitter = compile_markers((self.record_delimiter, self.completion_delimiter))
+
+    def split_records(self, text: str) -> List[str]:
+        """
+        Split an answer into the text inside the parentheses of each record
+
+        :param text: answer of an extraction or gleaning request
+        :return: records
+        """
+        records = []
+        for record in self._record_splitter.split(text):
+            match = RECORD_CONTENT.search(record)
+            if match is not None:
+                records.append(match.group(1))
+        return records
+
+    def split_attributes(self, record: str) -> List[str]:
+        """
+        Split a record into its non-empty fields
+
+        :param record: text inside the parentheses of a record
+        :return: fields
+        """
+        attributes = []
+        for attribute in record.split(self.tuple_delimiter):
+            attribute = attribute.strip()
+            if attribute:
+                attributes.append(attribute)
+        return attributes
+
+    @staticmethod
+    def parse_attributes(record_attributes: List[str], source_id: str) -> Tuple[Optional[str], Optional[dict]]:
+        """
+        Turn the fields of a record into an entity or a relationship
+
+        :param record_attributes: fields of the record
+        :param source_id: id of the chunk the record comes from
+        :return: ("entity", entity), ("relationship", relationship) or (None, None)
+        """
+        if len(record_attributes) < 4:
+            return None, None
+        if record_attributes[0] == '"entity"':
+            entity = handle_single_entity_extraction(record_attributes, source_id)
+            return ("entity", entity) if entity is not None else (None, None)
+        if record_attributes[0] == '"relationship"':
+            return "relationship", handle_single_relationship_extraction(record_attributes, source_id)
+        return None, None
+
+    def parse(self, text: str, source_id: str) -> Tuple[List[dict], List[dict]]:
+        """
+        Parse all entities and relationships of an answer
+
+        :param text: answer of an extraction or gleaning request
+        :param source_id: id of the chunk the answer comes from
+        :return: entities, relationships
+        """
+        entities = []
+        relationships = []
+        for record in self.split_records(text):
+            kind, parsed = self.parse_attributes(self.split_attributes(record), source_id)
+            if kind == "entity":
+                entities.append(parsed)
+            elif kind == "relationship":
+                relationships.append(parsed)
+        return entities, relationships
@@ -0,0 +1,3 @@
+python3 -m benchmarks.bench_pipeline --corpus examples
+python3 -m benchmarks.bench_pipeline --corpus synthetic --num-docs 200 --latency lognormal --latency-mean 0.05 \
+                                     --output cache/benchmark.json
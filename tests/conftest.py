@@ -0,0 +1,2 @@
+# graphgen.utils can only be imported once graphgen.models is, load them in that order for all tests
+import graphgen.models  # noqa: F401 pylint: disable=unused-import
@@ -0,0 +1,64 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from graphgen.models import Token
+from graphgen.utils import yes_no_loss_entropy, yes_no_losses_entropy, pack_yes_no_judgements
+
+
+# yes_no_loss_entropy before it was computed with NumPy, kept as the reference
+def _old_yes_no_loss_entropy(tokens_list: list, ground_truth: list) -> float:
+    losses = []
+    for i, tokens in enumerate(tokens_list):
+        token = tokens[0]
+        assert token.text.lower() in ["yes", "no"]
+        if token.text == ground_truth[i]:
+            losses.append(-math.log(token.prob))
+        else:
+            losses.append(-math.log(1 - token.prob))
+    return sum(losses) / len(losses)
+
+
+def _judgements(rng: random.Random, count: int) -> tuple:
+    tokens_list = [[Token(rng.choice(["yes", "no", "Yes"]), rng.uniform(0.01, 0.99))] for _ in range(count)]
+    ground_truth = [rng.choice(["yes", "no"]) for _ in range(count)]
+    return tokens_list, ground_truth
+
+
+def test_losses_match_old_loss():
+    rng = random.Random(0)
+    elements = [_judgements(rng, rng.randint(1, 6)) for _ in range(500)]
+    losses = yes_no_losses_entropy(*pack_yes_no_judgements([e[0] for e in elements], [e[1] for e in elements]))
+    expected = [_old_yes_no_loss_entropy(*element) for element in elements]
+    np.testing.assert_allclose(losses, expected, rtol=1e-12)
+    for element, loss in zip(elements, expected):
+        assert yes_no_loss_entropy(*element) == pytest.approx(loss, rel=1e-12)
+
+
+def test_invalid_elements_are_nan():
+    rng = random.Random(1)
+    valid = _judgements(rng, 3)
+    not_yes_no = ([[Token("maybe", 0.6)], [Token("yes", 0.7)]], ["yes", "yes"])
+    certain_and_wrong = ([[Token("yes", 1.0)]], ["no"])
+    losses = yes_no_losses_entropy(*pack_yes_no_judgements(
+        [valid[0], not_yes_no[0], [], certain_and_wrong[0]],
+        [valid[1], not_yes_no[1], [], certain_and_wrong[1]]
+    ))
+    assert losses[0] == pytest.approx(_old_yes_no_loss_entropy(*valid), rel=1e-12)
+    assert np.isnan(losses[1:]).all()
+    with pytest.raises(ValueError):
+        yes_no_loss_entropy(*not_yes_no)
+
+
+def test_empty_and_unmatched_judgements_are_nan():
+    rng = random.Random(2)
+    valid = _judgements(rng, 3)
+    empty_judgement = ([[Token("yes", 0.7)], []], ["yes", "no"])
+    missing_ground_truth = ([[Token("yes", 0.7)], [Token("no", 0.8)]], ["yes"])
+    missing_judgement = ([[Token("yes", 0.7)]], ["yes", "no"])
+    elements = [valid, empty_judgement, missing_ground_truth, missing_judgement]
+    losses = yes_no_losses_entropy(*pack_yes_no_judgements([e[0] for e in elements], [e[1] for e in elements]))
+    assert losses[0] == pytest.approx(_old_yes_no_loss_entropy(*valid), rel=1e-12)
+    assert np.isnan(losses[1:]).all()
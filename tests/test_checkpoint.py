@@ -0,0 +1,82 @@
+import asyncio
+
+from graphgen.models import Checkpoint, LogKVStorage
+from graphgen.models.storage.base_storage import StorageNameSpace
+from graphgen.generate import find_latest_unique_id
+
+
+class _FlushCounter(StorageNameSpace):
+    def __init__(self):
+        super().__init__(working_dir=None, namespace="counter")
+        self.flushes = 0
+
+    async def index_done_callback(self):
+        self.flushes += 1
+
+
+def test_saved_units_are_reloaded_after_a_flush(tmp_path):
+    working_dir = str(tmp_path)
+
+    async def _interrupted_run():
+        checkpoint = Checkpoint(LogKVStorage(working_dir, namespace="checkpoint"), interval=3600, prefix="extract-")
+        await checkpoint.save("chunk-1", {"nodes": {"A": []}})
+        await checkpoint.flush()
+        # not flushed yet when the run is interrupted
+        await checkpoint.save("chunk-2", {"nodes": {"B": []}})
+
+    async def _resumed_run():
+        checkpoint = Checkpoint(LogKVStorage(working_dir, namespace="checkpoint"), prefix="extract-")
+        return await checkpoint.load("chunk-1"), await checkpoint.load("chunk-2")
+
+    asyncio.run(_interrupted_run())
+    assert asyncio.run(_resumed_run()) == ({"nodes": {"A": []}}, None)
+
+
+def test_flush_storages_are_flushed_every_interval(tmp_path):
+    counter = _FlushCounter()
+
+    async def _run(interval: float):
+        checkpoint = Checkpoint(LogKVStorage(str(tmp_path), namespace="checkpoint"), flush_storages=[counter],
+                                interval=interval)
+        for i in range(3):
+            await checkpoint.save(str(i), i)
+
+    asyncio.run(_run(3600))
+    assert counter.flushes == 0
+    asyncio.run(_run(0))
+    assert counter.flushes == 3
+
+
+def test_without_storage_nothing_is_saved():
+    counter = _FlushCounter()
+
+    async def _run():
+        checkpoint = Checkpoint(flush_storages=[counter], interval=0)
+        await checkpoint.save("chunk-1", {"nodes": {}})
+        await checkpoint.clear()
+        return await checkpoint.load("chunk-1")
+
+    assert asyncio.run(_run()) is None
+    assert counter.flushes == 1
+
+
+def test_clear_deletes_only_its_own_units(tmp_path):
+    working_dir = str(tmp_path)
+
+    async def _run():
+        storage = LogKVStorage(working_dir, namespace="checkpoint")
+        extract = Checkpoint(storage, prefix="extract-")
+        traverse = Checkpoint(storage, prefix="traverse-1-")
+        await extract.save("chunk-1", 1)
+        await traverse.save("batch-1", 2)
+        await extract.clear()
+
+    asyncio.run(_run())
+    assert sorted(asyncio.run(LogKVStorage(working_dir, namespace="checkpoint").all_keys())) == ["traverse-1-batch-1"]
+
+
+def test_resume_finds_the_latest_run(tmp_path):
+    assert find_latest_unique_id(str(tmp_path)) is None
+    for name in ["1700000000", "1700000500", "logs"]:
+        (tmp_path / "data" / "graphgen" / name).mkdir(parents=True)
+    assert find_latest_unique_id(str(tmp_path)) == 1700000500
@@ -0,0 +1,78 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from graphgen.models import OpenAIModel, CompletionsJudgeModel, JsonKVStorage
+from graphgen.operators.judge import judge_single_statement
+from benchmarks.mock_llm_server import MockLLMServer
+
+
+@pytest.fixture(name="server")
+def fixture_server():
+    with MockLLMServer() as server:
+        yield server
+
+
+def test_completions_judge_batches_statements(server):
+    prompts = [f"Is statement {i} true? Answer yes or no." for i in range(600)]
+
+    async def _run():
+        chat = OpenAIModel(model_name="mock", api_key="mock", base_url=server.url)
+        expected = await asyncio.gather(*[chat.generate_topk_per_token(p) for p in prompts[:50]])
+        server.request_count = 0
+        judge = CompletionsJudgeModel(model_name="mock", api_key="mock", base_url=server.url, max_batch_size=256)
+        judged = await asyncio.gather(*[judge.generate_topk_per_token(p) for p in prompts])
+        return expected, judged
+
+    expected, judged = asyncio.run(_run())
+    assert server.request_count == 3
+    assert len(judged) == len(prompts)
+    for chat_tokens, judge_tokens in zip(expected, judged):
+        assert judge_tokens[0].text == chat_tokens[0].text
+        assert judge_tokens[0].prob == pytest.approx(chat_tokens[0].prob)
+        assert [t.text for t in judge_tokens[0].top_candidates] == [t.text for t in chat_tokens[0].top_candidates]
+
+
+def test_judgements_are_cached_per_backend_and_prompt_template(server, tmp_path):
+    statement = "Rice is a cereal grain."
+
+    async def _run():
+        cache = JsonKVStorage(str(tmp_path), namespace="judgement")
+        judges = [
+            OpenAIModel(model_name="mock", api_key="mock", base_url=server.url),
+            CompletionsJudgeModel(model_name="mock", api_key="mock", base_url=server.url),
+            CompletionsJudgeModel(model_name="mock", api_key="mock", base_url=server.url,
+                                  prompt_template="<|user|>{text}<|assistant|>"),
+        ]
+        for judge in judges + judges:
+            await judge_single_statement(judge, statement, cache)
+
+    asyncio.run(_run())
+    assert server.request_count == 3
+
+
+def test_malformed_choices_fail_only_their_own_prompt():
+    async def _create(prompt, **kwargs): # pylint: disable=unused-argument
+        well_formed = SimpleNamespace(index=0, logprobs=SimpleNamespace(
+            tokens=[" yes"], token_logprobs=[-0.1], top_logprobs=[{" yes": -0.1, " no": -2.4}]
+        ))
+        without_logprobs = SimpleNamespace(index=1, logprobs=None)
+        without_top_logprobs = SimpleNamespace(index=2, logprobs=SimpleNamespace(
+            tokens=[" no"], token_logprobs=[-0.2], top_logprobs=[]
+        ))
+        return SimpleNamespace(choices=[well_formed, without_logprobs, without_top_logprobs], usage=None)
+
+    judge = CompletionsJudgeModel(model_name="mock", api_key="mock", max_batch_size=3)
+    judge.client = SimpleNamespace(completions=SimpleNamespace(create=_create))
+
+    async def _run():
+        return await asyncio.wait_for(asyncio.gather(
+            *[judge.generate_topk_per_token(f"statement {i}") for i in range(3)], return_exceptions=True
+        ), timeout=5)
+
+    well_formed, without_logprobs, without_top_logprobs = asyncio.run(_run())
+    assert well_formed[0].text == "yes"
+    assert [t.text for t in well_formed[0].top_candidates] == ["yes", "no"]
+    assert isinstance(without_logprobs, ValueError)
+    assert without_top_logprobs[0].text == "no" and not without_top_logprobs[0].top_candidates
@@ -0,0 +1,83 @@
+import asyncio
+import functools
+import time
+
+from openai import AsyncOpenAI
+from tenacity import wait_none
+
+from graphgen.models import OpenAIModel, EndpointPool, Endpoint
+from benchmarks.mock_llm_server import MockLLMServer, LatencyModel
+
+
+def _pool(servers: list, **kwargs) -> EndpointPool:
+    # the clients do not retry on their own, so every failure reaches the pool
+    return EndpointPool([
+        Endpoint(base_url=server.url, api_key="mock",
+                 client=AsyncOpenAI(api_key="mock", base_url=server.url, max_retries=0))
+        for server in servers
+    ], **kwargs)
+
+
+def _model(pool: EndpointPool) -> OpenAIModel:
+    model = OpenAIModel(model_name="mock", endpoint_pool=pool)
+    # retry at once instead of backing off for seconds
+    model._create_completion = functools.partial( # pylint: disable=protected-access
+        OpenAIModel._create_completion.retry_with(wait=wait_none()), model # pylint: disable=protected-access
+    )
+    return model
+
+
+def test_least_outstanding_spreads_concurrent_requests():
+    with MockLLMServer(latency=LatencyModel(mean=0.05)) as first, \
+            MockLLMServer(latency=LatencyModel(mean=0.05)) as second:
+        model = _model(_pool([first, second]))
+
+        async def _run():
+            await asyncio.gather(*[model.generate_answer(f"question {i}") for i in range(20)])
+
+        asyncio.run(_run())
+        assert first.request_count == second.request_count == 10
+
+
+def test_latency_strategy_prefers_the_faster_endpoint():
+    with MockLLMServer(latency=LatencyModel(mean=0.2)) as slow, MockLLMServer() as fast:
+        model = _model(_pool([slow, fast], strategy="latency"))
+
+        async def _run():
+            for i in range(10):
+                await model.generate_answer(f"question {i}")
+
+        asyncio.run(_run())
+        # only the first request goes to the slow endpoint, before its latency is known
+        assert slow.request_count == 1
+        assert fast.request_count == 9
+
+
+def test_failing_endpoint_is_ejected_and_requests_fail_over():
+    with MockLLMServer(error_status=500) as failing, MockLLMServer() as healthy:
+        pool = _pool([failing, healthy], max_failures=2, eject_seconds=60)
+        model = _model(pool)
+
+        async def _run():
+            return [await model.generate_answer(f"question {i}") for i in range(5)]
+
+        answers = asyncio.run(_run())
+        assert all(answers)
+        assert failing.request_count == 2
+        assert healthy.request_count == 5
+        assert [stats["ejected"] for stats in pool.stats] == [True, False]
+        assert [stats["requests"] for stats in pool.stats] == [0, 5]
+
+
+def test_ejected_endpoint_recovers():
+    pool = EndpointPool([Endpoint(base_url=f"http://mock-{i}/v1", api_key="mock") for i in range(2)])
+    first, second = pool.endpoints
+    first.ejected_until = time.monotonic() + 60
+    second.outstanding = 5
+    assert pool.pick() is second
+    first.ejected_until = time.monotonic() - 1
+    assert pool.pick() is first
+    # with every endpoint ejected, the one that recovers first is used
+    first.ejected_until = time.monotonic() + 60
+    second.ejected_until = time.monotonic() + 30
+    assert pool.pick() is second
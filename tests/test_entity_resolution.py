@@ -0,0 +1,110 @@
+import asyncio
+
+import numpy as np
+
+from graphgen.models import NetworkXStorage, JsonKVStorage, ResolutionStrategy
+from graphgen.models.embed.embedding import EmbeddingFunc, hashing_embedding, local_embedding_func
+from graphgen.models.embed.similarity_index import HyperplaneIndex
+from graphgen.operators.resolve_entities import resolve_entities
+
+
+def _entity(name: str, description: str, chunk_id: str = "chunk-1") -> dict:
+    return {"entity_name": name, "entity_type": "PERSON", "description": description, "source_id": chunk_id}
+
+
+def _relation(src_id: str, tgt_id: str, description: str) -> dict:
+    return {"src_id": src_id, "tgt_id": tgt_id, "description": description, "source_id": "chunk-1"}
+
+
+def test_index_finds_the_brute_force_pairs():
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((2000, 64)).astype(np.float32)
+    # 50 near-duplicates of the first vectors
+    duplicates = vectors[:50] + 0.05 * rng.standard_normal((50, 64)).astype(np.float32)
+    vectors = np.concatenate([vectors, duplicates])
+
+    pairs = HyperplaneIndex().similar_pairs(vectors, 0.9)
+
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    i, j = np.nonzero(np.triu(normalized @ normalized.T >= 0.9, k=1))
+    assert len(i) == 50
+    assert sorted(map(tuple, pairs.tolist())) == sorted(zip(i.tolist(), j.tolist()))
+
+
+def test_index_without_pairs():
+    index = HyperplaneIndex()
+    assert index.similar_pairs(np.eye(8), 0.9).shape == (0, 2)
+    assert index.similar_pairs(np.ones((1, 8)), 0.9).shape == (0, 2)
+
+
+def test_near_duplicate_names_are_resolved():
+    nodes = {
+        "BARACK OBAMA": [_entity("BARACK OBAMA", "the 44th president of the united states"),
+                         _entity("BARACK OBAMA", "the 44th president of the united states", "chunk-2")],
+        "BARACK OBAMA.": [_entity("BARACK OBAMA.", "the 44th president of the united states")],
+        "RICE": [_entity("RICE", "a cereal grain grown in paddies")],
+    }
+    edges = {
+        ("BARACK OBAMA.", "RICE"): [_relation("BARACK OBAMA.", "RICE", "obama ate rice")],
+        ("BARACK OBAMA", "BARACK OBAMA."): [_relation("BARACK OBAMA", "BARACK OBAMA.", "same person")],
+    }
+    strategy = ResolutionStrategy(enabled=True, similarity_threshold=0.85, include_graph_nodes=False)
+
+    resolved_nodes, resolved_edges, aliases = asyncio.run(
+        resolve_entities(nodes, edges, local_embedding_func(), strategy)
+    )
+
+    # the most extracted name is kept
+    assert aliases == {"BARACK OBAMA.": "BARACK OBAMA"}
+    assert sorted(resolved_nodes) == ["BARACK OBAMA", "RICE"]
+    assert len(resolved_nodes["BARACK OBAMA"]) == 3
+    assert {dp["entity_name"] for dp in resolved_nodes["BARACK OBAMA"]} == {"BARACK OBAMA"}
+    # the edge between the aliases becomes a self-loop and is dropped
+    assert list(resolved_edges) == [("BARACK OBAMA", "RICE")]
+    assert resolved_edges[("BARACK OBAMA", "RICE")][0]["src_id"] == "BARACK OBAMA"
+
+
+def test_entities_resolve_to_graph_nodes(tmp_path):
+    async def _run():
+        graph = NetworkXStorage(str(tmp_path), namespace="graph")
+        await graph.upsert_node("BARACK OBAMA.", {"description": "the 44th president of the united states",
+                                                  "entity_type": "PERSON"})
+        await graph.upsert_node("BARACK  OBAMA", {"description": "the 44th president of the united states",
+                                                  "entity_type": "PERSON"})
+        nodes = {"BARACK OBAMA": [_entity("BARACK OBAMA", "the 44th president of the united states")]}
+        strategy = ResolutionStrategy(enabled=True, similarity_threshold=0.85)
+        return await resolve_entities(nodes, {}, local_embedding_func(), strategy, graph)
+
+    resolved_nodes, _, aliases = asyncio.run(_run())
+    # a node already in the graph wins, the first by name if several match
+    assert aliases == {"BARACK OBAMA": "BARACK  OBAMA"}
+    assert list(resolved_nodes) == ["BARACK  OBAMA"]
+
+
+def test_graph_node_embeddings_are_cached(tmp_path):
+    embedded = []
+
+    async def _embed(texts: list) -> np.ndarray:
+        embedded.extend(texts)
+        return hashing_embedding(texts)
+
+    embedding_func = EmbeddingFunc(embedding_dim=256, max_token_size=8192, func=_embed, model_name="hashing-256")
+    strategy = ResolutionStrategy(enabled=True, similarity_threshold=0.85)
+    nodes = {"BARACK OBAMA": [_entity("BARACK OBAMA", "the 44th president of the united states")]}
+
+    async def _run():
+        graph = NetworkXStorage(str(tmp_path), namespace="graph")
+        cache = JsonKVStorage(str(tmp_path), namespace="embedding")
+        for i in range(10):
+            await graph.upsert_node(f"NODE {i}", {"description": f"description {i}", "entity_type": "X"})
+        first = await resolve_entities(nodes, {}, embedding_func, strategy, graph, embedding_cache=cache)
+        first_count = len(embedded)
+        await graph.update_node("NODE 3", {"description": "a changed description"})
+        second = await resolve_entities(nodes, {}, embedding_func, strategy, graph, embedding_cache=cache)
+        return first, second, first_count, len(embedded) - first_count
+
+    first, second, first_count, second_count = asyncio.run(_run())
+    # a name and a description per entity, the extracted entity and the changed node only on the second run
+    assert first_count == 2 * 11
+    assert second_count == 2 * 2
+    assert first[2] == second[2] == {}
@@ -0,0 +1,66 @@
+from graphgen.models import Chunk
+from graphgen.templates import KG_EXTRACTION_PROMPT
+from graphgen.operators.extract_kg import pack_chunks, record_chunk_id, batch_extraction_prompt, RECORD_PARSER
+
+
+class _WordTokenizer:
+    # one token per word, so no tokenizer download is needed
+    model_name = "words"
+
+    def count_tokens(self, text: str) -> int:
+        return len(text.split())
+
+
+BATCH = [Chunk(id="chunk-1", content="Rice is a cereal."), Chunk(id="chunk-2", content="Wheat is a cereal.")]
+ALL_CHUNKS = "chunk-1<SEP>chunk-2"
+
+
+def _attributes(*fields: str) -> list:
+    # a record as split_records returns it, without its parentheses
+    delimiter = KG_EXTRACTION_PROMPT["FORMAT"]["tuple_delimiter"]
+    return RECORD_PARSER.split_attributes(delimiter.join(f'"{f}"' for f in fields))
+
+
+def test_tagged_records_belong_to_their_chunk():
+    assert record_chunk_id(_attributes("entity", "WHEAT", "CROP", "a cereal", "C2"), BATCH) == "chunk-2"
+    assert record_chunk_id(_attributes("entity", "RICE", "CROP", "a cereal", "[C1]"), BATCH) == "chunk-1"
+    assert record_chunk_id(_attributes("relationship", "RICE", "WHEAT", "both cereals", "8", "C1"),
+                           BATCH) == "chunk-1"
+
+
+def test_records_without_a_known_tag_belong_to_every_chunk():
+    assert record_chunk_id(_attributes("entity", "RICE", "CROP", "a cereal"), BATCH) == ALL_CHUNKS
+    assert record_chunk_id(_attributes("entity", "RICE", "CROP", "a cereal", "C3"), BATCH) == ALL_CHUNKS
+    assert record_chunk_id(_attributes("relationship", "RICE", "WHEAT", "both cereals", "8"), BATCH) == ALL_CHUNKS
+
+
+def test_only_records_with_five_fields_or_more_have_a_tag():
+    # the description of an untagged entity is its last field, even if it looks like a tag
+    assert record_chunk_id(_attributes("entity", "RICE", "CROP", "C1"), BATCH) == ALL_CHUNKS
+
+
+def test_a_single_chunk_owns_every_record():
+    assert record_chunk_id(_attributes("entity", "RICE", "CROP", "a cereal", "C2"), BATCH[:1]) == "chunk-1"
+
+
+def test_chunks_are_packed_up_to_the_token_budget():
+    tokenizer = _WordTokenizer()
+    chunks = [Chunk(id=f"chunk-{i}", content="one two three four") for i in range(5)]
+    static_tokens = batch_extraction_prompt("English").static_token_count(tokenizer)
+    # four words and the tag of each passage
+    budget = static_tokens + 2 * 5
+
+    assert [[c.id for c in batch] for batch in pack_chunks(chunks, tokenizer, budget)] == \
+        [["chunk-0", "chunk-1"], ["chunk-2", "chunk-3"], ["chunk-4"]]
+    assert [len(batch) for batch in pack_chunks(chunks, tokenizer, budget - 1)] == [1, 1, 1, 1, 1]
+    assert [len(batch) for batch in pack_chunks(chunks, tokenizer, 0)] == [1, 1, 1, 1, 1]
+
+
+def test_languages_and_oversized_chunks_are_packed_apart():
+    tokenizer = _WordTokenizer()
+    chunks = [Chunk(id="en-1", content="Rice is a cereal."), Chunk(id="zh-1", content="水稻是一种谷物。"),
+              Chunk(id="en-2", content="Wheat too."), Chunk(id="en-3", content=" ".join(["word"] * 10000))]
+    static_tokens = batch_extraction_prompt("English").static_token_count(tokenizer)
+    batches = pack_chunks(chunks, tokenizer, static_tokens + 100)
+    # the oversized chunk closes the English batch and gets a batch of its own
+    assert [[c.id for c in batch] for batch in batches] == [["en-1", "en-2"], ["en-3"], ["zh-1"]]
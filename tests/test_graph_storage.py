@@ -0,0 +1,130 @@
+import asyncio
+
+import networkx as nx
+import pytest
+
+from graphgen.models import NetworkXStorage, SQLiteGraphStorage
+from graphgen.models.storage.graph_snapshot import read_snapshot, write_snapshot
+
+
+async def _dirty(storage) -> tuple:
+    nodes = sorted(node_id for node_id, _ in await storage.get_dirty_nodes())
+    edges = sorted(tuple(sorted((src, tgt))) for src, tgt, _ in await storage.get_dirty_edges())
+    return nodes, edges
+
+
+async def _contents(storage) -> tuple:
+    nodes = sorted(await storage.get_all_nodes())
+    edges = sorted((*sorted((src, tgt)), data) for src, tgt, data in await storage.get_all_edges())
+    return nodes, edges
+
+
+OPERATIONS = [
+    ("upsert_node", ("A", {"description": "a", "entity_type": "X"})),
+    ("upsert_node", ("B", {"description": "b", "entity_type": "X"})),
+    ("upsert_edge", ("A", "B", {"description": "a-b"})),
+    # an end node missing from the graph is added without data
+    ("upsert_edge", ("C", "A", {"description": "c-a"})),
+    ("update_node", ("A", {"loss": 0.5})),
+    ("update_edge", ("B", "A", {"loss": 0.3})),
+    ("update_node", ("B", {"loss": 0.1})),
+    # an update that keeps the description keeps the loss
+    ("upsert_node", ("A", {"description": "a", "source_id": "chunk-2"})),
+    # a new description drops it
+    ("upsert_node", ("B", {"description": "b<SEP>more"})),
+    ("upsert_edge", ("A", "B", {"description": "a-b<SEP>more"})),
+    ("update_edge", ("A", "C", {"loss": 0.2})),
+    ("update_node", ("C", {"description": "c", "loss": 0.7})),
+    ("delete_node", ("B",)),
+    ("upsert_edge", ("D", "C", {"description": "d-c"})),
+]
+
+
+def test_sqlite_graph_matches_networkx(tmp_path):
+    async def _run():
+        networkx_storage = NetworkXStorage(str(tmp_path / "networkx"), namespace="graph")
+        sqlite_storage = SQLiteGraphStorage(str(tmp_path / "sqlite"), namespace="graph")
+        for name, args in OPERATIONS:
+            await getattr(networkx_storage, name)(*args)
+            await getattr(sqlite_storage, name)(*args)
+            assert await _contents(networkx_storage) == await _contents(sqlite_storage), (name, args)
+            for node_id, _ in await networkx_storage.get_all_nodes():
+                assert await networkx_storage.node_degree(node_id) == await sqlite_storage.node_degree(node_id)
+        await sqlite_storage.index_done_callback()
+        return await _contents(networkx_storage)
+
+    contents = asyncio.run(_run())
+    reopened = SQLiteGraphStorage(str(tmp_path / "sqlite"), namespace="graph")
+    assert asyncio.run(_contents(reopened)) == contents
+
+
+@pytest.mark.parametrize("storage_class", [NetworkXStorage, SQLiteGraphStorage])
+def test_dirty_sets_after_reopen(tmp_path, storage_class):
+    async def _run():
+        storage = storage_class(str(tmp_path), namespace="graph")
+        for name, args in OPERATIONS:
+            await getattr(storage, name)(*args)
+        dirty = await _dirty(storage)
+        await storage.index_done_callback()
+        return dirty
+
+    dirty = asyncio.run(_run())
+    assert dirty == (["D"], [("C", "D")])
+    assert asyncio.run(_dirty(storage_class(str(tmp_path), namespace="graph"))) == dirty
+
+
+def test_dirty_set_parity(tmp_path):
+    async def _run():
+        networkx_storage = NetworkXStorage(str(tmp_path / "networkx"), namespace="graph")
+        sqlite_storage = SQLiteGraphStorage(str(tmp_path / "sqlite"), namespace="graph")
+        for name, args in OPERATIONS:
+            await getattr(networkx_storage, name)(*args)
+            await getattr(sqlite_storage, name)(*args)
+            assert await _dirty(networkx_storage) == await _dirty(sqlite_storage), (name, args)
+            for node_id, data in await networkx_storage.get_all_nodes():
+                assert await sqlite_storage.get_node(node_id) == data
+
+    asyncio.run(_run())
+
+
+def _sample_graph() -> nx.Graph:
+    graph = nx.Graph()
+    graph.add_node("RICE", entity_type="CROP", description="a cereal <SEP> grown in paddies", loss=0.25)
+    graph.add_node("稻瘟病", entity_type="DISEASE", description="由稻瘟菌引起", length=12)
+    graph.add_node("EMPTY")
+    graph.add_edge("RICE", "稻瘟病", description="rice blast infects rice", loss=1.5, source_id="chunk-1")
+    graph.add_edge("RICE", "EMPTY", weight=3)
+    return graph
+
+
+def test_snapshot_round_trip_matches_graphml(tmp_path):
+    graph = _sample_graph()
+    snapshot_file = tmp_path / "graph.snapshot"
+    graphml_file = tmp_path / "graph.graphml"
+
+    with open(snapshot_file, "wb") as f:
+        write_snapshot(graph, f)
+    with open(snapshot_file, "rb") as f:
+        from_snapshot = read_snapshot(f)
+    nx.write_graphml(graph, graphml_file)
+    from_graphml = nx.read_graphml(graphml_file)
+
+    assert list(from_snapshot.nodes(data=True)) == list(from_graphml.nodes(data=True))
+    assert list(from_snapshot.edges(data=True)) == list(from_graphml.edges(data=True))
+    assert list(from_snapshot.nodes(data=True)) == list(graph.nodes(data=True))
+    assert list(from_snapshot.edges(data=True)) == list(graph.edges(data=True))
+
+
+def test_networkx_storage_migrates_graphml(tmp_path):
+    nx.write_graphml(_sample_graph(), tmp_path / "graph.graphml")
+
+    async def _migrate():
+        storage = NetworkXStorage(str(tmp_path), namespace="graph")
+        await storage.index_done_callback()
+        return await storage.get_graph()
+
+    migrated = asyncio.run(_migrate())
+    assert (tmp_path / "graph.snapshot").exists()
+    reloaded = asyncio.run(NetworkXStorage(str(tmp_path), namespace="graph").get_graph())
+    assert list(reloaded.nodes(data=True)) == list(migrated.nodes(data=True))
+    assert list(reloaded.edges(data=True)) == list(migrated.edges(data=True))
@@ -0,0 +1,48 @@
+import asyncio
+import random
+from collections import Counter
+
+from graphgen.models import JsonKVStorage, Token
+from graphgen.operators.judge import collect_judgements
+from graphgen.templates import STATEMENT_JUDGEMENT_PROMPT
+
+
+class _CountingJudge:
+    model_name = "counting-judge"
+
+    def __init__(self, statements: list):
+        self.prompts = Counter()
+        self._probs = {STATEMENT_JUDGEMENT_PROMPT["TEMPLATE"].format(statement=statement): (i + 1) / 100
+                       for i, statement in enumerate(statements)}
+        self._random = random.Random(0)
+
+    async def generate_topk_per_token(self, text: str, history=None) -> list: # pylint: disable=unused-argument
+        self.prompts[text] += 1
+        # answers arrive out of order
+        await asyncio.sleep(self._random.uniform(0, 0.01))
+        prob = self._probs[text]
+        return [Token("yes", prob, top_candidates=[Token("yes", prob), Token("no", 1 - prob)])]
+
+
+def test_shared_statements_are_judged_once_and_kept_in_order(tmp_path):
+    statements = [f"statement {i}" for i in range(12)]
+    # every description shares statements with the others
+    descriptions = {f"description {d}": [(statements[(d * 3 + i) % 12], "yes") for i in range(6)]
+                    for d in range(4)}
+    trainee = _CountingJudge(statements)
+
+    async def _run():
+        rephrase_storage = JsonKVStorage(str(tmp_path), namespace="rephrase")
+        await rephrase_storage.upsert(descriptions)
+        judgement_cache = JsonKVStorage(str(tmp_path), namespace="judgement")
+        return await asyncio.gather(*[
+            collect_judgements(trainee, rephrase_storage, description, judgement_cache) for description in descriptions
+        ])
+
+    results = asyncio.run(_run())
+    assert set(trainee.prompts.values()) == {1}
+    assert len(trainee.prompts) == len({s for pairs in descriptions.values() for s, _ in pairs})
+    for (judgements, gts), pairs in zip(results, descriptions.values()):
+        assert gts == [gt for _, gt in pairs]
+        assert [judgement[0].prob for judgement in judgements] == \
+            [(statements.index(statement) + 1) / 100 for statement, _ in pairs]
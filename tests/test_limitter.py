@@ -0,0 +1,165 @@
+import asyncio
+
+import pytest
+
+from graphgen.models.llm import limitter
+from graphgen.models.llm.limitter import TokenBucket, TPM, AdaptiveConcurrency
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture(name="clock")
+def fixture_clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(limitter.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(limitter.asyncio, "sleep", clock.sleep)
+    return clock
+
+
+def test_acquire_waits_for_the_deficit(clock):
+    bucket = TokenBucket(rate=10, capacity=100)
+
+    async def _run():
+        await bucket.acquire(80)
+        await bucket.acquire(50)
+
+    asyncio.run(_run())
+    # 20 tokens left, the 30 missing ones take 3 seconds to refill
+    assert clock.sleeps == [pytest.approx(3.0)]
+    assert bucket.tokens == pytest.approx(0.0)
+
+
+def test_settle_refunds_unused_tokens(clock):
+    tpm = TPM(tpm=600, burst=1000)
+
+    async def _run():
+        await tpm.wait(900, silent=True)
+        tpm.settle(900, 150)
+
+    asyncio.run(_run())
+    assert tpm.tokens == pytest.approx(850.0)
+    # a refund never overfills the bucket
+    tpm.settle(500, 0)
+    assert tpm.tokens == pytest.approx(1000.0)
+    assert not clock.sleeps
+
+
+def test_settle_charges_extra_tokens(clock):
+    tpm = TPM(tpm=600, burst=1000)
+
+    async def _run():
+        await tpm.wait(500, silent=True)
+        tpm.settle(500, 1200)
+        # the bucket is 200 tokens in debt, 300 more take 50 seconds at 10 tokens per second
+        await tpm.wait(300, silent=True)
+
+    asyncio.run(_run())
+    assert clock.sleeps == [pytest.approx(50.0)]
+
+
+def test_settle_refunds_only_the_clamped_reservation(clock):
+    tpm = TPM(tpm=600, burst=1000)
+
+    async def _run():
+        # an estimate over the capacity only drains the bucket
+        reserved = await tpm.wait(5000, silent=True)
+        tpm.settle(reserved, 300)
+        return reserved
+
+    assert asyncio.run(_run()) == 1000
+    assert tpm.tokens == pytest.approx(700.0)
+    assert not clock.sleeps
+
+
+def test_refill_is_continuous(clock):
+    bucket = TokenBucket(rate=10, capacity=100)
+
+    async def _run():
+        await bucket.acquire(100)
+        clock.now += 2.5
+        await bucket.acquire(25)
+
+    asyncio.run(_run())
+    assert not clock.sleeps
+    assert bucket.tokens == pytest.approx(0.0)
+
+
+def test_adaptive_concurrency_grows_at_steady_latency():
+    concurrency = AdaptiveConcurrency(initial=16)
+
+    async def _run():
+        for _ in range(1000):
+            await concurrency.acquire()
+            await concurrency.release(1.0, tokens=100)
+
+    asyncio.run(_run())
+    assert concurrency.limit > 16
+    assert concurrency.in_flight == 0
+
+
+def test_adaptive_concurrency_ignores_request_mix():
+    concurrency = AdaptiveConcurrency(initial=16)
+
+    async def _run():
+        for i in range(3000):
+            await concurrency.acquire()
+            if i % 3:
+                await concurrency.release(0.5, tokens=1)
+            else:
+                await concurrency.release(10.0, tokens=1000)
+
+    asyncio.run(_run())
+    assert concurrency.limit > 16
+
+
+def test_adaptive_concurrency_caps_in_flight_requests():
+    concurrency = AdaptiveConcurrency(initial=4, max_limit=4)
+    peak = 0
+
+    async def _request():
+        nonlocal peak
+        await concurrency.acquire()
+        peak = max(peak, concurrency.in_flight)
+        await asyncio.sleep(0)
+        await concurrency.release(0.1)
+
+    async def _run():
+        await asyncio.gather(*[_request() for _ in range(50)])
+
+    asyncio.run(_run())
+    assert peak == 4
+
+
+def test_adaptive_concurrency_backs_off_on_overload():
+    concurrency = AdaptiveConcurrency(initial=16, min_limit=2)
+
+    async def _run():
+        await concurrency.acquire()
+        await concurrency.release(1.0, overloaded=True)
+
+    asyncio.run(_run())
+    assert int(concurrency.limit) == 8
+
+
+def test_adaptive_concurrency_keeps_the_limit_on_other_failures():
+    concurrency = AdaptiveConcurrency(initial=4)
+
+    async def _run():
+        for _ in range(20):
+            await concurrency.acquire()
+            await concurrency.release(1.0, failed=True)
+
+    asyncio.run(_run())
+    assert concurrency.limit == 4
+    assert concurrency.in_flight == 0
@@ -0,0 +1,113 @@
+import asyncio
+
+import httpx
+import pytest
+from openai import APIConnectionError
+from tenacity import wait_none
+
+from graphgen.models import LLMCache, OpenAIModel
+from graphgen.models.llm import llm_cache
+from benchmarks.mock_llm_server import MockLLMServer
+
+
+@pytest.fixture(name="server")
+def fixture_server():
+    with MockLLMServer() as server:
+        yield server
+
+
+def test_entries_persist_in_lru_order(tmp_path):
+    async def _run():
+        cache = LLMCache(str(tmp_path), max_entries=2)
+        cache.set(cache.make_key("model", "first"), "answer 1")
+        cache.set(cache.make_key("model", "second"), "answer 2")
+        # a hit makes the first entry the most recently used one
+        assert cache.get(cache.make_key("model", "first")) == "answer 1"
+        cache.set(cache.make_key("model", "third"), "answer 3")
+        await cache.index_done_callback()
+        return cache.stats
+
+    stats = asyncio.run(_run())
+    assert stats == {"entries": 2, "hits": 1, "misses": 0, "hit_rate": 1.0}
+    cache = LLMCache(str(tmp_path))
+    assert cache.get(cache.make_key("model", "first")) == "answer 1"
+    assert cache.get(cache.make_key("model", "second")) is None
+    assert cache.get(cache.make_key("model", "third")) == "answer 3"
+
+
+def test_sampled_requests_are_keyed_by_occurrence(tmp_path):
+    cache = LLMCache(str(tmp_path))
+    greedy = [cache.make_key("model", "hello") for _ in range(2)]
+    sampled = [cache.make_key("model", "hello", sampled=True) for _ in range(2)]
+    assert greedy[0] == greedy[1]
+    assert sampled[0] != sampled[1]
+    # a new run numbers the occurrences from the start again
+    assert LLMCache(str(tmp_path)).make_key("model", "hello", sampled=True) == sampled[0]
+
+
+def test_replay_raises_on_miss(tmp_path):
+    async def _record():
+        cache = LLMCache(str(tmp_path))
+        cache.set(cache.make_key("model", "hello"), "answer")
+        await cache.index_done_callback()
+
+    asyncio.run(_record())
+    cache = LLMCache(str(tmp_path), replay=True)
+    assert cache.get(cache.make_key("model", "hello")) == "answer"
+    # replay never writes
+    cache.set(cache.make_key("model", "new"), "answer")
+    with pytest.raises(LookupError):
+        cache.get(cache.make_key("model", "new"))
+
+
+def test_hits_do_not_rewrite_the_cache(tmp_path, monkeypatch):
+    writes = []
+    monkeypatch.setattr(llm_cache, "write_json", lambda data, file_name: writes.append(dict(data)))
+
+    async def _run():
+        cache = LLMCache(str(tmp_path))
+        cache.set(cache.make_key("model", "first"), "answer 1")
+        cache.set(cache.make_key("model", "second"), "answer 2")
+        await cache.index_done_callback()
+        assert cache.get(cache.make_key("model", "first")) == "answer 1"
+        await cache.index_done_callback()
+        assert len(writes) == 1
+        # the order of the hits is written with the next new entry
+        cache.set(cache.make_key("model", "third"), "answer 3")
+        await cache.index_done_callback()
+
+    asyncio.run(_run())
+    assert len(writes) == 2
+    assert list(writes[1].values()) == ["answer 2", "answer 1", "answer 3"]
+
+
+def test_sampled_requests_replay_after_retry(tmp_path, server, monkeypatch):
+    # retry at once instead of waiting seconds
+    monkeypatch.setattr(OpenAIModel._create_completion.retry, "wait", wait_none()) # pylint: disable=protected-access
+
+    async def _record():
+        cache = LLMCache(str(tmp_path))
+        model = OpenAIModel(model_name="mock", api_key="mock", base_url=server.url, cache=cache)
+        create = model.client.chat.completions.create
+        failures = [APIConnectionError(request=httpx.Request("POST", server.url))]
+
+        async def _flaky_create(**kwargs):
+            if failures:
+                raise failures.pop()
+            return await create(**kwargs)
+
+        model.client.chat.completions.create = _flaky_create
+        answers = [await model.generate_answer("hello", temperature=1) for _ in range(2)]
+        await cache.index_done_callback()
+        return answers
+
+    async def _replay():
+        cache = LLMCache(str(tmp_path), replay=True)
+        model = OpenAIModel(model_name="mock", api_key="mock", base_url=server.url, cache=cache)
+        answers = [await model.generate_answer("hello", temperature=1) for _ in range(2)]
+        return answers, cache.stats
+
+    recorded = asyncio.run(_record())
+    replayed, stats = asyncio.run(_replay())
+    assert replayed == recorded
+    assert stats["misses"] == 0
@@ -0,0 +1,118 @@
+import os
+import json
+import asyncio
+
+from graphgen.models import LogKVStorage
+
+
+def _log_file(working_dir: str, namespace: str = "kv") -> str:
+    return os.path.join(working_dir, f"{namespace}.log")
+
+
+def _write_records(file_name: str, records: list):
+    with open(file_name, "ab") as f:
+        for key, value in records:
+            f.write((json.dumps(key) + "\t" + json.dumps(value) + "\n").encode("utf-8"))
+
+
+def test_reopen(tmp_path):
+    working_dir = str(tmp_path)
+
+    async def _write():
+        storage = LogKVStorage(working_dir, namespace="kv")
+        await storage.upsert({"a": {"content": "alpha"}, "b": {"content": "β"}})
+        # pending records are readable before they are flushed
+        assert await storage.get_by_id("a") == {"content": "alpha"}
+        await storage.index_done_callback()
+        await storage.upsert({"c": {"content": "gamma"}})
+        await storage.index_done_callback()
+
+    async def _read():
+        storage = LogKVStorage(working_dir, namespace="kv")
+        assert sorted(await storage.all_keys()) == ["a", "b", "c"]
+        assert await storage.get_by_ids(["b", "x", "c"]) == [{"content": "β"}, None, {"content": "gamma"}]
+        assert await storage.filter_keys(["a", "x"]) == {"x"}
+        # upserts only add new keys, like JsonKVStorage
+        assert await storage.upsert({"a": {"content": "other"}, "d": {"content": "delta"}}) == {
+            "d": {"content": "delta"}
+        }
+        assert await storage.get_by_id("a") == {"content": "alpha"}
+
+    asyncio.run(_write())
+    asyncio.run(_read())
+
+
+def test_torn_tail_is_truncated(tmp_path):
+    working_dir = str(tmp_path)
+
+    async def _write():
+        storage = LogKVStorage(working_dir, namespace="kv")
+        await storage.upsert({"a": {"content": "alpha"}, "b": {"content": "beta"}})
+        await storage.index_done_callback()
+
+    asyncio.run(_write())
+    file_name = _log_file(working_dir)
+    valid_size = os.path.getsize(file_name)
+    with open(file_name, "ab") as f:
+        f.write(b'"c"\t{"content": "gam')
+
+    async def _reopen():
+        storage = LogKVStorage(working_dir, namespace="kv")
+        assert os.path.getsize(file_name) == valid_size
+        assert sorted(await storage.all_keys()) == ["a", "b"]
+        await storage.upsert({"c": {"content": "gamma"}})
+        await storage.index_done_callback()
+
+    asyncio.run(_reopen())
+    storage = LogKVStorage(working_dir, namespace="kv")
+    assert storage.data == {"a": {"content": "alpha"}, "b": {"content": "beta"}, "c": {"content": "gamma"}}
+
+
+def test_delete_and_compaction(tmp_path):
+    working_dir = str(tmp_path)
+    file_name = _log_file(working_dir)
+
+    async def _run():
+        storage = LogKVStorage(working_dir, namespace="kv", compact_ratio=0.5)
+        await storage.upsert({"a": {"v": 1}, "b": {"v": 1}, "c": {"v": 1}})
+        await storage.index_done_callback()
+        await storage.delete(["a", "b"])
+        assert sorted(await storage.all_keys()) == ["c"]
+        assert await storage.filter_keys(["a", "c"]) == {"a"}
+        # a deleted key can be inserted again
+        await storage.upsert({"a": {"v": 2}})
+        # a key deleted before it is flushed leaves no record
+        await storage.upsert({"d": {"v": 1}})
+        await storage.delete(["d"])
+        # 2 live records of 5, the log is compacted
+        await storage.index_done_callback()
+        with open(file_name, "rb") as f:
+            assert len(f.readlines()) == 2
+        assert storage.data == {"c": {"v": 1}, "a": {"v": 2}}
+        await storage.delete(["a"])
+        await storage.index_done_callback()
+
+    asyncio.run(_run())
+    with open(file_name, "rb") as f:
+        assert len(f.readlines()) == 1
+    assert LogKVStorage(working_dir, namespace="kv").data == {"c": {"v": 1}}
+
+
+def test_tombstones_on_load(tmp_path):
+    working_dir = str(tmp_path)
+    _write_records(_log_file(working_dir), [("a", {"v": 1}), ("b", {"v": 1}), ("a", None), ("a", {"v": 2})])
+    assert LogKVStorage(working_dir, namespace="kv").data == {"b": {"v": 1}, "a": {"v": 2}}
+
+
+def test_drop(tmp_path):
+    working_dir = str(tmp_path)
+
+    async def _run():
+        storage = LogKVStorage(working_dir, namespace="kv")
+        await storage.upsert({"a": {"v": 1}})
+        await storage.index_done_callback()
+        await storage.drop()
+        assert await storage.all_keys() == []
+
+    asyncio.run(_run())
+    assert LogKVStorage(working_dir, namespace="kv").data == {}
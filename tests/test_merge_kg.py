@@ -0,0 +1,194 @@
+import asyncio
+
+from graphgen.models import NetworkXStorage, JsonKVStorage, OpenAIModel, GleanStrategy, Chunk
+from graphgen.operators.extract_kg import extract_kg
+from graphgen.operators.merge_kg import merge_node, MAX_SUMMARY_TOKENS
+from benchmarks.mock_llm_server import MockLLMServer
+
+
+class _WordTokenizer:
+    # one token per word, so no tokenizer download is needed
+    def count_tokens(self, text: str) -> int:
+        return len(text.split())
+
+    def encode_string(self, text: str) -> list:
+        return text.split()
+
+    def decode_tokens(self, tokens: list) -> str:
+        return " ".join(tokens)
+
+
+class _SummaryModel:
+    model_name = "mock-summarizer"
+
+    def __init__(self):
+        self.prompts = []
+
+    async def generate_answer(self, text: str, history=None, **extra) -> str: # pylint: disable=unused-argument
+        self.prompts.append(text)
+        return f"summary {len(self.prompts)}"
+
+
+def _records(name: str, descriptions: list, chunk_id: str = "chunk-1") -> list:
+    return [{"entity_name": name, "entity_type": "CROP", "description": d, "source_id": chunk_id}
+            for d in descriptions]
+
+
+DESCRIPTIONS = [f"rice is described in detail by sentence number {i} of the text" for i in range(5)]
+
+
+def test_unchanged_descriptions_are_not_summarized_again(tmp_path):
+    llm_client = _SummaryModel()
+
+    async def _run():
+        graph = NetworkXStorage(str(tmp_path), namespace="graph")
+        cache = JsonKVStorage(str(tmp_path), namespace="summary")
+        merged = await merge_node("RICE", _records("RICE", DESCRIPTIONS), graph, llm_client, _WordTokenizer(),
+                                  max_summary_tokens=20, summary_cache=cache)
+        # a later insert mentions the entity with descriptions it was already summarized from
+        again = await merge_node("RICE", _records("RICE", DESCRIPTIONS[:2], "chunk-2"), graph, llm_client,
+                                 _WordTokenizer(), max_summary_tokens=20, summary_cache=cache)
+        return merged, again, await graph.get_node("RICE")
+
+    merged, again, node = asyncio.run(_run())
+    assert len(llm_client.prompts) == 1
+    assert merged["description"] == again["description"] == node["description"] == "summary 1"
+    assert set(node["source_id"].split("<SEP>")) == {"chunk-1", "chunk-2"}
+
+
+def test_summaries_are_reused_across_runs(tmp_path):
+    llm_client = _SummaryModel()
+
+    async def _run(graph_dir: str):
+        graph = NetworkXStorage(graph_dir, namespace="graph")
+        cache = JsonKVStorage(str(tmp_path), namespace="summary")
+        # the description set is the same whatever the order of the records
+        merged = await merge_node("RICE", _records("RICE", DESCRIPTIONS[::-1]), graph, llm_client,
+                                  _WordTokenizer(), max_summary_tokens=20, summary_cache=cache)
+        await cache.index_done_callback()
+        return merged["description"]
+
+    assert asyncio.run(_run(str(tmp_path / "first"))) == "summary 1"
+    assert asyncio.run(_run(str(tmp_path / "second"))) == "summary 1"
+    assert len(llm_client.prompts) == 1
+
+
+def test_summaries_are_not_shared_across_names_limits_or_models(tmp_path):
+    llm_client = _SummaryModel()
+    other_llm_client = _SummaryModel()
+    other_llm_client.model_name = "other-summarizer"
+
+    async def _run():
+        cache = JsonKVStorage(str(tmp_path), namespace="summary")
+        descriptions = []
+        for name, max_summary_tokens, client in [("RICE", 20, llm_client), ("WHEAT", 20, llm_client),
+                                                 ("RICE", 30, llm_client), ("RICE", 20, other_llm_client)]:
+            graph = NetworkXStorage(str(tmp_path / f"{name}-{max_summary_tokens}-{client.model_name}"), "graph")
+            merged = await merge_node(name, _records(name, DESCRIPTIONS), graph, client, _WordTokenizer(),
+                                      max_summary_tokens=max_summary_tokens, summary_cache=cache)
+            descriptions.append(merged["description"])
+        return descriptions
+
+    assert asyncio.run(_run()) == ["summary 1", "summary 2", "summary 3", "summary 1"]
+    assert len(llm_client.prompts) == 3
+    assert len(other_llm_client.prompts) == 1
+
+
+def test_short_descriptions_are_not_summarized(tmp_path):
+    llm_client = _SummaryModel()
+
+    async def _run():
+        graph = NetworkXStorage(str(tmp_path), namespace="graph")
+        return await merge_node("RICE", _records("RICE", DESCRIPTIONS[:2]), graph, llm_client, _WordTokenizer(),
+                                max_summary_tokens=200, summary_cache=JsonKVStorage(str(tmp_path), "summary"))
+
+    merged = asyncio.run(_run())
+    assert not llm_client.prompts
+    assert merged["description"] == "<SEP>".join(DESCRIPTIONS[:2])
+
+
+def test_only_new_or_changed_nodes_are_queued(tmp_path):
+    async def _run():
+        graph = NetworkXStorage(str(tmp_path), namespace="graph")
+        queue = asyncio.Queue()
+        for chunk_id, descriptions in [("chunk-1", DESCRIPTIONS[:1]), ("chunk-2", DESCRIPTIONS[:1]),
+                                       ("chunk-3", DESCRIPTIONS[1:2])]:
+            await merge_node("RICE", _records("RICE", descriptions, chunk_id), graph, _SummaryModel(),
+                             _WordTokenizer(), merged_queue=queue)
+        return [queue.get_nowait() for _ in range(queue.qsize())]
+
+    # the second chunk adds a source but no description, so the node is not quizzed again
+    assert asyncio.run(_run()) == [("node", ("RICE",)), ("node", ("RICE",))]
+
+
+def test_incremental_merge_streams_while_extracting(tmp_path):
+    chunks = [Chunk(id=f"chunk-{i}", content=f"Alpha met Beta in passage {i}.") for i in range(10)]
+
+    async def _run(server: MockLLMServer):
+        graph = NetworkXStorage(str(tmp_path), namespace="graph")
+        llm_client = OpenAIModel(model_name="mock", api_key="mock", base_url=server.url)
+        queue = asyncio.Queue()
+        requests_at_first_item = []
+
+        async def _consume():
+            await queue.get()
+            requests_at_first_item.append(server.request_count)
+
+        consumer = asyncio.create_task(_consume())
+        await extract_kg(llm_client, graph, _WordTokenizer(), chunks, max_concurrent=1, merged_queue=queue,
+                         incremental_merge=True, glean_strategy=GleanStrategy(max_rounds=0))
+        await consumer
+        items = [queue.get_nowait() for _ in range(queue.qsize())]
+        return requests_at_first_item[0], items
+
+    with MockLLMServer() as server:
+        requests_at_first_item, items = asyncio.run(_run(server))
+
+    assert requests_at_first_item < len(chunks)
+    # every chunk adds a description to the node, so it is queued again
+    assert items.count(("node", ('"ALPHA"',))) > 1
+
+
+def test_incremental_merge_summarizes_while_merging(tmp_path):
+    chunks = [Chunk(id=f"chunk-{i}", content=f"Alpha, Beta and Gamma met Delta in passage {i} about Topic{i}.")
+              for i in range(30)]
+
+    async def _run(server_url: str, incremental_merge: bool):
+        graph = NetworkXStorage(str(tmp_path / str(incremental_merge)), namespace="graph")
+        llm_client = OpenAIModel(model_name="mock", api_key="mock", base_url=server_url)
+        await extract_kg(llm_client, graph, _WordTokenizer(), chunks, incremental_merge=incremental_merge,
+                         glean_strategy=GleanStrategy(max_rounds=0))
+        nodes = {node_id: data for node_id, data in await graph.get_all_nodes()}
+        edges = {tuple(sorted((src, tgt))): data for src, tgt, data in await graph.get_all_edges()}
+        return nodes, edges
+
+    with MockLLMServer() as server:
+        batch_nodes, batch_edges = asyncio.run(_run(server.url, False))
+        nodes, edges = asyncio.run(_run(server.url, True))
+
+    assert sorted(nodes) == sorted(batch_nodes)
+    assert sorted(edges) == sorted(batch_edges)
+    for node_id, data in nodes.items():
+        assert set(data["source_id"].split("<SEP>")) == set(batch_nodes[node_id]["source_id"].split("<SEP>"))
+    # descriptions over the limit were summarized by the merge itself, the mock summary is the quoted description list
+    assert nodes['"ALPHA"']["description"].count("['") == 1
+    for data in list(nodes.values()) + list(edges.values()):
+        assert _WordTokenizer().count_tokens(data["description"]) < MAX_SUMMARY_TOKENS
+
+
+def test_gleaning_without_if_loop_stops_when_a_round_adds_nothing(tmp_path):
+    chunks = [Chunk(id="chunk-1", content="Alpha met Beta in a passage.")]
+
+    async def _run(server_url: str):
+        graph = NetworkXStorage(str(tmp_path), namespace="graph")
+        llm_client = OpenAIModel(model_name="mock", api_key="mock", base_url=server_url)
+        # the mock gleaning only repeats records that were already extracted
+        await extract_kg(llm_client, graph, _WordTokenizer(), chunks,
+                         glean_strategy=GleanStrategy(max_rounds=3, ask_if_loop=False, min_new_records=0))
+
+    with MockLLMServer() as server:
+        asyncio.run(_run(server.url))
+        request_count = server.request_count
+
+    # the extraction and one gleaning round
+    assert request_count == 2
@@ -0,0 +1,57 @@
+import random
+
+import pytest
+
+from graphgen.models import MinHashLSH
+from graphgen.models.text.minhash import optimal_bands, tokenize
+
+WORDS = ("rice blast is a fungal disease that infects rice plants and reduces the yield of paddies in "
+         "humid regions where the fungus spreads with wind and water during the growing season").split()
+
+
+def _jaccard(lsh: MinHashLSH, first: str, second: str) -> float:
+    first, second = lsh.shingles(first), lsh.shingles(second)
+    return len(first & second) / len(first | second)
+
+
+def test_near_duplicates_are_folded_into_the_first_text():
+    rng = random.Random(0)
+    document = " ".join(rng.choice(WORDS) for _ in range(300))
+    words = document.split()
+    # one word changed near the end
+    near_duplicate = " ".join(words[:290] + ["drought"] + words[291:])
+    unrelated = " ".join(rng.choice(WORDS) for _ in range(300))
+
+    lsh = MinHashLSH(threshold=0.8)
+    duplicates = lsh.deduplicate({"doc-1": document, "doc-2": unrelated, "doc-3": near_duplicate,
+                                  "doc-4": document})
+
+    assert sorted(duplicates) == ["doc-3", "doc-4"]
+    assert duplicates["doc-4"] == {"kept": "doc-1", "similarity": 1.0}
+    assert duplicates["doc-3"]["kept"] == "doc-1"
+    assert duplicates["doc-3"]["similarity"] == pytest.approx(_jaccard(lsh, document, near_duplicate), abs=0.1)
+
+
+def test_estimated_similarity_follows_jaccard():
+    rng = random.Random(1)
+    lsh = MinHashLSH(num_perm=256, shingle_size=1)
+    for _ in range(20):
+        first = " ".join(rng.sample(WORDS, 20))
+        second = " ".join(rng.sample(WORDS, 20))
+        estimated = float((lsh.signature(first) == lsh.signature(second)).mean())
+        assert estimated == pytest.approx(_jaccard(lsh, first, second), abs=0.15)
+
+
+def test_chinese_text_is_segmented_into_words():
+    tokens = tokenize("稻瘟病是由稻瘟菌引起的水稻病害，会降低水稻产量。")
+    assert "水稻" in tokens
+    assert "，" not in tokens
+    assert tokenize("Rice Blast, a DISEASE.") == ["rice", "blast", "a", "disease"]
+
+
+def test_bands_match_the_threshold():
+    bands, rows = optimal_bands(0.8, 128)
+    assert bands * rows <= 128
+    assert (1 / bands) ** (1 / rows) == pytest.approx(0.8, abs=0.05)
+    with pytest.raises(AssertionError):
+        MinHashLSH(threshold=0)
@@ -0,0 +1,54 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import openai
+
+from graphgen.models import OpenAIModel
+from graphgen.models.llm.limitter import AdaptiveConcurrency
+
+
+def _model(create) -> OpenAIModel:
+    model = OpenAIModel(model_name="mock", api_key="mock", concurrency=AdaptiveConcurrency(initial=4))
+    model.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    return model
+
+
+def test_cancelled_request_frees_its_slot():
+    started = asyncio.Event()
+
+    async def _create(**kwargs): # pylint: disable=unused-argument
+        started.set()
+        await asyncio.sleep(3600)
+
+    model = _model(_create)
+
+    async def _run():
+        request = asyncio.create_task(model.generate_answer("hello"))
+        await started.wait()
+        request.cancel()
+        await asyncio.gather(request, return_exceptions=True)
+
+    asyncio.run(_run())
+    assert model.concurrency.in_flight == 0
+    assert model.concurrency.limit == 4
+
+
+def test_bad_request_does_not_change_the_limit():
+    async def _create(**kwargs): # pylint: disable=unused-argument
+        response = httpx.Response(400, request=httpx.Request("POST", "http://mock/v1/chat/completions"))
+        raise openai.BadRequestError("bad request", response=response, body=None)
+
+    model = _model(_create)
+
+    async def _run():
+        for _ in range(10):
+            try:
+                await model.generate_answer("hello")
+            except openai.BadRequestError:
+                pass
+
+    asyncio.run(_run())
+    assert model.concurrency.in_flight == 0
+    assert model.concurrency.limit == 4
+    assert model.concurrency.overloads == 0
@@ -0,0 +1,52 @@
+import asyncio
+
+from graphgen.models import NetworkXStorage, JsonKVStorage
+from graphgen.operators import pipeline
+from graphgen.operators.pipeline import judge_stage, STOP
+
+
+def _node(description: str) -> dict:
+    return {"entity_type": "CROP", "description": description, "source_id": "chunk-1"}
+
+
+def test_loss_of_a_description_changed_while_judging_is_dropped(tmp_path, monkeypatch):
+    graph = NetworkXStorage(str(tmp_path), namespace="graph")
+
+    async def _judge_description(*args, **kwargs): # pylint: disable=unused-argument
+        # a later chunk merges a new description into the node while the old one is judged
+        await graph.upsert_node("RICE", _node("rice is a cereal<SEP>rice grows in paddies"))
+        return 1.0
+
+    monkeypatch.setattr(pipeline, "judge_description", _judge_description)
+
+    async def _run():
+        await graph.upsert_node("RICE", _node("rice is a cereal"))
+        in_queue = asyncio.Queue()
+        out_queue = asyncio.Queue()
+        for item in [("node", ("RICE",)), STOP]:
+            await in_queue.put(item)
+        await judge_stage(None, graph, JsonKVStorage(str(tmp_path), namespace="rephrase"), in_queue, out_queue)
+        return await graph.get_node("RICE"), [out_queue.get_nowait() for _ in range(out_queue.qsize())]
+
+    node, judged = asyncio.run(_run())
+    assert node["description"] == "rice is a cereal<SEP>rice grows in paddies"
+    assert node.get("loss") is None
+    assert judged == [STOP]
+
+
+def test_loss_of_an_unchanged_description_is_written(tmp_path, monkeypatch):
+    async def _judge_description(*args, **kwargs): # pylint: disable=unused-argument
+        return 1.0
+
+    monkeypatch.setattr(pipeline, "judge_description", _judge_description)
+
+    async def _run():
+        graph = NetworkXStorage(str(tmp_path), namespace="graph")
+        await graph.upsert_node("RICE", _node("rice is a cereal"))
+        in_queue = asyncio.Queue()
+        for item in [("node", ("RICE",)), STOP]:
+            await in_queue.put(item)
+        await judge_stage(None, graph, JsonKVStorage(str(tmp_path), namespace="rephrase"), in_queue)
+        return await graph.get_node("RICE")
+
+    assert asyncio.run(_run())["loss"] == 1.0
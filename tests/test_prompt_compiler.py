@@ -0,0 +1,33 @@
+import pytest
+
+from graphgen.templates import KG_EXTRACTION_PROMPT, KG_SUMMARIZATION_PROMPT, compile_prompt
+from graphgen.operators.extract_kg import extraction_prompt, batch_extraction_prompt
+
+
+@pytest.mark.parametrize("language", ["English", "Chinese"])
+@pytest.mark.parametrize("template_name, compiled", [("TEMPLATE", extraction_prompt),
+                                                     ("BATCH_TEMPLATE", batch_extraction_prompt)])
+def test_extraction_prompts_match_str_format(language, template_name, compiled):
+    input_text = "[C1] Rice {is} a cereal.\n\n[C2] 水稻是一种谷物。"
+    # how the prompt was rendered before it was compiled
+    expected = KG_EXTRACTION_PROMPT[language][template_name].format(
+        **{**KG_EXTRACTION_PROMPT["FORMAT"], "language": language}, input_text=input_text
+    )
+    assert compiled(language).format(input_text=input_text) == expected
+
+
+@pytest.mark.parametrize("language", ["English", "Chinese"])
+def test_summarization_prompts_match_str_format(language):
+    fields = {"entity_name": "RICE", "description_list": ["rice is a cereal", "水稻是一种谷物 {grain}"]}
+    expected = KG_SUMMARIZATION_PROMPT[language]["TEMPLATE"].format(
+        **{**KG_SUMMARIZATION_PROMPT["FORMAT"], "language": language}, **fields
+    )
+    compiled = compile_prompt(KG_SUMMARIZATION_PROMPT[language]["TEMPLATE"],
+                              **{**KG_SUMMARIZATION_PROMPT["FORMAT"], "language": language})
+    assert compiled.format(**fields) == expected
+
+
+def test_compiled_prompts_are_cached():
+    template = KG_EXTRACTION_PROMPT["English"]["TEMPLATE"]
+    assert compile_prompt(template, **KG_EXTRACTION_PROMPT["FORMAT"]) is \
+        compile_prompt(template, **KG_EXTRACTION_PROMPT["FORMAT"])
@@ -0,0 +1,103 @@
+import re
+import html
+import random
+import asyncio
+
+from graphgen.utils import RecordParser, split_string_by_multi_markers
+
+TUPLE_DELIMITER = "<|>"
+RECORD_DELIMITER = "##"
+COMPLETION_DELIMITER = "<|COMPLETE|>"
+
+
+# the parsing of extract_kg and graphgen.utils.format before RecordParser, kept as the reference
+def _old_clean_str(value):
+    if not isinstance(value, str):
+        return value
+    return re.sub(r"[\x00-\x1f\x7f-\x9f]", "", html.unescape(value.strip()))
+
+
+async def _old_handle_single_entity_extraction(record_attributes: list, chunk_key: str):
+    if len(record_attributes) < 4 or record_attributes[0] != '"entity"':
+        return None
+    entity_name = _old_clean_str(record_attributes[1].upper())
+    if not entity_name.strip():
+        return None
+    return {
+        "entity_name": entity_name,
+        "entity_type": _old_clean_str(record_attributes[2].upper()),
+        "description": _old_clean_str(record_attributes[3]),
+        "source_id": chunk_key,
+    }
+
+
+async def _old_handle_single_relationship_extraction(record_attributes: list, chunk_key: str):
+    if len(record_attributes) < 4 or record_attributes[0] != '"relationship"':
+        return None
+    return {
+        "src_id": _old_clean_str(record_attributes[1].upper()),
+        "tgt_id": _old_clean_str(record_attributes[2].upper()),
+        "description": _old_clean_str(record_attributes[3]),
+        "source_id": chunk_key,
+    }
+
+
+async def _old_parse(text: str, chunk_id: str) -> tuple:
+    entities, relationships = [], []
+    for record in split_string_by_multi_markers(text, [RECORD_DELIMITER, COMPLETION_DELIMITER]):
+        record = re.search(r"\((.*)\)", record)
+        if record is None:
+            continue
+        record_attributes = split_string_by_multi_markers(record.group(1), [TUPLE_DELIMITER])
+        entity = await _old_handle_single_entity_extraction(record_attributes, chunk_id)
+        if entity is not None:
+            entities.append(entity)
+            continue
+        relation = await _old_handle_single_relationship_extraction(record_attributes, chunk_id)
+        if relation is not None:
+            relationships.append(relation)
+    return entities, relationships
+
+
+FIELDS = ['"entity"', '"relationship"', '"Rice"', '"稻瘟病"', "grain &amp; seed", "  spaced  ", "", '" "',
+          "ctrl\x07char", "a (nested) field", '"concept"', "(", ")", "multi\nline", "1.5"]
+
+
+def _random_answer(rng: random.Random) -> str:
+    records = []
+    for _ in range(rng.randint(0, 12)):
+        fields = [rng.choice(FIELDS) for _ in range(rng.randint(0, 6))]
+        record = TUPLE_DELIMITER.join(fields)
+        if rng.random() < 0.9:
+            record = f"({record})"
+        records.append(rng.choice(["", " ", "\n"]) + record)
+    answer = rng.choice([RECORD_DELIMITER, "\n" + RECORD_DELIMITER + "\n"]).join(records)
+    if rng.random() < 0.7:
+        answer += COMPLETION_DELIMITER
+    return answer
+
+
+def test_record_parser_matches_old_handlers():
+    parser = RecordParser(TUPLE_DELIMITER, RECORD_DELIMITER, COMPLETION_DELIMITER)
+    rng = random.Random(0)
+    answers = [_random_answer(rng) for _ in range(2000)]
+    answers.append(
+        '("entity"<|>"RICE"<|>"crop"<|>"Rice is a cereal.")##\n'
+        '("relationship"<|>"RICE"<|>"稻瘟病"<|>"Rice blast infects rice."<|>8)##\n'
+        '("entity"<|>" "<|>"crop"<|>"no name")<|COMPLETE|>'
+    )
+    for answer in answers:
+        assert parser.parse(answer, "chunk-1") == asyncio.run(_old_parse(answer, "chunk-1")), answer
+
+
+def test_record_parser_example():
+    parser = RecordParser(TUPLE_DELIMITER, RECORD_DELIMITER, COMPLETION_DELIMITER)
+    entities, relationships = parser.parse(
+        '("entity"<|>"Rice"<|>"crop"<|>"A cereal &amp; staple.")##'
+        '("relationship"<|>"rice"<|>"blast"<|>"Blast infects rice.")<|COMPLETE|>',
+        "chunk-1"
+    )
+    assert entities == [{"entity_name": '"RICE"', "entity_type": '"CROP"', "description": '"A cereal & staple."',
+                         "source_id": "chunk-1"}]
+    assert relationships == [{"src_id": '"RICE"', "tgt_id": '"BLAST"', "description": '"Blast infects rice."',
+                              "source_id": "chunk-1"}]
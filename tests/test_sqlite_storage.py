@@ -0,0 +1,33 @@
+import asyncio
+
+from graphgen.models import SQLiteKVStorage
+
+
+def test_kv_round_trip(tmp_path):
+    working_dir = str(tmp_path)
+
+    async def _write():
+        storage = SQLiteKVStorage(working_dir, namespace="kv")
+        assert await storage.upsert({"a": {"content": "alpha"}, "b": {"content": "β"}}) == {
+            "a": {"content": "alpha"}, "b": {"content": "β"}
+        }
+        # existing keys are not overwritten
+        assert await storage.upsert({"a": {"content": "other"}, "c": {"content": "gamma"}}) == {
+            "c": {"content": "gamma"}
+        }
+        await storage.delete(["b"])
+        await storage.index_done_callback()
+
+    async def _read():
+        storage = SQLiteKVStorage(working_dir, namespace="kv")
+        return (
+            sorted(await storage.all_keys()),
+            await storage.get_by_ids(["a", "b", "c"], fields={"content"}),
+            await storage.filter_keys(["a", "b", "d"])
+        )
+
+    asyncio.run(_write())
+    keys, values, missing = asyncio.run(_read())
+    assert keys == ["a", "c"]
+    assert values == [{"content": "alpha"}, None, {"content": "gamma"}]
+    assert missing == {"b", "d"}
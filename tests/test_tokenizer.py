@@ -0,0 +1,84 @@
+import asyncio
+import random
+
+import pytest
+import tiktoken
+
+from graphgen.graphgen import GraphGen
+from graphgen.models import Tokenizer
+from graphgen.models.llm import tokenizer as tokenizer_module
+from graphgen.utils import compute_content_hash
+
+WORDS = ["rice", "grain", "yield", "水稻", "产量", "drought", "gene", "root", "soil", "nitrogen"]
+
+
+class _WordEncoding:
+    # a tokenizer without batch calls, one token per word
+    def __init__(self):
+        self.vocab = []
+
+    def encode(self, text: str) -> list:
+        tokens = []
+        for word in text.split(" "):
+            if word not in self.vocab:
+                self.vocab.append(word)
+            tokens.append(self.vocab.index(word))
+        return tokens
+
+    def decode(self, tokens: list) -> str:
+        return " ".join(self.vocab[token] for token in tokens)
+
+
+def _byte_encoding():
+    # byte-level BPE without merges, so no encoding download is needed
+    return tiktoken.Encoding("bytes", pat_str=r"\S+|\s+", mergeable_ranks={bytes([i]): i for i in range(256)},
+                             special_tokens={})
+
+
+@pytest.fixture(name="tokenizer_instance", params=[_byte_encoding, _WordEncoding], ids=["tiktoken", "fallback"])
+def fixture_tokenizer_instance(request, monkeypatch):
+    encoding = request.param()
+    monkeypatch.setattr(tokenizer_module, "get_tokenizer", lambda name: encoding)
+    return Tokenizer(model_name=f"test-{request.param.__name__}")
+
+
+def _documents(count: int) -> list:
+    rng = random.Random(0)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(0, 400))) for _ in range(count)]
+
+
+# chunk_by_token_size before documents were chunked in batches, kept as the reference
+def _old_chunk_by_token_size(tokenizer_instance: Tokenizer, content: str, overlap_token_size: int,
+                             max_token_size: int) -> list:
+    tokens = tokenizer_instance.encode_string(content)
+    results = []
+    for index, start in enumerate(range(0, len(tokens), max_token_size - overlap_token_size)):
+        chunk_content = tokenizer_instance.decode_tokens(tokens[start : start + max_token_size])
+        results.append({
+            "tokens": min(max_token_size, len(tokens) - start),
+            "content": chunk_content.strip(),
+            "chunk_order_index": index,
+        })
+    return results
+
+
+def test_chunk_documents_matches_per_document_chunking(tokenizer_instance):
+    documents = _documents(30)
+    expected = [_old_chunk_by_token_size(tokenizer_instance, doc, 16, 128) for doc in documents]
+    assert tokenizer_instance.chunk_documents(documents, 16, 128, num_threads=4) == expected
+    assert [tokenizer_instance.chunk_by_token_size(doc, 16, 128) for doc in documents] == expected
+
+
+def test_batched_chunk_docs_matches_serial_chunking(tokenizer_instance, tmp_path):
+    docs = {f"doc-{i}": {"content": doc} for i, doc in enumerate(_documents(25))}
+    # the chunks of the serial loop that _chunk_docs replaced
+    expected = {}
+    for doc_key, doc in docs.items():
+        for dp in _old_chunk_by_token_size(tokenizer_instance, doc["content"], 16, 128):
+            expected[compute_content_hash(dp["content"], prefix="chunk-")] = {**dp, "full_doc_id": doc_key}
+
+    graph_gen = GraphGen(working_dir=str(tmp_path), tokenizer_instance=tokenizer_instance, chunk_size=128,
+                         chunk_overlap_size=16, chunking_batch_size=7, chunking_threads=4)
+    chunks = asyncio.run(graph_gen._chunk_docs(docs)) # pylint: disable=protected-access
+    assert chunks == expected
+    assert list(chunks) == list(expected)
@@ -35,6 +35,9 @@ def init_graph_gen(config: dict, env: dict) -> GraphGen:
         working_dir=working_dir
     )
 
+    graph_gen.tokenizer_instance = Tokenizer(
+        config.get("tokenizer", "cl100k_base"))
+
     # Set up LLM clients
     graph_gen.synthesizer_llm_client = OpenAIModel(
         model_name=env.get("SYNTHESIZER_MODEL", ""),
@@ -43,6 +46,7 @@ def init_graph_gen(config: dict, env: dict) -> GraphGen:
         request_limit=True,
         rpm= RPM(env.get("RPM", 1000)),
         tpm= TPM(env.get("TPM", 50000)),
+        tokenizer=graph_gen.tokenizer_instance,
     )
 
     graph_gen.trainee_llm_client = OpenAIModel(
@@ -52,11 +56,9 @@ def init_graph_gen(config: dict, env: dict) -> GraphGen:
         request_limit=True,
         rpm= RPM(env.get("RPM", 1000)),
         tpm= TPM(env.get("TPM", 50000)),
+        tokenizer=graph_gen.tokenizer_instance,
     )
 
-    graph_gen.tokenizer_instance = Tokenizer(
-        config.get("tokenizer", "cl100k_base"))
-
     strategy_config = config.get("traverse_strategy", {})
     graph_gen.traverse_strategy = TraverseStrategy(
         qa_form=config.get("qa_form"),